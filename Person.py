@@ -1,15 +1,23 @@
 from random import randint
 import time
+import numpy as np
 
 class MyPerson:
-    tracks = []
+    # Fixed attribute layout and a bounded int16 ring buffer of past
+    # positions, so per-person memory stays constant over long routes.
+    # Attributes (i, x, y, state, dir, done) are read directly. counter.py
+    # tracks with tracking.CentroidTracker; this class is kept for the
+    # legacy loop in bench.py.
+    __slots__ = ('i', 'x', 'y', 'tracks', 'n', 'R', 'G', 'B', 'done', 'state', 'age', 'max_age', 'dir')
+    history = 32
     # mid_start = int(.5*(h/6))
     # mid_end = int(4.5*(h/6))
-    def __init__(self, i, xi, yi, max_age):
+    def __init__(self, i, xi, yi, max_age, history=None):
         self.i = i
         self.x = xi
         self.y = yi
-        self.tracks = []
+        self.tracks = np.empty((history or self.history, 2), np.int16)
+        self.n = 0
         self.R = randint(0,255)
         self.G = randint(0,255)
         self.B = randint(0,255)
@@ -18,51 +26,40 @@ class MyPerson:
         self.age = 0
         self.max_age = max_age
         self.dir = None
-    def getRGB(self):
-        return (self.R,self.G,self.B)
     def getTracks(self):
-        return self.tracks
-    def getId(self):
-        return self.i
-    def getState(self):
-        return self.state
-    def getDir(self):
-        return self.dir
-    def getX(self):
-        return self.x
-    def getY(self):
-        return self.y
+        # Oldest to newest, at most `history` samples
+        size = len(self.tracks)
+        if self.n <= size:
+            return self.tracks[:self.n]
+        head = self.n % size
+        return np.concatenate((self.tracks[head:], self.tracks[:head]))
     def updateCoords(self, xn, yn):
         self.age = 0
-        self.tracks.append([self.x,self.y])
+        self.tracks[self.n % len(self.tracks)] = (self.x, self.y)
+        self.n += 1
         self.x = xn
         self.y = yn
-    def setDone(self):
-        self.done = True
-    def timedOut(self):
-        return self.done
+    def _last_two_y(self):
+        size = len(self.tracks)
+        return self.tracks[(self.n - 1) % size, 1], self.tracks[(self.n - 2) % size, 1]
     def going_UP(self,mid_start,mid_end):
-        if len(self.tracks) >= 2:
-            if self.state == '0':
-                if self.tracks[-1][1] < mid_end and self.tracks[-2][1] >= mid_end: 
-                    state = '1'
-                    self.dir = 'up'
-                    return True
-            else:
-                return False
-        else:
+        if self.n < 2 or self.state != '0':
             return False
+        last, before = self._last_two_y()
+        if last < mid_end and before >= mid_end:
+            self.state = '1'
+            self.dir = 'up'
+            return True
+        return False
     def going_DOWN(self,mid_start,mid_end):
-        if len(self.tracks) >= 2:
-            if self.state == '0':
-                if self.tracks[-1][1] > mid_start and self.tracks[-2][1] <= mid_start: 
-                    state = '1'
-                    self.dir = 'down'
-                    return True
-            else:
-                return False
-        else:
+        if self.n < 2 or self.state != '0':
             return False
+        last, before = self._last_two_y()
+        if last > mid_start and before <= mid_start:
+            self.state = '1'
+            self.dir = 'down'
+            return True
+        return False
     def age_one(self):
         self.age += 1
         if self.age > self.max_age:
@@ -97,19 +94,19 @@ class MultiPerson:
         return self.tracks
 
     def getId(self):
-        return [p.getId() for p in self.persons]
+        return [p.i for p in self.persons]
 
     def getState(self):
-        return [p.getState() for p in self.persons]
+        return [p.state for p in self.persons]
 
     def getDir(self):
-        return [p.getDir() for p in self.persons]
+        return [p.dir for p in self.persons]
 
     def getX(self):
-        return [p.getX() for p in self.persons]
+        return [p.x for p in self.persons]
 
     def getY(self):
-        return [p.getY() for p in self.persons]
+        return [p.y for p in self.persons]
 
     def updateCoords(self, xn, yn):
         self.tracks.append([self.x, self.y])
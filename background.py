@@ -0,0 +1,158 @@
+import time
+import cv2
+
+# Background models BackgroundModel can drive:
+#   mog2    - cv2 MOG2 (the counter's default)
+#   knn     - cv2 KNN, usually cleaner masks at a higher cost per frame
+#   average - running average of the grey frame, thresholded difference
+METHODS = ("mog2", "knn", "average")
+
+STATIC = "static"
+LEARN = "learn"
+RELEARN = "relearn"
+
+
+class BackgroundModel:
+    """
+    Background subtractor wrapper that decides per frame how much to learn.
+
+    Before every frame, a cheap global-motion probe (fraction of pixels that
+    changed against the previous frame, on a small grey copy) picks one of:
+
+        static  - below `static_level`: the model is not run at all and the
+                  previous mask is returned (nothing moved, so it still holds)
+        relearn - above `relearn_level`: a lighting change or camera jump;
+                  the model adapts at `relearn_rate` so it recovers quickly
+        learn   - otherwise: the normal `learning_rate` (-1 = automatic)
+
+    It has the `apply(image, fgmask, learningRate)` signature of an OpenCV
+    subtractor, so it can be passed to ForegroundSegmenter(subtractor=...).
+    Shadow detection, the method and a downscaled model (`scale`) are
+    configurable; the mask always comes back at the input size.
+    """
+
+    def __init__(self, method="mog2", shadows=True, scale=1.0, gate=True, learning_rate=-1,
+                 static_level=0.0001, relearn_level=0.4, relearn_rate=0.05, probe_scale=0.25,
+                 diff_threshold=15, average_threshold=30):
+        """
+        Args:
+            method (str): One of METHODS (default: 'mog2').
+            shadows (bool): Shadow detection for mog2/knn (default: True).
+            scale (float): Run the model on a copy downscaled by this factor (default: 1.0).
+            gate (bool): Choose the learning rate from global motion; False always learns (default: True).
+            learning_rate (float): Rate while people move; -1 lets the model choose (default: -1).
+            static_level (float): Changed-pixel fraction under which a frame is static
+                (default: 0.0001, i.e. no probe pixel changed at 360x360).
+            relearn_level (float): Changed-pixel fraction over which the background is relearnt (default: 0.4).
+            relearn_rate (float): Learning rate used while relearning (default: 0.05).
+            probe_scale (float): Downscale factor of the motion probe (default: 0.25).
+            diff_threshold (int): Grey-level change counted as motion by the probe (default: 15).
+            average_threshold (int): Grey-level difference counted as foreground by 'average' (default: 30).
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown background method: {method} (expected one of {', '.join(METHODS)})")
+        if not 0 < scale <= 1:
+            raise ValueError(f"scale must be in (0, 1], got {scale}")
+        self.method = method
+        self.shadows = shadows
+        self.scale = scale
+        self.gate = gate
+        self.learning_rate = learning_rate
+        self.static_level = static_level
+        self.relearn_level = relearn_level
+        self.relearn_rate = relearn_rate
+        self.probe_scale = probe_scale
+        self.diff_threshold = diff_threshold
+        self.average_threshold = average_threshold
+        if method == "mog2":
+            self.model = cv2.createBackgroundSubtractorMOG2(detectShadows=shadows)
+        elif method == "knn":
+            self.model = cv2.createBackgroundSubtractorKNN(detectShadows=shadows)
+        else:
+            self.model = None
+            self.average = None
+        self.prev = None
+        self.mask = None
+        self.small = None
+        self.small_mask = None
+        self.grey = None
+        self.state = LEARN
+        self.level = 0.0
+        self.counters = {"frames": 0, STATIC: 0, LEARN: 0, RELEARN: 0}
+        self.seconds = 0.0
+
+    def motion(self, image):
+        """Fraction of probe pixels that changed since the previous frame (1.0 for the first)."""
+        small = cv2.resize(image, None, fx=self.probe_scale, fy=self.probe_scale, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        prev, self.prev = self.prev, small
+        if prev is None or prev.shape != small.shape:
+            return 1.0
+        diff = cv2.absdiff(prev, small)
+        cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY, dst=diff)
+        return cv2.countNonZero(diff) / diff.size
+
+    def _average(self, image, rate):
+        if image.ndim == 3:
+            self.grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self.grey)
+            grey = self.grey
+        else:
+            grey = image
+        if self.average is None or self.average.shape != grey.shape:
+            self.average = grey.astype("float32")
+        background = cv2.convertScaleAbs(self.average)
+        mask = cv2.absdiff(grey, background)
+        cv2.threshold(mask, self.average_threshold, 255, cv2.THRESH_BINARY, dst=mask)
+        # Automatic rate: about the same 500-frame memory as MOG2's history
+        cv2.accumulateWeighted(grey, self.average, 0.002 if rate < 0 else rate)
+        return mask
+
+    def _run(self, image, mask, rate):
+        if self.model is None:
+            return self._average(image, rate)
+        # Written into `mask` once it has the right size, so steady state does not allocate
+        return self.model.apply(image, mask, rate)
+
+    def apply(self, image, fgmask=None, learningRate=-1):
+        """
+        Foreground mask of `image` (255 = foreground, 127 = shadow with shadows on).
+
+        `learningRate` is used as the normal rate when it is not -1.
+        """
+        start = time.perf_counter()
+        self.counters["frames"] += 1
+        rate = self.learning_rate if learningRate == -1 else learningRate
+        state = LEARN
+        if self.gate:
+            self.level = self.motion(image)
+            if self.level < self.static_level and self.mask is not None and self.mask.shape == image.shape[:2]:
+                state = STATIC
+            elif self.level > self.relearn_level and self.mask is not None:
+                state = RELEARN
+                rate = self.relearn_rate
+        self.state = state
+        self.counters[state] += 1
+
+        if state != STATIC:
+            if self.scale != 1:
+                h, w = image.shape[:2]
+                size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+                self.small = cv2.resize(image, size, dst=self.small, interpolation=cv2.INTER_AREA)
+                self.small_mask = self._run(self.small, self.small_mask, rate)
+                self.mask = cv2.resize(self.small_mask, (w, h), dst=self.mask, interpolation=cv2.INTER_NEAREST)
+            else:
+                self.mask = self._run(image, self.mask, rate)
+        if fgmask is not None:
+            fgmask[...] = self.mask
+        else:
+            fgmask = self.mask
+        self.seconds += time.perf_counter() - start
+        return fgmask
+
+    def stats(self):
+        frames = self.counters["frames"]
+        out = dict(self.counters)
+        out["ms_per_frame"] = round(1000 * self.seconds / frames, 3) if frames else 0.0
+        out["static_ratio"] = round(self.counters[STATIC] / frames, 3) if frames else 0.0
+        return out
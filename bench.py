@@ -0,0 +1,1686 @@
+##Offline benchmarks for the counting pipeline
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import cv2
+from segmenter import ForegroundSegmenter
+from geometry import CountingGeometry
+
+
+def load_frames(path, limit=0, crop=True):
+    """Decode a video up front so decode cost does not pollute stage timings."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Failed to open video source: {path}")
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame[:, 20:] if crop else frame)
+        if limit and len(frames) >= limit:
+            break
+    cap.release()
+    return frames
+
+
+def report(title, rows):
+    print(title)
+    for row in rows:
+        print("  " + "  ".join(f"{k}={v}" for k, v in row.items()))
+
+
+#################
+#   SEGMENT     #
+#################
+
+def legacy_segment(frames):
+    """The pre-ForegroundSegmenter path: two MOG2 passes and two morphology chains."""
+    fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=True)
+    kernelOp = np.ones((3,3),np.uint8)
+    kernelCl = np.ones((11,11),np.uint8)
+    back = None
+    for frame in frames:
+        fgmask = fgbg.apply(frame)
+        fgmask2 = fgbg.apply(frame)
+        ret, imBin = cv2.threshold(fgmask, 200, 255, cv2.THRESH_BINARY)
+        ret, imBin2 = cv2.threshold(fgmask2, 200, 255, cv2.THRESH_BINARY)
+        mask = cv2.morphologyEx(imBin, cv2.MORPH_OPEN, kernelOp)
+        mask2 = cv2.morphologyEx(imBin2, cv2.MORPH_OPEN, kernelOp)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernelCl)
+        mask2 = cv2.morphologyEx(mask2, cv2.MORPH_CLOSE, kernelCl)
+        if back is None:
+            back = mask
+            continue
+        mask = cv2.absdiff(back, mask)
+        cv2.findContours(mask2, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+
+def single_pass_segment(frames, variant):
+    segmenter = ForegroundSegmenter(variant=variant)
+    for frame in frames:
+        mask = segmenter.apply(frame)
+        cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+
+def bench_segment(args):
+    results = []
+    for path in args.videos:
+        frames = load_frames(path, args.limit)
+        runs = [("legacy", lambda: legacy_segment(frames))]
+        for variant in args.variants:
+            runs.append((f"single-pass/{variant}", lambda v=variant: single_pass_segment(frames, v)))
+        for name, run in runs:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            results.append({"video": path, "path": name, "frames": len(frames),
+                            "fps": round(len(frames) / elapsed, 1)})
+    report("Segmentation + findContours throughput", results)
+    return results
+
+
+#################
+#   PUBLISHER   #
+#################
+
+EVENT_KEYS = ("exited_people", "entered_people", "people_inside")
+
+
+def time_events(send, events, rate=0):
+    """Worst and mean hot-path time of `events` crossing events, 3 keys each, paced at `rate`/s."""
+    latencies = []
+    for n in range(events):
+        start = time.perf_counter()
+        for key in EVENT_KEYS:
+            send(key, n)
+        latencies.append(time.perf_counter() - start)
+        if rate:
+            time.sleep(1.0 / rate)
+    return {"events": events, "mean_ms": round(1000 * sum(latencies) / events, 3),
+            "max_ms": round(1000 * max(latencies), 3)}
+
+
+def bench_publisher(args):
+    from mqtt_standin import StandInBroker
+    from postTelemetry_mqtt_tb import MQTTThingsBoardClient, TelemetryPublisher
+
+    results = []
+    for scenario in ("up", "slow", "down"):
+        broker = StandInBroker(delay=args.slow_delay if scenario == "slow" else 0.0).start()
+        port = broker.port
+        if scenario == "down":
+            broker.stop()
+
+        legacy = MQTTThingsBoardClient()
+        row = time_events(lambda k, v: legacy.send_telemetry("127.0.0.1", port, "bench", k, v,
+                                                             retry_delay=args.retry_delay),
+                          args.legacy_events)
+        legacy.disconnect()
+        results.append(dict(scenario=scenario, path="send_telemetry", **row))
+
+        publisher = TelemetryPublisher("127.0.0.1", port, "bench", flush_interval=args.flush_interval,
+                                       max_queue=args.max_queue, connect_timeout=1).start()
+        row = time_events(publisher.publish, args.events, args.rate)
+        time.sleep(2 * args.flush_interval)
+        publisher.disconnect()
+        stats = publisher.stats()
+        results.append(dict(scenario=scenario, path="TelemetryPublisher", **row,
+                            payloads=stats["payloads"], dropped=stats["dropped"], queued=stats["queued"]))
+        broker.stop()
+    report("Telemetry hot-path cost per crossing event (3 keys)", results)
+    return results
+
+
+def bench_spool(args):
+    import os
+    import tempfile
+    from mqtt_standin import StandInBroker
+    from postTelemetry_mqtt_tb import MQTTThingsBoardClient, TelemetryPublisher
+    from telemetry_spool import TelemetrySpool
+
+    broker = StandInBroker().start()
+    port = broker.port
+    broker.stop()
+    path = os.path.join(tempfile.mkdtemp(), "spool.db")
+    spool = TelemetrySpool(path, max_rows=args.max_rows)
+    publisher = TelemetryPublisher("127.0.0.1", port, "bench", flush_interval=args.flush_interval,
+                                   connect_timeout=1, backoff_max=1.0, client=MQTTThingsBoardClient(spool=spool),
+                                   replay_rate=args.replay_rate, replay_batch=args.replay_batch).start()
+
+    # Offline: one crossing per flush interval for `offline` seconds
+    offline = time_events(publisher.publish, int(args.offline / args.flush_interval), 1.0 / args.flush_interval)
+    spooled = len(spool)
+
+    # Back online: measure how long the spool takes to drain and what the broker received
+    broker = StandInBroker(port=port).start()
+    start = time.perf_counter()
+    deadline = start + args.timeout
+    while len(spool) and time.perf_counter() < deadline:
+        time.sleep(0.1)
+    drain = time.perf_counter() - start
+    publisher.disconnect()
+    replayed = sum(len(p) for p in broker.payloads() if isinstance(p, list))
+    broker.stop()
+    stats = publisher.stats()
+    results = [dict(phase="offline", **offline, spooled_records=spooled, evicted=spool.evicted),
+               {"phase": "replay", "drain_s": round(drain, 2), "records_replayed": replayed,
+                "replay_payloads": sum(isinstance(p, list) for p in broker.payloads()),
+                "left_in_spool": stats["spool_backlog"]}]
+    report("Store-and-forward spool", results)
+    return results
+
+
+#################
+#   TRACKING    #
+#################
+
+def counting_lines(h):
+    geometry = CountingGeometry()
+    geometry.update((h, 1))
+    return geometry.lines
+
+
+def legacy_track(frames_blobs, h, person_cls=None):
+    """The pre-CentroidTracker per-contour loop over the `persons` list, returns (up, down)."""
+    if person_cls is None:
+        import Person
+        person_cls = Person.MyPerson
+    line_up, line_down, up_limit, down_limit = counting_lines(h)
+    persons = []
+    pid = 1
+    cnt_up = cnt_down = 0
+    for blobs in frames_blobs:
+        for cx, cy, w, h_ in blobs:
+            new = True
+            if cy in range(up_limit, down_limit):
+                for i in persons:
+                    if abs(cx-i.x) <= w and abs(cy-i.y) <= h_:
+                        new = False
+                        i.updateCoords(cx,cy)
+                        if i.going_UP(line_down,line_up) == True and i.dir == 'up':
+                            cnt_up += 1
+                        elif i.going_DOWN(line_down,line_up) == True and i.dir == 'down':
+                            cnt_down += 1
+                        break
+                    if i.state == '1':
+                        if i.dir == 'down' and i.y > down_limit:
+                            i.done = True
+                        elif i.dir == 'up' and i.y < up_limit:
+                            i.done = True
+                    if i.done:
+                        index = persons.index(i)
+                        persons.pop(index)
+                        del i
+                if new == True:
+                    persons.append(person_cls(pid,cx,cy,1))
+                    pid += 1
+    return cnt_up, cnt_down
+
+
+def vectorized_track(frames_blobs, h, hungarian=False):
+    import tracking
+    tracker = tracking.CentroidTracker(*counting_lines(h), hungarian=hungarian)
+    cnt_up = cnt_down = 0
+    for blobs in frames_blobs:
+        blobs = np.asarray(blobs, np.int32).reshape(-1, 4)
+        _, events = tracker.update(blobs[:, :2], blobs[:, 2:])
+        for _, direction, _, _ in events:
+            if direction == tracking.UP:
+                cnt_up += 1
+            else:
+                cnt_down += 1
+    return cnt_up, cnt_down
+
+
+def synthetic_blobs(n, frames, h=240, speed=3, size=12):
+    """`n` blobs side by side walking down through the band, wrapping at the bottom."""
+    rng = np.random.default_rng(0)
+    x = (np.arange(n) * (size + 4) + size).astype(int)
+    y = rng.integers(0, h, n)
+    out = []
+    for _ in range(frames):
+        y = (y + speed) % h
+        out.append([(int(cx), int(cy), size, size) for cx, cy in zip(x, y)])
+    return out
+
+
+def video_blobs(path):
+    """(cx, cy, w, h) of every blob above areaTH, per frame, as process_frames sees them."""
+    frames = load_frames(path)
+    h = frames[0].shape[0]
+    areaTH = frames[0].shape[0] * (frames[0].shape[1] + 20) / 300
+    segmenter = ForegroundSegmenter()
+    out = []
+    for frame in frames:
+        contours0, _ = cv2.findContours(segmenter.apply(frame), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        blobs = []
+        for cnt in contours0:
+            if cv2.contourArea(cnt) > areaTH:
+                M = cv2.moments(cnt)
+                x, y, w, h_ = cv2.boundingRect(cnt)
+                blobs.append((int(M['m10']/M['m00']), int(M['m01']/M['m00']), w, h_))
+        out.append(blobs)
+    return out, h
+
+
+class ListPerson:
+    """MyPerson as it was before the ring buffer: unbounded list of [x, y] lists, no __slots__."""
+    def __init__(self, i, xi, yi, max_age):
+        self.i, self.x, self.y, self.max_age = i, xi, yi, max_age
+        self.tracks = []
+        self.done = False
+        self.state = '0'
+        self.age = 0
+        self.dir = None
+    def updateCoords(self, xn, yn):
+        self.age = 0
+        self.tracks.append([self.x,self.y])
+        self.x = xn
+        self.y = yn
+    def going_UP(self,mid_start,mid_end):
+        if len(self.tracks) >= 2 and self.state == '0':
+            if self.tracks[-1][1] < mid_end and self.tracks[-2][1] >= mid_end:
+                self.dir = 'up'
+                return True
+        return False
+    def going_DOWN(self,mid_start,mid_end):
+        if len(self.tracks) >= 2 and self.state == '0':
+            if self.tracks[-1][1] > mid_start and self.tracks[-2][1] <= mid_start:
+                self.dir = 'down'
+                return True
+        return False
+
+
+def bench_person_memory(args):
+    import tracemalloc
+    import Person
+    results = []
+    for path in args.videos:
+        blobs, h = video_blobs(path)
+        # Loop the recording to emulate a long route
+        blobs = blobs * args.repeat
+        for name, cls in (("list", ListPerson), ("ring-buffer", Person.MyPerson)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            legacy_track(blobs, h, person_cls=cls)
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append({"video": path, "frames": len(blobs), "person": name,
+                            "peak_kib": round(peak / 1024, 1), "us_per_frame": round(1e6 * elapsed / len(blobs), 1)})
+    report("MyPerson track-history memory over a full video run (tracemalloc)", results)
+    return results
+
+
+def bench_track(args):
+    paths = [("legacy", legacy_track), ("vectorized", vectorized_track),
+             ("vectorized+hungarian", lambda b, h: vectorized_track(b, h, hungarian=True))]
+    results = []
+    for n in args.blobs:
+        blobs = synthetic_blobs(n, args.frames)
+        for name, run in paths:
+            run(blobs[:5], 240)  # warm-up (imports, first-call overhead)
+            start = time.perf_counter()
+            up, down = run(blobs, 240)
+            elapsed = time.perf_counter() - start
+            results.append({"blobs": n, "path": name, "us_per_frame": round(1e6 * elapsed / args.frames, 1),
+                            "in": down, "out": up})
+    report("Tracking cost vs simultaneous blobs (synthetic)", results)
+
+    counts = []
+    for path in args.videos:
+        blobs, h = video_blobs(path)
+        for name, run in paths:
+            up, down = run(blobs, h)
+            counts.append({"video": path, "path": name, "in": down, "out": up})
+    report("Counts on recorded video", counts)
+    return results + counts
+
+
+class LegacyBoxTracker:
+    """tracker.Tracker before the vectorized rewrite: first match within 35 px wins."""
+    def __init__(self):
+        self.center_points = {}
+        self.id_count = 0
+
+    def update(self, objects_rect):
+        import math
+        objects_bbs_ids = []
+        for rect in objects_rect:
+            x, y, w, h = rect
+            cx = (x + x + w) // 2
+            cy = (y + y + h) // 2
+            same_object_detected = False
+            for id, pt in self.center_points.items():
+                if math.hypot(cx - pt[0], cy - pt[1]) < 35:
+                    self.center_points[id] = (cx, cy)
+                    objects_bbs_ids.append([x, y, w, h, id])
+                    same_object_detected = True
+                    break
+            if same_object_detected is False:
+                self.center_points[self.id_count] = (cx, cy)
+                objects_bbs_ids.append([x, y, w, h, self.id_count])
+                self.id_count += 1
+        self.center_points = {i: self.center_points[i] for *_, i in objects_bbs_ids}
+        return objects_bbs_ids
+
+
+def walker_boxes(frames, every, h=500, w=1020, speed=4, size=60, seed=0):
+    """People entering at the top every `every` frames and walking down out of a w x h frame (x1, y1, x2, y2)."""
+    rng = np.random.default_rng(seed)
+    people = []
+    out = []
+    for f in range(frames):
+        if f % every == 0:
+            people.append([float(rng.integers(size, w - size)), -size / 2])
+        for p in people:
+            p[0] += rng.normal(0, 1)
+            p[1] += speed
+        people = [p for p in people if p[1] < h + size]
+        out.append([(int(x - size / 2), int(y - size), int(x + size / 2), int(y + size)) for x, y in people])
+    return out
+
+
+def yolo_track_loop(frames_boxes, tracker, legacy):
+    """countingYolov8's line logic before (lists, unpruned dicts) and after (sets, pruned on expiry)."""
+    cy1, cy2, offset = 194, 220, 6
+    persondown, personup = {}, {}
+    counter1, counter2 = ([], []) if legacy else (set(), set())
+    downcount = upcount = 0
+    timings = []
+    for boxes in frames_boxes:
+        start = time.perf_counter()
+        for x3, y3, x4, y4, id in tracker.update(boxes):
+            cy = int(y3 + y4) // 2
+            if cy1 < cy + offset and cy1 > cy - offset:
+                persondown[id] = cy
+            if id in persondown and cy2 < cy + offset and cy2 > cy - offset:
+                if legacy:
+                    if counter1.count(id) == 0:
+                        counter1.append(id)
+                elif id not in counter1:
+                    counter1.add(id)
+                    downcount += 1
+            if cy2 < cy + offset and cy2 > cy - offset:
+                personup[id] = cy
+            if id in personup and cy1 < cy + offset and cy1 > cy - offset:
+                if legacy:
+                    if counter2.count(id) == 0:
+                        counter2.append(id)
+                elif id not in counter2:
+                    counter2.add(id)
+                    upcount += 1
+        if legacy:
+            downcount, upcount = len(counter1), len(counter2)
+        else:
+            for id in tracker.expired:
+                persondown.pop(id, None)
+                personup.pop(id, None)
+                counter1.discard(id)
+                counter2.discard(id)
+        timings.append(time.perf_counter() - start)
+    state = len(persondown) + len(personup) + len(counter1) + len(counter2)
+    return downcount, upcount, timings, state
+
+
+def bench_box_tracker(args):
+    from tracker import Tracker
+    paths = [("legacy", lambda: LegacyBoxTracker(), True),
+             ("greedy", lambda: Tracker(max_missed=5, hungarian=False, xyxy=True), False),
+             ("hungarian", lambda: Tracker(max_missed=5, hungarian=True, xyxy=True), False)]
+    results = []
+    for every in args.every:
+        boxes = walker_boxes(args.frames, every)
+        people = len(range(0, args.frames, every))
+        for name, make, legacy in paths:
+            # The legacy path is fed (x1, y1, x2, y2) as an (x, y, w, h) box, like countingYolov8 did
+            down, up, timings, state = yolo_track_loop(boxes, make(), legacy)
+            tenth = max(1, len(timings) // 10)
+            results.append({"spawn_every": every, "in_view": round(sum(map(len, boxes)) / len(boxes), 1),
+                            "path": name, "people": people, "down": down, "up": up,
+                            "first_us": round(1e6 * np.mean(timings[:tenth]), 1),
+                            "last_us": round(1e6 * np.mean(timings[-tenth:]), 1),
+                            "state_entries": state})
+    report(f"countingYolov8 tracking over {args.frames} frames (synthetic walkers)", results)
+    return results
+
+
+#################
+#   IDLE CPU    #
+#################
+
+class PacedSource:
+    """Replays decoded frames no faster than `fps`, blocking like a camera capture call."""
+    def __init__(self, frames, fps):
+        self.frames = frames
+        self.period = 1.0 / fps
+        self.index = 0
+        self.next_time = time.monotonic()
+        self.shape = frames[0].shape
+
+    def capture(self):
+        if self.index >= len(self.frames):
+            return None
+        delay = self.next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_time = max(self.next_time + self.period, time.monotonic())
+        frame = self.frames[self.index]
+        self.index += 1
+        return frame
+
+    def read_into(self, buf):
+        frame = self.capture()
+        if frame is None:
+            return False
+        np.copyto(buf, frame)
+        return True
+
+
+def polling_run(source, capture_in_lock=True):
+    """
+    Reader thread + get_nowait spin + display poll, as counter.py worked before the pipeline.
+
+    The old readers captured while holding their condition, which parks the
+    spinning consumer on the lock; with capture_in_lock=False the wait for the
+    next frame happens outside it (driver-buffered or network cameras) and the
+    consumer spins freely.
+    """
+    import queue
+    import threading
+    q = queue.Queue(maxsize=10)
+    display_q = queue.Queue(maxsize=5)
+    condition = threading.Condition()
+    state = {"running": True, "eof": False}
+
+    def reader():
+        while state["running"]:
+            frame = None if capture_in_lock else source.capture()
+            with condition:
+                while q.full() and state["running"]:
+                    condition.wait()
+                if capture_in_lock:
+                    frame = source.capture()
+                if frame is None:
+                    state["eof"] = True
+                    return
+                q.put(frame)
+                time.sleep(0.005)
+
+    def read():
+        with condition:
+            try:
+                frame = q.get_nowait()
+                condition.notify()
+                return frame
+            except queue.Empty:
+                return None
+
+    def process():
+        segmenter = ForegroundSegmenter()
+        while state["running"]:
+            frame = read()
+            if frame is None:
+                if state["eof"] and q.qsize() == 0:
+                    display_q.put(None)
+                    return
+                continue
+            segmenter.apply(frame)
+            display_q.put(frame)
+
+    threading.Thread(target=reader, daemon=True).start()
+    threading.Thread(target=process, daemon=True).start()
+    while True:
+        try:
+            if display_q.get_nowait() is None:
+                break
+        except queue.Empty:
+            pass
+        time.sleep(0.03)  # cv2.waitKey(30)
+    state["running"] = False
+
+
+def pipelined_run(source):
+    import queue
+    import pipeline as pipeline_mod
+    pool = pipeline_mod.FramePool(4, source.shape)
+    display_q = queue.Queue(maxsize=4)
+    segmenter = ForegroundSegmenter()
+
+    def segment(slot):
+        segmenter.apply(pool.frames[slot])
+        display_q.put(slot)
+        return pipeline_mod.HANDOFF
+
+    pipe = pipeline_mod.FramePipeline(pool, [("capture", lambda slot: source.read_into(pool.frames[slot])),
+                                             ("segment", segment)],
+                                      on_eof=lambda: display_q.put(None)).start()
+    while True:
+        try:
+            slot = display_q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if slot is None:
+            break
+        pool.release(slot)
+    pipe.join()
+
+
+def bench_idle(args):
+    frames = load_frames(args.video, args.frames)
+    results = []
+    for name, run in (("polling", polling_run),
+                      ("polling/capture-outside-lock", lambda source: polling_run(source, False)),
+                      ("blocking", pipelined_run)):
+        source = PacedSource(frames, args.fps)
+        wall, cpu = time.perf_counter(), time.process_time()
+        run(source)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        results.append({"path": name, "source_fps": args.fps, "frames": len(frames),
+                         "wall_s": round(wall, 2), "cpu_percent": round(100 * cpu / wall, 1)})
+    report("Process CPU usage with a source slower than processing", results)
+    return results
+
+
+#################
+#   YOLO        #
+#################
+
+def bench_yolo(args):
+    from detector import PersonDetector, iter_detections
+    detector = PersonDetector(args.model, imgsz=args.imgsz)
+    results = []
+    for batch_size in args.batch_sizes:
+        frames = persons = 0
+        start = time.perf_counter()
+        for _, _, dets in iter_detections(args.video, detector, batch_size=batch_size,
+                                          size=(1020, 500), skip=args.skip):
+            frames += 1
+            persons += len(dets)
+            if args.limit and frames >= args.limit:
+                break
+        elapsed = time.perf_counter() - start
+        results.append({"batch_size": batch_size, "frames": frames, "persons": persons,
+                        "fps": round(frames / elapsed, 2)})
+    report(f"YOLOv8 decode + batched CPU inference on {args.video}", results)
+    return results
+
+
+#################
+#   SCHEDULER   #
+#################
+
+def count_frames(frames, scheduler=None, segmenter=None, roi_margin=None):
+    """Segment + track `frames` like process_frames; returns (up, down, processed).
+
+    With `roi_margin` set, segmentation is restricted to the band between the
+    limit lines plus that many rows (as with counter.py --roi band).
+    """
+    import tracking
+    h, w = frames[0].shape[:2]
+    line_up, line_down, up_limit, down_limit = counting_lines(h)
+    areaTH = h * (w + 20) / 300
+    if segmenter is None:
+        segmenter = ForegroundSegmenter()
+    if roi_margin is not None:
+        segmenter.set_roi((0, up_limit - roi_margin, w, down_limit + roi_margin))
+    tracker = tracking.CentroidTracker(line_up, line_down, up_limit, down_limit)
+    if scheduler is not None:
+        scheduler.set_band(up_limit, down_limit)
+    up = down = processed = 0
+    for frame in frames:
+        if scheduler is not None and not scheduler.should_process(frame):
+            continue
+        processed += 1
+        centroids, sizes, _ = segmenter.blobs(segmenter.apply(frame), areaTH)
+        for _, direction, _, _ in tracker.update(centroids, sizes)[1]:
+            if direction == tracking.UP:
+                up += 1
+            else:
+                down += 1
+    return up, down, processed
+
+
+def bench_schedule(args):
+    from scheduler import AdaptiveScheduler
+    configs = [("every-frame", None)]
+    for probe in ("diff", "mog2"):
+        for idle_every in args.idle_every:
+            configs.append((f"adaptive/{probe}/idle-1-in-{idle_every}",
+                            lambda p=probe, i=idle_every: AdaptiveScheduler(probe=p, idle_every=i,
+                                                                            hold_frames=args.hold_frames)))
+    results = []
+    for path in args.videos:
+        frames = load_frames(path)
+        baseline = None
+        for name, make in configs:
+            start = time.perf_counter()
+            up, down, processed = count_frames(frames, make() if make else None)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = (up, down)
+            results.append({"video": path, "path": name, "processed": f"{processed}/{len(frames)}",
+                            "effective_fps": round(len(frames) / elapsed, 1), "in": down, "out": up,
+                            "count_error": abs(down - baseline[1]) + abs(up - baseline[0])})
+    report("Adaptive frame-skip: effective FPS vs counting accuracy (error vs every-frame)", results)
+    return results
+
+
+#################
+#      ROI      #
+#################
+
+def bench_roi(args):
+    configs = [("full", 1.0, None)]
+    for scale in args.scales:
+        if scale != 1.0:
+            configs.append((f"full@{scale}", scale, None))
+    for scale in args.scales:
+        configs.append((f"band+{args.margin or 'h/6'}@{scale}", scale, "band"))
+    results = []
+    for path in args.videos:
+        frames = load_frames(path)
+        h = frames[0].shape[0]
+        baseline = None
+        for name, scale, roi in configs:
+            segmenter = ForegroundSegmenter(scale=scale)
+            margin = None if roi is None else (args.margin if args.margin is not None else h // 6)
+            start = time.perf_counter()
+            up, down, _ = count_frames(frames, segmenter=segmenter, roi_margin=margin)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = (up, down, elapsed)
+            results.append({"video": path, "path": name, "mask": "x".join(map(str, segmenter.shape)),
+                            "fps": round(len(frames) / elapsed, 1),
+                            "speedup": round(baseline[2] / elapsed, 2), "in": down, "out": up,
+                            "count_error": abs(down - baseline[1]) + abs(up - baseline[0])})
+    report("ROI / downscaled segmentation vs full frame (segment + contours + track)", results)
+    return results
+
+
+#################
+#     BLOBS     #
+#################
+
+def add_specks(mask, n, rng, radius=2):
+    """Copy of `mask` with `n` small foreground specks, like sensor noise or rain."""
+    mask = mask.copy()
+    h, w = mask.shape
+    for x, y in zip(rng.integers(0, w, n), rng.integers(0, h, n)):
+        cv2.circle(mask, (int(x), int(y)), radius, 255, -1)
+    return mask
+
+
+def bench_blobs(args):
+    from segmenter import BLOB_METHODS
+    results = []
+    frames = load_frames(args.video)
+    segmenter = ForegroundSegmenter()
+    masks = [segmenter.apply(frame).copy() for frame in frames[:args.frames]]
+    h, w = masks[0].shape
+    areaTH = h * (w + 20) / 300
+    rng = np.random.default_rng(0)
+    for specks in args.specks:
+        noisy = [add_specks(mask, specks, rng) for mask in masks] if specks else masks
+        contours = np.mean([len(cv2.findContours(m, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]) for m in noisy])
+        found = {}
+        for method in BLOB_METHODS:
+            s = ForegroundSegmenter(blob_method=method)
+            s.apply(frames[0])
+            start = time.perf_counter()
+            found[method] = [len(s.blobs(mask, areaTH)[0]) for mask in noisy]
+            elapsed = time.perf_counter() - start
+            results.append({"specks": specks, "contours": round(contours, 1), "method": method,
+                            "us_per_frame": round(1e6 * elapsed / len(noisy), 1),
+                            "blobs_per_frame": round(np.mean(found[method]), 2)})
+        results[-1]["frames_differing"] = sum(a != b for a, b in zip(*found.values()))
+    report(f"Blob extraction on {args.video} masks with added noise (areaTH={areaTH:.0f})", results)
+
+    counts = []
+    for path in args.videos:
+        frames = load_frames(path)
+        for method in BLOB_METHODS:
+            up, down, _ = count_frames(frames, segmenter=ForegroundSegmenter(blob_method=method))
+            counts.append({"video": path, "method": method, "in": down, "out": up})
+    report("Counts on recorded video", counts)
+    return results + counts
+
+
+#################
+#  BACKGROUND   #
+#################
+
+BACKGROUND_CONFIGS = [
+    ("mog2", None),
+    ("mog2 gated", dict(gate=True)),
+    ("mog2 no-shadows", dict(gate=False, shadows=False)),
+    ("mog2@0.5", dict(gate=False, scale=0.5)),
+    ("mog2 gated@0.5", dict(gate=True, scale=0.5)),
+    ("knn", dict(method="knn", gate=False)),
+    ("knn gated", dict(method="knn", gate=True)),
+    ("knn no-shadows", dict(method="knn", gate=False, shadows=False)),
+    ("average", dict(method="average", gate=False)),
+    ("average gated", dict(method="average", gate=True)),
+]
+
+
+def bench_background(args):
+    from background import BackgroundModel
+    results = []
+    for path in args.videos:
+        frames = load_frames(path)
+        baseline = None
+        for name, options in BACKGROUND_CONFIGS:
+            model = BackgroundModel(**options) if options is not None else None
+            segmenter = ForegroundSegmenter(subtractor=model)
+            model_seconds = 0.0
+            start = time.perf_counter()
+            up, down, _ = count_frames(frames, segmenter=segmenter)
+            elapsed = time.perf_counter() - start
+            if model is not None:
+                model_seconds = model.seconds
+                static = model.stats()["static_ratio"]
+            else:
+                # Plain subtractor: only the MOG2 call of the last frame is kept, so time it again
+                fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=True)
+                t = time.perf_counter()
+                for frame in frames:
+                    fgbg.apply(frame)
+                model_seconds = time.perf_counter() - t
+                static = 0.0
+            if baseline is None:
+                baseline = (up, down, elapsed)
+            results.append({"video": path, "model": name,
+                            "model_ms": round(1000 * model_seconds / len(frames), 3),
+                            "fps": round(len(frames) / elapsed, 1), "speedup": round(baseline[2] / elapsed, 2),
+                            "static_ratio": static, "in": down, "out": up,
+                            "count_error": abs(down - baseline[1]) + abs(up - baseline[0])})
+    report("Background model cost and accuracy (segment + contours + track, error vs plain MOG2)", results)
+    return results
+
+
+#################
+#   GEOMETRY    #
+#################
+
+def legacy_geometry(frame):
+    """The per-frame recomputation process_frames did for VideoReader sources."""
+    h, w = frame.shape[:2]
+    frameArea = h * w
+    areaTH = frameArea / 300
+    line_up = int(1 * (h / 6))
+    line_down = int(4 * (h / 6))
+    up_limit = int(0.5 * (h / 6))
+    down_limit = int(4.5 * (h / 6))
+    pts_L1 = np.array([[0, line_down], [w, line_down]], np.int32).reshape((-1,1,2))
+    pts_L2 = np.array([[0, line_up], [w, line_up]], np.int32).reshape((-1,1,2))
+    pts_L3 = np.array([[0, up_limit], [w, up_limit]], np.int32).reshape((-1,1,2))
+    pts_L4 = np.array([[0, down_limit], [w, down_limit]], np.int32).reshape((-1,1,2))
+    return areaTH, pts_L1, pts_L2, pts_L3, pts_L4
+
+
+def bench_geometry(args):
+    frame = np.zeros((args.height, args.width, 3), np.uint8)
+    geometry = CountingGeometry()
+    results = []
+    for name, fn in (("per-frame", legacy_geometry), ("CountingGeometry.update", lambda f: geometry.update(f.shape))):
+        fn(frame)
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            fn(frame)
+        elapsed = time.perf_counter() - start
+        results.append({"path": name, "us_per_frame": round(1e6 * elapsed / args.iterations, 3)})
+    report(f"Counting geometry cost per frame ({args.width}x{args.height})", results)
+    return results
+
+
+#################
+#    REPLAY     #
+#################
+
+REPLAY_COUNTERS = ("counter", "final_count", "yolo")
+GROUND_TRUTH = "replay_ground_truth.json"
+# final_count.py case with known crossings, written by write_synthetic_doorway() when missing
+SYNTHETIC_DOORWAY = "synthetic_doorway.mp4"
+
+
+class ReplayPublisher:
+    """Stand-in for TelemetryPublisher that only records what would have been sent."""
+
+    def __init__(self):
+        self.values = {}
+        self.updates = 0
+
+    def publish(self, key, value):
+        self.publish_many({key: value})
+
+    def publish_many(self, values):
+        self.updates += 1
+        self.values.update(values)
+
+    def send_telemetry(self, key, value):
+        self.publish(key, value)
+
+    def disconnect(self):
+        pass
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    # ru_maxrss is in KiB on Linux (bytes on macOS)
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1)
+
+
+def stage_summary(stats):
+    return {name: {"frames": s.count,
+                   "latency_ms_avg": round(1000 * s.total / s.count, 3) if s.count else 0.0,
+                   "latency_ms_max": round(1000 * s.max, 3)} for name, s in stats.items()}
+
+
+def replay_counter(path):
+    """counter.process_frames over a video, headless, with recorded telemetry."""
+    import logging
+    import counter
+    import pipeline
+    logging.getLogger("counter").setLevel(logging.WARNING)
+    source = counter.VideoReader(path)
+    frames = source.total_frames
+    pool = pipeline.FramePool(4, source.shape)
+    publisher = ReplayPublisher()
+    out, inside = counter.process_frames(source, pool, None, publisher)
+    source.release()
+    stages = {name: {k: v for k, v in s.items() if k != "latency_ms_last"}
+              for name, s in counter.frame_pipeline.stats().items() if name != "pool"}
+    telemetry = {k: publisher.values.get(k) for k in ("entered_people", "exited_people")}
+    return {"in": inside, "out": out, "frames": frames, "stages": stages,
+            "telemetry": dict(telemetry, updates=publisher.updates)}
+
+
+def replay_final_count(path):
+    import collections
+    import final_count
+    import pipeline
+    stats = collections.defaultdict(pipeline.StageStats)
+    cin, cout = final_count.count_video(path, show=False, stats=stats)
+    return {"in": cin, "out": cout, "frames": stats["read"].count - 1, "stages": stage_summary(stats)}
+
+
+def replay_yolo(path):
+    import collections
+    import countingYolov8
+    import pipeline
+    stats = collections.defaultdict(pipeline.StageStats)
+    down, up = countingYolov8.count_video(path, show=False, output_path=None, stats=stats)
+    cap = cv2.VideoCapture(path)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return {"in": down, "out": up, "frames": frames, "stages": stage_summary(stats)}
+
+
+def replay_one(name, path):
+    """Run one counter over one video; meant to run in a fresh process so peak RSS is its own."""
+    import contextlib
+    import io
+    run = {"counter": replay_counter, "final_count": replay_final_count, "yolo": replay_yolo}[name]
+    start = time.perf_counter()
+    # The counters print every crossing; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run(path)
+    elapsed = time.perf_counter() - start
+    result.update(seconds=round(elapsed, 3), fps=round(result["frames"] / elapsed, 1), peak_rss_mb=peak_rss_mb())
+    return result
+
+
+def check_run(result, truth, tolerance, perf=None):
+    """
+    Regression messages for one run against its ground-truth entry (empty = pass).
+
+    Counts must always match. FPS and peak RSS are only compared with `perf`,
+    the baseline recorded on this host, since they mean nothing across machines.
+    """
+    problems = []
+    for key in ("in", "out"):
+        if result[key] != truth[key]:
+            problems.append(f"{key} count {result[key]} != {truth[key]}")
+    if not perf:
+        return problems
+    if perf.get("fps") and result["fps"] < perf["fps"] * (1 - tolerance["fps"]):
+        problems.append(f"fps {result['fps']} < {perf['fps']} - {tolerance['fps']:.0%}")
+    if perf.get("peak_rss_mb") and result["peak_rss_mb"] \
+            and result["peak_rss_mb"] > perf["peak_rss_mb"] * (1 + tolerance["peak_rss"]):
+        problems.append(f"peak RSS {result['peak_rss_mb']} MB > {perf['peak_rss_mb']} MB + "
+                        f"{tolerance['peak_rss']:.0%}")
+    return problems
+
+
+def write_synthetic_doorway(path, people=32, lanes=2):
+    """Write synthetic_doorway() to a video; returns its (expected in, expected out)."""
+    frames, expected_in, expected_out = synthetic_doorway(people, lanes=lanes)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 30, (460, 380))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    return expected_in, expected_out
+
+
+def bench_replay(args):
+    import concurrent.futures
+    import multiprocessing
+    import platform
+    truth = {"tolerance": {"fps": 0.5, "peak_rss": 0.5}, "runs": {}, "perf": {}}
+    if os.path.exists(args.ground_truth):
+        with open(args.ground_truth) as f:
+            truth = json.load(f)
+    host = args.host or platform.node()
+    perf = truth.setdefault("perf", {}).get(host, {})
+    runs = [(name, path) for name in args.counters for path in args.videos]
+    if "final_count" in args.counters and args.synthetic:
+        if not os.path.exists(args.synthetic):
+            write_synthetic_doorway(args.synthetic)
+        runs.append(("final_count", args.synthetic))
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for name, path in runs:
+        key = f"{name}:{os.path.basename(path)}"
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+            try:
+                result = executor.submit(replay_one, name, path).result()
+            except ImportError as e:
+                results.append({"run": key, "status": "skipped", "reason": str(e)})
+                continue
+        expected = truth["runs"].get(key)
+        if args.update_ground_truth:
+            truth["runs"][key] = {k: result[k] for k in ("in", "out")}
+            truth["perf"].setdefault(host, {})[key] = {k: result[k] for k in ("fps", "peak_rss_mb")}
+            status = "updated"
+        elif expected is None:
+            status = "no ground truth"
+        else:
+            problems = check_run(result, expected, truth["tolerance"], perf.get(key))
+            status = "FAIL: " + "; ".join(problems) if problems else "ok"
+            if not problems and key not in perf:
+                status = "ok (counts only)"
+            args.failed = args.failed or bool(problems)
+        results.append(dict(run=key, status=status, **result))
+    if args.update_ground_truth:
+        with open(args.ground_truth, "w") as f:
+            json.dump(truth, f, indent=2)
+            f.write("\n")
+    report("Replay (in/out vs ground truth, fps, peak RSS)",
+           [{k: r.get(k) for k in ("run", "in", "out", "fps", "peak_rss_mb", "status", "reason") if k in r}
+            for r in results])
+    return results
+
+
+#################
+#   MULTICAM    #
+#################
+
+def bench_multicam(args):
+    from multicam import DoorSupervisor
+    frames_per_video = {}
+    for path in args.videos:
+        cap = cv2.VideoCapture(path)
+        frames_per_video[path] = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+    results = []
+    for n in args.doors:
+        doors = {f"door{i}": args.videos[i % len(args.videos)] for i in range(n)}
+        frames = sum(frames_per_video[path] for path in doors.values())
+        publisher = ReplayPublisher()
+        start = time.perf_counter()
+        supervisor = DoorSupervisor(doors, publisher, {"pool_size": 4}, cv_threads=args.cv_threads).start()
+        totals = supervisor.run()
+        elapsed = time.perf_counter() - start
+        results.append({"doors": n, "cores": os.cpu_count(), "seconds": round(elapsed, 2),
+                        "aggregate_fps": round(frames / elapsed, 1),
+                        "fps_per_door": round(frames / elapsed / n, 1),
+                        "in": totals["entered_people"], "out": totals["exited_people"],
+                        "inside": publisher.values.get("people_inside")})
+    report("Multi-door supervisor: one process per door (test videos, incl. process start-up)", results)
+    return results
+
+
+#################
+#     BATCH     #
+#################
+
+def bench_batch(args):
+    import batch
+    results = []
+    for path in args.videos:
+        sequential = batch.analyze(path, workers=1, chunk_seconds=1e9)
+        rows = [("sequential", sequential)]
+        for workers in args.workers:
+            rows.append((f"{workers} workers", batch.analyze(path, workers=workers,
+                                                              chunk_seconds=args.chunk_seconds,
+                                                              warmup_seconds=args.warmup_seconds)))
+        for name, r in rows:
+            results.append({"video": path, "path": name, "chunks": r["chunks"],
+                            "decoded": f"{r['decoded_frames']}/{r['frames']}",
+                            "wall_s": round(r["wall_seconds"], 2),
+                            "video_h_per_h": round(r["video_seconds"] / r["wall_seconds"], 1),
+                            "in": r["in"], "out": r["out"],
+                            "matches_sequential": (r["in"], r["out"]) == (sequential["in"], sequential["out"])})
+    report(f"Batch analysis: video-hours per wall-clock hour ({os.cpu_count()} cores)", results)
+    return results
+
+
+#################
+#    STREAM     #
+#################
+
+def consume_stream(read, camera, seconds, work):
+    """Read frames for `seconds`, spending `work` s on each; returns (frames, lag in frames per frame)."""
+    from stream_standin import read_stamp
+    lags = []
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        frame = read()
+        if frame is None:
+            break
+        lags.append(camera.index - read_stamp(frame))
+        time.sleep(work)
+    return len(lags), lags
+
+
+def bench_stream(args):
+    from stream import StreamReader
+    from stream_standin import StandInCamera
+    results = []
+    camera = StandInCamera(args.video, fps=args.fps).start()
+    try:
+        for work in args.work_ms:
+            for name in ("fifo", "latest"):
+                if name == "fifo":
+                    # Plain VideoCapture: every frame is read in order, however late
+                    cap = cv2.VideoCapture(camera.url, cv2.CAP_FFMPEG)
+                    read = lambda: cap.read()[1]
+                else:
+                    reader = StreamReader(camera.url)
+                    read = reader.read
+                frames, lags = consume_stream(read, camera, args.seconds, work / 1000)
+                row = {"work_ms": work, "path": name, "processed": frames,
+                       "lag_p50_frames": int(np.percentile(lags, 50)), "lag_max_frames": int(max(lags))}
+                if name == "fifo":
+                    cap.release()
+                else:
+                    stats = reader.stats()
+                    reader.release()
+                    row.update({"dropped": stats["dropped"], "read_p50_ms": stats["read"]["p50_ms"],
+                                "age_p50_ms": stats["age"]["p50_ms"], "age_p95_ms": stats["age"]["p95_ms"]})
+                results.append(row)
+        report(f"Stream ingest from a {camera.fps:g} fps stand-in camera (lag = frames behind live)", results)
+
+        # Connection cut, then the camera going away for `outage` seconds
+        reader = StreamReader(camera.url, backoff_initial=0.25, timeout=2)
+        reader.read()
+        recovery = []
+        camera.drop_clients()
+        start = time.monotonic()
+        reader.read()
+        reader.read()
+        recovery.append({"event": "connection cut", "recovered_s": round(time.monotonic() - start, 2),
+                         "reconnects": reader.counters["reconnects"]})
+        camera.stop()
+        time.sleep(args.outage)
+        camera = StandInCamera(args.video, fps=args.fps, port=camera.port).start()
+        start = time.monotonic()
+        reader.read()
+        reader.read()
+        recovery.append({"event": f"camera down {args.outage:g} s", "recovered_s": round(time.monotonic() - start, 2),
+                         "reconnects": reader.counters["reconnects"]})
+        reader.release()
+        report("Stream reconnect (time to the next frames after the camera is back)", recovery)
+    finally:
+        camera.stop()
+    return results + recovery
+
+
+#################
+#   EVENT LOG   #
+#################
+
+def bench_event_log(args):
+    import csv
+    import tempfile
+    import tracking
+    from event_log import EventLog, EventLogReader, RECORD_DTYPE
+    rng = np.random.default_rng(0)
+    # One crossing every ~2 s on average, as a busy door would log over weeks
+    ts = 1.7e9 + np.cumsum(rng.exponential(2.0, args.events))
+    direction = np.where(rng.random(args.events) < 0.5, tracking.UP, tracking.DOWN)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for use_mmap in (False, True):
+            path = os.path.join(tmp, f"events_{use_mmap}.evl")
+            log = EventLog(path, use_mmap=use_mmap).start()
+            start = time.perf_counter()
+            for i in range(args.events):
+                # Pace the producer so the queue bound is never the bottleneck
+                while not log.log(i, int(direction[i]), 100, 120, ts=float(ts[i])):
+                    time.sleep(0.001)
+            produced = time.perf_counter() - start
+            log.close()
+            written = time.perf_counter() - start
+            results.append({"path": "mmap" if use_mmap else "write", "events": args.events,
+                            "log_us_per_event": round(1e6 * produced / args.events, 2),
+                            "written_per_s": int(args.events / written),
+                            "bytes_per_event": round(os.path.getsize(path) / args.events, 2),
+                            "dropped": log.stats()["dropped"]})
+
+        start = time.perf_counter()
+        reader = EventLogReader(path)
+        starts, entered, exited = reader.counts(args.window)
+        binary_seconds = time.perf_counter() - start
+
+        # Same aggregation from a CSV log parsed into Python objects
+        csv_path = os.path.join(tmp, "events.csv")
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(RECORD_DTYPE.names)
+            writer.writerows(zip(ts.tolist(), range(args.events), direction.tolist(),
+                                 [1] * args.events, [100] * args.events, [120] * args.events))
+        start = time.perf_counter()
+        windows = {}
+        with open(csv_path, newline="") as f:
+            for row in csv.DictReader(f):
+                key = int(float(row["ts"]) // args.window)
+                w = windows.setdefault(key, [0, 0])
+                w[0 if int(row["direction"]) == tracking.DOWN else 1] += 1
+        csv_seconds = time.perf_counter() - start
+        csv_match = [windows.get(int(t // args.window), [0, 0]) for t in starts] == \
+            [[int(a), int(b)] for a, b in zip(entered, exited)]
+        results.append({"path": "read binary", "windows": len(starts), "seconds": round(binary_seconds, 3),
+                        "events_per_s": int(args.events / binary_seconds)})
+        results.append({"path": "read csv", "windows": len(windows), "seconds": round(csv_seconds, 3),
+                        "events_per_s": int(args.events / csv_seconds),
+                        "bytes_per_event": round(os.path.getsize(csv_path) / args.events, 2),
+                        "counts_match": csv_match})
+    report(f"Event log: background writer and per-{args.window:g} s aggregation", results)
+    return results
+
+
+#################
+#  FINAL COUNT  #
+#################
+
+FINAL_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+
+def legacy_final_mask(frame):
+    """The per-frame mask final_count.py built before CountingEngine."""
+    img = frame[80:, 100:]
+    img = cv2.medianBlur(img, 5)
+    dilation = cv2.dilate(img, FINAL_KERNEL, iterations=4)
+    img = cv2.erode(dilation, FINAL_KERNEL, iterations=6)
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, np.array([0, 0, 27]), np.array([200, 255, 255]))
+    ret, mask = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    contours, hierarchy = cv2.findContours(mask.copy(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    return mask, contours
+
+
+class LegacyFinalCount:
+    """final_count.py's counting before per-object state: one pre/prei for every blob."""
+
+    def __init__(self):
+        self.cin = 0
+        self.cout = 0
+        self.pre = 0
+        self.prei = 800
+
+    def process(self, frame):
+        mask, contours = legacy_final_mask(frame)
+        mid = mask.shape[1] / 2
+        for i in range(1, len(contours)):
+            area = cv2.contourArea(contours[i])
+            if 10000 < area < 25000:
+                M = cv2.moments(contours[i])
+                cur = int(M['m10'] / M['m00'])
+                if self.prei < mid and cur > mid:
+                    if abs(self.prei - cur) < 60:
+                        self.cout += 1
+                elif self.prei > mid and cur < mid:
+                    if abs(self.pre - cur) < 60:
+                        self.cin += 1
+                self.pre = cur
+                self.prei = cur
+
+
+def synthetic_doorway(people, lanes=2, width=460, height=380, size=(100, 120), speed=6, gap=50, seed=0):
+    """
+    Bright boxes walking across a dark doorway, as final_count.py sees people.
+
+    People are spread round-robin over `lanes` horizontal lanes of the
+    cropped area; even lanes walk left to right (counted as out), odd lanes
+    right to left (in). People in a lane follow each other `gap` pixels
+    apart, so several are in view and crossing at once. One frame buffer is
+    redrawn and yielded per frame.
+
+    Returns:
+        tuple: (frame generator, expected in, expected out)
+    """
+    rng = np.random.default_rng(seed)
+    top, left = 80, 100
+    view_w = width - left
+    bw, bh = size
+    lane_h = (height - top) // lanes
+    walkers = []  # (lane, first frame)
+    for i in range(people):
+        lane = i % lanes
+        walkers.append((lane, (i // lanes) * ((bw + gap) // speed + 1)))
+    span = (view_w + 2 * bw) // speed + 1
+    total = max(start for _, start in walkers) + span + 1 if walkers else 0
+    expected_out = sum(1 for lane, _ in walkers if lane % 2 == 0)
+
+    def frames():
+        frame = np.empty((height, width, 3), np.uint8)
+        noise = rng.integers(0, 20, (height, width, 3), np.uint8)
+        for t in range(total):
+            np.copyto(frame, noise)
+            for lane, start in walkers:
+                step = t - start
+                if not 0 <= step < span:
+                    continue
+                x = -bw + step * speed
+                if lane % 2:
+                    x = view_w - x - bw
+                y = top + lane * lane_h + (lane_h - bh) // 2
+                cv2.rectangle(frame, (left + x, y), (left + x + bw - 1, y + bh - 1), (90, 170, 230), -1)
+            yield frame
+
+    return frames(), people - expected_out, expected_out
+
+
+def bench_final_count(args):
+    import final_count
+    results = []
+    for path in args.videos:
+        frames = load_frames(path, crop=False)
+        engine = final_count.CountingEngine()
+        masks = []
+        start = time.perf_counter()
+        for frame in frames:
+            masks.append(legacy_final_mask(frame)[0])
+        legacy_seconds = time.perf_counter() - start
+        same = 0
+        start = time.perf_counter()
+        for frame, legacy in zip(frames, masks):
+            img, mask = engine.foreground(frame)
+            engine.blobs(mask)
+            same += np.array_equal(mask, legacy)
+        engine_seconds = time.perf_counter() - start
+        headless = final_count.benchmark(path)
+        results.append({"video": path, "legacy_ms": round(1000 * legacy_seconds / len(frames), 3),
+                        "engine_ms": round(1000 * engine_seconds / len(frames), 3),
+                        "speedup": round(legacy_seconds / engine_seconds, 2),
+                        "identical_masks": round(same / len(frames), 4),
+                        "headless_fps": headless["fps"], "in": headless["in"], "out": headless["out"]})
+    report("final_count.py: legacy colour pipeline vs single-channel CountingEngine (mask + blobs)", results)
+
+    crossings = []
+    for people in args.people:
+        for name, counter in (("global pre/prei", LegacyFinalCount()),
+                              ("CountingEngine", final_count.CountingEngine()),
+                              ("CountingEngine components", final_count.CountingEngine(blob_method="components"))):
+            frames, expected_in, expected_out = synthetic_doorway(people, lanes=args.lanes)
+            writer = None
+            if args.output and name == "CountingEngine" and people == args.people[-1]:
+                writer = cv2.VideoWriter(args.output, cv2.VideoWriter_fourcc(*"mp4v"), 30, (460, 380))
+            seconds = 0.0
+            n = 0
+            for frame in frames:
+                if writer is not None:
+                    writer.write(frame)
+                start = time.perf_counter()
+                counter.process(frame)
+                seconds += time.perf_counter() - start
+                n += 1
+            if writer is not None:
+                writer.release()
+            crossings.append({"people": people, "lanes": args.lanes, "counter": name, "frames": n,
+                              "ms_per_frame": round(1000 * seconds / n, 3), "in": counter.cin, "out": counter.cout,
+                              "expected": f"{expected_in}/{expected_out}",
+                              "count_error": abs(counter.cin - expected_in) + abs(counter.cout - expected_out)})
+    report("final_count.py crossings on a synthetic multi-person doorway", crossings)
+    return results + crossings
+
+
+#################
+#    STARTUP    #
+#################
+
+# Optional backends that importing the counter must not pull in by itself
+STARTUP_BACKENDS = ("scipy", "paho", "psutil", "picamera2", "requests", "imutils", "sqlite3")
+
+FIRST_FRAME = """
+import counter, sys
+from segmenter import ForegroundSegmenter
+source = counter.open_source(sys.argv[1])
+frame = source.read()
+ForegroundSegmenter().apply(frame)
+source.release()
+print("backends", " ".join(m for m in sys.argv[2:] if m in sys.modules))
+"""
+
+
+def import_times(module):
+    """{name: cumulative us} for the top-level imports of `module`, from `python -X importtime`."""
+    import subprocess
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in out.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2]
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            times[name.strip()] = times.get(name.strip(), 0) + int(parts[1])
+    return times
+
+
+def bench_startup(args):
+    import statistics
+    import subprocess
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    total = statistics.median(r[args.module] for r in runs)
+    slow = {}
+    for r in runs:
+        for name, us in r.items():
+            if name != args.module:
+                slow.setdefault(name, []).append(us)
+    results = [{"module": args.module, "import_ms": round(total / 1000, 1), "runs": args.runs}]
+    for name, times in sorted(slow.items(), key=lambda kv: -statistics.median(kv[1]))[:args.top]:
+        results.append({"child": name, "import_ms": round(statistics.median(times) / 1000, 1)})
+    report(f"Cold import of {args.module} (python -X importtime, median, slowest top-level imports)", results)
+
+    first = []
+    backends = ""
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", FIRST_FRAME, args.video] + list(STARTUP_BACKENDS),
+                             capture_output=True, text=True, check=True).stdout
+        first.append(time.perf_counter() - start)
+        backends = out.split("backends", 1)[1].strip()
+    startup = [{"video": args.video, "first_frame_ms": round(1000 * statistics.median(first), 1),
+                "optional_backends_loaded": backends or "none"}]
+    report("Process start to first segmented frame", startup)
+    return results + startup
+
+
+#################
+#     SINKS     #
+#################
+
+class StatsdReceiver:
+    """Counts the statsd lines arriving on a local UDP socket."""
+
+    def __init__(self):
+        import socket
+        import threading
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.2)
+        self.port = self.sock.getsockname()[1]
+        self.datagrams = 0
+        self.lines = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._receive, daemon=True)
+        self.thread.start()
+
+    def _receive(self):
+        while self.running:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                continue
+            self.datagrams += 1
+            self.lines += data.count(b"\n") + 1
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+
+def sink_specs(args, tmp):
+    """(name, spec, cleanup) for every sink in args.sinks, with local stand-ins for the network."""
+    for name in args.sinks:
+        if name == "mqtt":
+            from mqtt_standin import StandInBroker
+            broker = StandInBroker().start()
+            yield name, "mqtt", broker.port, broker.stop, lambda: len(broker.payloads())
+        elif name == "udp":
+            receiver = StatsdReceiver()
+            yield name, f"udp:127.0.0.1:{receiver.port}", 0, receiver.stop, lambda: receiver.datagrams
+        elif name == "file":
+            path = os.path.join(tmp, "telemetry.ndjson")
+            yield name, f"file:{path}", 0, lambda: None, lambda: sum(1 for _ in open(path))
+        else:
+            yield name, name, 0, lambda: None, lambda: None
+
+
+def bench_sinks(args):
+    import logging
+    import tempfile
+    from telemetry_sinks import open_sink
+    logging.getLogger("postTelemetry_mqtt_tb").setLevel(logging.WARNING)
+    tmp = tempfile.mkdtemp()
+    results = []
+    for name, spec, port, cleanup, delivered in sink_specs(args, tmp):
+        sink = open_sink(spec, "127.0.0.1", port, "bench", flush_interval=args.flush_interval,
+                         max_queue=args.max_queue).start()
+        row = time_events(sink.publish, args.events, args.rate)
+        backlog = sink.stats()["backlog"]
+        sink.disconnect()
+        time.sleep(0.2)
+        stats = sink.stats()
+        results.append(dict(sink=name, **row, backlog_at_end=backlog, sent=stats["sent"],
+                            payloads=stats["payloads"], dropped=stats["dropped"], failed=stats["failed"],
+                            received=delivered(), publish_p50_ms=stats["publish"]["p50_ms"],
+                            publish_p99_ms=stats["publish"]["p99_ms"]))
+        cleanup()
+    report("Telemetry sinks: hot-path cost per crossing event (3 keys), batches and send latency", results)
+
+    if not args.video:
+        return results
+    import contextlib
+    import io
+    import counter
+    import pipeline
+    logging.getLogger("counter").setLevel(logging.WARNING)
+    throughput = []
+    for name, spec, port, cleanup, delivered in sink_specs(args, tmp):
+        sink = open_sink(spec, "127.0.0.1", port, "bench", flush_interval=args.flush_interval).start()
+        source = counter.VideoReader(args.video)
+        frames = source.total_frames
+        pool = pipeline.FramePool(4, source.shape)
+        start = time.perf_counter()
+        # process_frames prints the final counts; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            out, inside = counter.process_frames(source, pool, None, sink)
+        elapsed = time.perf_counter() - start
+        source.release()
+        sink.disconnect()
+        throughput.append({"sink": name, "video": args.video, "fps": round(frames / elapsed, 1),
+                           "in": inside, "out": out, "sent": sink.stats()["sent"]})
+        cleanup()
+    report("Counter throughput per telemetry sink", throughput)
+    return results + throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the people counter")
+    parser.add_argument("--json", type=str, default="", help="Write results to this JSON file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("segment", help="Legacy two-pass MOG2 vs ForegroundSegmenter")
+    p.add_argument("videos", nargs="*", default=["test2.mp4", "test3.mp4"])
+    p.add_argument("--variants", nargs="+", default=["close"])
+    p.add_argument("--limit", type=int, default=0, help="Max frames per video (0 = all)")
+    p.set_defaults(func=bench_segment)
+
+    p = sub.add_parser("publisher", help="Inline send_telemetry vs TelemetryPublisher on a stand-in broker")
+    p.add_argument("--events", type=int, default=500)
+    p.add_argument("--rate", type=float, default=200, help="Crossing events per second fed to the publisher")
+    p.add_argument("--legacy-events", type=int, default=3)
+    p.add_argument("--flush-interval", type=float, default=0.5)
+    p.add_argument("--max-queue", type=int, default=256)
+    p.add_argument("--retry-delay", type=float, default=2)
+    p.add_argument("--slow-delay", type=float, default=0.5, help="Broker ack delay for the 'slow' scenario")
+    p.set_defaults(func=bench_publisher)
+
+    p = sub.add_parser("spool", help="Offline spooling and rate-limited replay on a stand-in broker")
+    p.add_argument("--offline", type=float, default=5.0, help="Seconds the broker stays down")
+    p.add_argument("--flush-interval", type=float, default=0.1)
+    p.add_argument("--max-rows", type=int, default=100000)
+    p.add_argument("--replay-rate", type=float, default=20.0)
+    p.add_argument("--replay-batch", type=int, default=50)
+    p.add_argument("--timeout", type=float, default=30.0)
+    p.set_defaults(func=bench_spool)
+
+    p = sub.add_parser("track", help="Legacy persons loop vs vectorized CentroidTracker")
+    p.add_argument("videos", nargs="*", default=["test2.mp4", "test3.mp4"])
+    p.add_argument("--blobs", nargs="+", type=int, default=[1, 10, 25, 50, 100])
+    p.add_argument("--frames", type=int, default=300)
+    p.set_defaults(func=bench_track)
+
+    p = sub.add_parser("box-tracker", help="tracker.Tracker and countingYolov8 line state over a long run")
+    p.add_argument("--frames", type=int, default=20000)
+    p.add_argument("--every", nargs="+", type=int, default=[40, 10, 2],
+                   help="Frames between people entering (smaller = busier door)")
+    p.set_defaults(func=bench_box_tracker)
+
+    p = sub.add_parser("person-memory", help="tracemalloc of list-based vs ring-buffer MyPerson")
+    p.add_argument("videos", nargs="*", default=["test2.mp4", "test3.mp4"])
+    p.add_argument("--repeat", type=int, default=1, help="Replay each video this many times")
+    p.set_defaults(func=bench_person_memory)
+
+    p = sub.add_parser("idle", help="CPU usage of polling vs blocking handoff with a slow camera")
+    p.add_argument("video", nargs="?", default="test2.mp4")
+    p.add_argument("--fps", type=float, default=10.0, help="Rate at which the simulated camera delivers frames")
+    p.add_argument("--frames", type=int, default=100)
+    p.set_defaults(func=bench_idle)
+
+    p = sub.add_parser("yolo", help="Frames/s of batched YOLOv8 detection for several batch sizes")
+    p.add_argument("video", nargs="?", default="test2.mp4")
+    p.add_argument("--model", type=str, default="yolov8s.pt")
+    p.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 8])
+    p.add_argument("--imgsz", type=int, default=640)
+    p.add_argument("--skip", type=int, default=1, help="Keep one frame out of every N")
+    p.add_argument("--limit", type=int, default=0, help="Max frames per batch size (0 = all)")
+    p.set_defaults(func=bench_yolo)
+
+    p = sub.add_parser("schedule", help="Every-frame processing vs AdaptiveScheduler")
+    p.add_argument("videos", nargs="*", default=["test2.mp4", "test3.mp4"])
+    p.add_argument("--idle-every", nargs="+", type=int, default=[3, 6])
+    p.add_argument("--hold-frames", type=int, default=15)
+    p.set_defaults(func=bench_schedule)
+
+    p = sub.add_parser("roi", help="Full-frame vs counting-band ROI and downscaled segmentation")
+    p.add_argument("videos", nargs="*", default=["test2.mp4", "test3.mp4"])
+    p.add_argument("--scales", nargs="+", type=float, default=[1.0, 0.75, 0.5])
+    p.add_argument("--margin", type=int, default=None, help="Band margin in rows (default: frame height / 6)")
+    p.set_defaults(func=bench_roi)
+
+    p = sub.add_parser("geometry", help="Per-frame line recomputation vs CountingGeometry")
+    p.add_argument("--width", type=int, default=360)
+    p.add_argument("--height", type=int, default=360)
+    p.add_argument("--iterations", type=int, default=100000)
+    p.set_defaults(func=bench_geometry)
+
+    p = sub.add_parser("replay", help="Replay videos through the counters and check against ground truth")
+    p.add_argument("videos", nargs="*", default=["test2.mp4", "test3.mp4"])
+    p.add_argument("--counters", nargs="+", default=["counter", "final_count"], choices=REPLAY_COUNTERS)
+    p.add_argument("--ground-truth", type=str, default=GROUND_TRUTH)
+    p.add_argument("--synthetic", type=str, default=SYNTHETIC_DOORWAY,
+                   help="Synthetic doorway clip for final_count (written if missing; '' to skip)")
+    p.add_argument("--host", type=str, default="",
+                   help="Host whose FPS/peak RSS baseline to check against (default: this machine's name)")
+    p.add_argument("--update-ground-truth", action="store_true",
+                   help="Store this run's counts, and FPS and peak RSS as this host's baseline")
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser("multicam", help="Aggregate throughput of 1..N door worker processes")
+    p.add_argument("videos", nargs="*", default=["test2.mp4", "test3.mp4"])
+    p.add_argument("--doors", nargs="+", type=int, default=[1, 2, 4])
+    p.add_argument("--cv-threads", type=int, default=1)
+    p.set_defaults(func=bench_multicam)
+
+    p = sub.add_parser("batch", help="Sequential vs chunked process-pool analysis of recorded video")
+    p.add_argument("videos", nargs="*", default=["test2.mp4"])
+    p.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    p.add_argument("--chunk-seconds", type=float, default=20.0)
+    p.add_argument("--warmup-seconds", type=float, default=None)
+    p.set_defaults(func=bench_batch)
+
+    p = sub.add_parser("blobs", help="Per-contour vs connected-components blob extraction on noisy masks")
+    p.add_argument("video", nargs="?", default="test2.mp4")
+    p.add_argument("--videos", nargs="*", default=["test2.mp4", "test3.mp4"])
+    p.add_argument("--frames", type=int, default=300)
+    p.add_argument("--specks", nargs="+", type=int, default=[0, 100, 300, 1000, 3000])
+    p.set_defaults(func=bench_blobs)
+
+    p = sub.add_parser("background", help="Cost and count accuracy of background models and update gating")
+    p.add_argument("videos", nargs="*", default=["test2.mp4", "test3.mp4"])
+    p.set_defaults(func=bench_background)
+
+    p = sub.add_parser("stream", help="Latest-frame StreamReader vs FIFO VideoCapture on a local MJPEG stand-in")
+    p.add_argument("video", nargs="?", default="test2.mp4")
+    p.add_argument("--fps", type=float, default=30.0)
+    p.add_argument("--seconds", type=float, default=5.0, help="Seconds per run")
+    p.add_argument("--work-ms", nargs="+", type=float, default=[10, 50], help="Simulated processing per frame")
+    p.add_argument("--outage", type=float, default=2.0, help="Seconds the camera is down in the reconnect test")
+    p.set_defaults(func=bench_stream)
+
+    p = sub.add_parser("event-log", help="Binary event log write throughput and windowed aggregation vs CSV")
+    p.add_argument("--events", type=int, default=1000000)
+    p.add_argument("--window", type=float, default=3600.0)
+    p.set_defaults(func=bench_event_log)
+
+    p = sub.add_parser("final-count", help="final_count.py legacy mask pipeline vs CountingEngine")
+    p.add_argument("videos", nargs="*", default=["test2.mp4", "test3.mp4"])
+    p.add_argument("--people", nargs="+", type=int, default=[1, 2, 8, 32])
+    p.add_argument("--lanes", type=int, default=2)
+    p.add_argument("--output", type=str, default="", help="Also write the largest synthetic doorway to this video")
+    p.set_defaults(func=bench_final_count)
+
+    p = sub.add_parser("startup", help="Cold import time of the counter and time to its first frame")
+    p.add_argument("video", nargs="?", default="test2.mp4")
+    p.add_argument("--module", type=str, default="counter")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--top", type=int, default=8, help="Slowest top-level imports to list")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("sinks", help="Telemetry sinks: publish cost, send latency and counter throughput")
+    p.add_argument("--sinks", nargs="+", default=["null", "file", "udp", "mqtt"], choices=("null", "file", "udp", "mqtt"))
+    p.add_argument("--events", type=int, default=2000)
+    p.add_argument("--rate", type=float, default=2000, help="Crossing events per second (0 = as fast as possible)")
+    p.add_argument("--flush-interval", type=float, default=0.05)
+    p.add_argument("--max-queue", type=int, default=100000)
+    p.add_argument("--video", type=str, default="test3.mp4", help="Also measure counter FPS per sink ('' = skip)")
+    p.set_defaults(func=bench_sinks)
+
+    args = parser.parse_args()
+    args.failed = False
+    results = args.func(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
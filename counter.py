@@ -1,35 +1,44 @@
 ##People counter
 import numpy as np
 import cv2
-import Person
+import tracking
+import pipeline as pipeline_mod
+from segmenter import ForegroundSegmenter, MASK_VARIANTS, BLOB_METHODS
+from background import BackgroundModel, METHODS as BG_METHODS
+from scheduler import AdaptiveScheduler, PROBES
+from geometry import VIDEO_CROP_LEFT, CountingGeometry
+from metrics import MetricsRegistry, MetricsServer
+from event_log import EventLog
+from stream import StreamReader, is_stream
+from telemetry_sinks import SINKS, open_sink
 import time
-import requests
-import imutils
 import signal
 import sys
 import threading
 import queue
 import logging
 import argparse
-from picamera2 import Picamera2
-import psutil
-from postTelemetry_mqtt_tb import MQTTThingsBoardClient
+import os
 
 # Setup logger
 logging.basicConfig(level=logging.DEBUG, format="[DEBUG] %(message)s")
 logger = logging.getLogger(__name__)
 
-# Signal handler for Ctrl+C (negligible resource use, safe for Pi Zero 2 W)
-def signal_handler(sig, frame):
-    print("Ctrl+C detected, cleaning up...")
-    global running, tb_client
-    running = False
-    if isinstance(source, PiCameraReader):
-        source.release()
-    else:
-        source.release()
-    tb_client.disconnect()
-    cv2.destroyAllWindows()
+# Set once to shut every thread down; threads block on it instead of polling a flag
+stop_event = threading.Event()
+frame_pipeline = None
+headless = False
+event_log = None
+# Set by main(); None until opened, since Ctrl+C can arrive before that
+source = None
+tb_client = None
+# Summary statistics, reset by main(); module-level so process_frames also runs without it
+cpu_usages = []
+memory_usages = []
+temperatures = []
+fps_values = []
+
+def print_summary():
     # Print average resource usage
     if cpu_usages:
         print(f"Average CPU Usage: {sum(cpu_usages)/len(cpu_usages):.2f}%")
@@ -39,9 +48,27 @@ def signal_handler(sig, frame):
         print(f"Average Temperature: {sum(temperatures)/len(temperatures):.2f}°C")
     if fps_values:
         print(f"Average FPS: {sum(fps_values)/len(fps_values):.2f}")
-    sys.exit(0)
 
-signal.signal(signal.SIGINT, signal_handler)
+def shutdown():
+    """Wake and stop every worker: pipeline stages, monitor loop and display loop."""
+    stop_event.set()
+    if frame_pipeline is not None:
+        frame_pipeline.stop()
+
+# Signal handler for Ctrl+C (negligible resource use, safe for Pi Zero 2 W)
+def signal_handler(sig, frame):
+    print("Ctrl+C detected, cleaning up...")
+    shutdown()
+    if source is not None:
+        source.release()
+    if tb_client is not None:
+        tb_client.disconnect()
+    if event_log is not None:
+        event_log.close()
+    if not headless:
+        cv2.destroyAllWindows()
+    print_summary()
+    sys.exit(0)
 
 class VideoReader:
     def __init__(self, source):
@@ -52,156 +79,198 @@ class VideoReader:
             raise ValueError(f"Failed to open video source: {source}")
         logger.debug(f"Video FPS: {self.cap.get(cv2.CAP_PROP_FPS)}")
         logger.debug(f"Video frame count: {self.cap.get(cv2.CAP_PROP_FRAME_COUNT)}")
-        self.q = queue.Queue(maxsize=10)
+        self.shape = (int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
         self.running = True
         self.frame_count = 0
-        self.condition = threading.Condition()
-        self.thread = threading.Thread(target=self._reader)
-        self.thread.daemon = True
-        self.thread.start()
-        time.sleep(0.5)
+        self.max_retries = 5
 
-    def _reader(self):
+    def read_into(self, buf):
+        """Decode the next frame directly into `buf`; False once the source is exhausted."""
         retry_count = 0
-        max_retries = 5
-        while self.running and retry_count < max_retries:
-            with self.condition:
-                while self.q.full() and self.running:
-                    #logger.debug("Queue full, read-thread waiting")
-                    self.condition.wait()
-                if not self.running:
-                    break
-                ret, frame = self.cap.read()
-                if not ret or frame is None:
-                    retry_count += 1
-                    logger.warning(f"Failed to read frame (attempt {retry_count}/{max_retries})")
-                    time.sleep(0.5)
-                    continue
-                self.q.put(frame)
+        while self.running and retry_count < self.max_retries:
+            ret, frame = self.cap.read(buf)
+            if ret and frame is not None:
+                if frame is not buf:
+                    np.copyto(buf, frame)
                 self.frame_count += 1
-                #logger.debug(f"Frame read, frame {self.frame_count}, queue size: {self.q.qsize()}")
-                retry_count = 0
-                time.sleep(0.005)
-        if retry_count >= max_retries:
-            #logger.error("Max retries reached, stopping reader thread")
-            self.running = False
+                return True
+            if self.total_frames > 0:
+                # A video file: a failed read is the end of the file (the frame
+                # count in the header can overstate it), nothing to retry
+                break
+            retry_count += 1
+            logger.warning(f"Failed to read frame (attempt {retry_count}/{self.max_retries})")
+            time.sleep(0.5)
+        self.running = False
+        return False
 
     def read(self):
-        with self.condition:
-            frame = None
-            try:
-                frame = self.q.get_nowait()
-                self.condition.notify()
-            except queue.Empty:
-                pass
-            return frame
+        buf = np.empty(self.shape, np.uint8)
+        return buf if self.read_into(buf) else None
 
     def release(self):
         self.running = False
-        with self.condition:
-            self.condition.notify()
         self.cap.release()
         logger.debug("VideoCapture released")
 
 class PiCameraReader:
     def __init__(self):
         logger.debug("Initializing PiCameraReader")
+        # Imported here so video input (and offline replay) works without picamera2
+        from picamera2 import Picamera2
         self.camera = Picamera2()
         config_cam = self.camera.create_video_configuration(main={"size": (320, 240), "format": "RGB888"})
         self.camera.configure(config_cam)
         self.camera.start()
-        self.q = queue.Queue(maxsize=10)
+        self.shape = (240, 320, 3)
         self.running = True
         self.frame_count = 0
-        self.condition = threading.Condition()
-        self.thread = threading.Thread(target=self._reader)
-        self.thread.daemon = True
-        self.thread.start()
-        time.sleep(0.5)
-
-    def _reader(self):
-        while self.running:
-            with self.condition:
-                while self.q.full() and self.running:
-                    #logger.debug("Queue full, read-thread waiting")
-                    self.condition.wait()
-                if not self.running:
-                    break
-                frame = self.camera.capture_array()
-                if frame is not None:
-                    self.q.put(frame)
-                    self.frame_count += 1
-                    #logger.debug(f"Frame read, frame {self.frame_count}, queue size: {self.q.qsize()}")
-                time.sleep(0.005)
+
+    def read_into(self, buf):
+        """Capture the next frame into `buf`; False once the camera is released."""
+        if not self.running:
+            return False
+        frame = self.camera.capture_array()
+        if frame is None:
+            return False
+        np.copyto(buf, frame)
+        self.frame_count += 1
+        return True
 
     def read(self):
-        with self.condition:
-            frame = None
-            try:
-                frame = self.q.get_nowait()
-                self.condition.notify()
-            except queue.Empty:
-                pass
-            return frame
+        buf = np.empty(self.shape, np.uint8)
+        return buf if self.read_into(buf) else None
 
     def release(self):
         self.running = False
-        with self.condition:
-            self.condition.notify()
         self.camera.stop()
         logger.debug("PiCamera released")
 
-def process_frames(source, process_q, display_q, tb_client, server_IP, port, token):
-    #Background Substractor
-    fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=True)
-
-    #Structuring elements for morphographic filters
-    kernelOp = np.ones((3,3),np.uint8)
-    kernelOp2 = np.ones((5,5),np.uint8)
-    kernelCl = np.ones((11,11),np.uint8)
+def open_source(name):
+    """PiCameraReader for 'picam', StreamReader for rtsp/http URLs, else VideoReader."""
+    if name.lower() == "picam":
+        logger.debug("Using PiCamera")
+        return PiCameraReader()
+    if is_stream(name):
+        logger.debug(f"Using network stream: {name}")
+        return StreamReader(name)
+    logger.debug(f"Using video file: {name}")
+    source = VideoReader(name)
+    source.cap.set(3, 500) #Width
+    source.cap.set(4, 500) #Height
+    return source
+
+def process_frames(source, pool, display_q, tb_client, *, mask_variant="close",
+                   max_track_age=5, hungarian=False, debug_every=0, debug_dir="debug_frames", scheduler=None,
+                   roi="full", roi_margin=None, roi_polygon=None, seg_scale=1.0, geometry=None,
+                   metrics=None, metrics_summary=False, event_log=None, background=None,
+                   blob_method="contours"):
+    # Options after tb_client are keyword-only, so adding one cannot shift the others.
+    # Frames live in `pool`; the capture -> segment -> track -> render stages
+    # each run on their own thread and hand each other slot indices.
+    # With display_q=None (headless) nothing is drawn; the render stage is
+    # replaced by an optional debug stage writing every `debug_every`th
+    # overlaid frame to `debug_dir`. An AdaptiveScheduler, if given, drops
+    # frames before segmentation while nothing moves near the counting lines.
+    # roi="band" segments only the rows between the limit lines plus roi_margin
+    # (default: one line spacing, h/6, so tall blobs are not clipped),
+    # roi_polygon only its bounding box with pixels outside it masked, and
+    # seg_scale < 1 segments a downscaled copy; blobs come back in frame space.
+    # Video files lose their left VIDEO_CROP_LEFT columns first, and lines,
+    # band and polygon are all in the coordinates of that cropped view.
+    # `geometry` (CountingGeometry) defines the lines, default h/6 spacing.
+    # Stage and step latencies, queue depths and drops are recorded in
+    # `metrics` (a MetricsRegistry); with metrics_summary their percentiles
+    # are also published with the FPS every 10 s.
+    # Crossings are appended to `event_log` (an EventLog) if given.
+    # `background` (a BackgroundModel) replaces the plain MOG2 subtractor.
+    # blob_method="components" extracts blobs with one connected-components
+    # pass instead of per-contour calls (faster on very noisy masks).
+
+    #Background subtraction + morphology, one MOG2 pass per frame
+    segmenter = ForegroundSegmenter(variant=mask_variant, scale=seg_scale, subtractor=background,
+                                    blob_method=blob_method)
+
+    #Hot-path timers, one histogram per step inside the stages
+    if metrics is None:
+        metrics = MetricsRegistry()
+    step_help = "Latency of one step inside a pipeline stage"
+    mog2_hist = metrics.histogram("step_seconds", step_help, step="mog2")
+    morphology_hist = metrics.histogram("step_seconds", step_help, step="morphology")
+    contours_hist = metrics.histogram("step_seconds", step_help, step="contours")
+    tracking_hist = metrics.histogram("step_seconds", step_help, step="tracking")
+    publish_hist = metrics.histogram("step_seconds", step_help, step="publish")
 
     #Variables
     font = cv2.FONT_HERSHEY_SIMPLEX
-    persons = []
-    max_p_age = 1
-    pid = 1
-    back = None
     cnt_up = 0
     cnt_down = 0
     frame_count = 0
     start_time = time.time()
 
-    #Lines coordinate for counting
-    h, w = 240, 320  # Default for PiCamera, updated for video
-    frameArea = h * w
-    areaTH = frameArea / 300
-    line_up = int(1 * (h / 6))
-    line_down = int(4 * (h / 6))
-    up_limit = int(0.5 * (h / 6))
-    down_limit = int(4.5 * (h / 6))
-    line_down_color = (255,0,0)
-    line_up_color = (0,0,255)
-    pt1 = [0, line_down]
-    pt2 = [w, line_down]
-    pts_L1 = np.array([pt1,pt2], np.int32).reshape((-1,1,2))
-    pt3 = [0, line_up]
-    pt4 = [w, line_up]
-    pts_L2 = np.array([pt3,pt4], np.int32).reshape((-1,1,2))
-    pt5 = [0, up_limit]
-    pt6 = [w, up_limit]
-    pts_L3 = np.array([pt5,pt6], np.int32).reshape((-1,1,2))
-    pt7 = [0, down_limit]
-    pt8 = [w, down_limit]
-    pts_L4 = np.array([pt7,pt8], np.int32).reshape((-1,1,2))
-
-    while running:
-        frame = source.read()
-        if frame is None:
-            if source.q.qsize() == 0:
-                logger.debug("No more frames, stopping process thread")
-                display_q.put((None, cnt_up, cnt_down))
-                break
-            continue
+    #Lines coordinate for counting, derived once per frame shape
+    if geometry is None:
+        geometry = CountingGeometry()
+    tracker = tracking.CentroidTracker(0, 0, 0, 0, max_age=max_track_age, hungarian=hungarian)
+
+    def apply_geometry(shape):
+        # Lines, band, ROI and draw primitives only change with the frame shape
+        if not geometry.update(shape):
+            return
+        tracker.set_lines(*geometry.lines)
+        if scheduler is not None:
+            scheduler.set_band(geometry.up_limit, geometry.down_limit)
+        if roi_polygon is not None:
+            segmenter.set_roi(polygon=roi_polygon)
+        elif geometry.roi_polygon is not None:
+            segmenter.set_roi(polygon=geometry.roi_polygon)
+        elif roi == "band":
+            segmenter.set_roi(geometry.band(roi_margin))
+
+    crop_left = VIDEO_CROP_LEFT if isinstance(source, VideoReader) else 0
+    apply_geometry((source.shape[0], source.shape[1] - crop_left))
+
+    def capture(slot):
+        return source.read_into(pool.frames[slot])
+
+    def segment(slot):
+        meta = pool.meta[slot]
+        frame = pool.frames[slot][:, crop_left:]
+        apply_geometry(frame.shape)
+        # Cropped view into the pool buffer, drawn on and displayed in place
+        meta["view"] = frame
+
+        # Cheap motion probe; skip the full path while the doorway is quiet
+        if scheduler is not None and not scheduler.should_process(frame):
+            return pipeline_mod.DROP
+
+        #Apply background subtraction
+        start = time.perf_counter()
+        try:
+            mask = segmenter.apply(frame)
+        except cv2.error:
+            logger.debug("Processing error, stopping process thread")
+            return False
+        mask_done = time.perf_counter()
+        mog2_hist.observe(segmenter.mog2_seconds)
+        morphology_hist.observe(mask_done - start - segmenter.mog2_seconds)
+
+        #################
+        #   CONTOURS   #
+        #################
+
+        # Blobs of the ROI mask, mapped back to frame coordinates
+        centroids, sizes, rects = segmenter.blobs(mask, geometry.area_threshold)
+        contours_hist.observe(time.perf_counter() - mask_done)
+        meta["centroids"] = centroids
+        meta["sizes"] = sizes
+        meta["rects"] = rects
+        return True
+
+    def track(slot):
+        nonlocal cnt_up, cnt_down, frame_count, start_time
+        meta = pool.meta[slot]
 
         frame_count += 1
         current_time = time.time()
@@ -209,191 +278,155 @@ def process_frames(source, process_q, display_q, tb_client, server_IP, port, tok
         if elapsed_time >= 10:
             fps = frame_count / elapsed_time
             fps_values.append(fps)
-            tb_client.send_telemetry(server_IP, port, token, "FPS", round(fps, 2))
+            tb_client.publish("FPS", round(fps, 2))
+            logger.debug(f"Pipeline stats: {pipeline.stats()}")
+            if scheduler is not None:
+                logger.debug(f"Scheduler stats: {scheduler.stats()}")
+            if metrics_summary:
+                tb_client.publish_many(metrics.summary())
             frame_count = 0
             start_time = current_time
 
-        # Update dimensions for video files
-        if isinstance(source, VideoReader):
-            h, w = frame.shape[:2]
-            frameArea = h * w
-            areaTH = frameArea / 300
-            line_up = int(1 * (h / 6))
-            line_down = int(4 * (h / 6))
-            up_limit = int(0.5 * (h / 6))
-            down_limit = int(4.5 * (h / 6))
-            pt1 = [0, line_down]
-            pt2 = [w, line_down]
-            pts_L1 = np.array([pt1,pt2], np.int32).reshape((-1,1,2))
-            pt3 = [0, line_up]
-            pt4 = [w, line_up]
-            pts_L2 = np.array([pt3,pt4], np.int32).reshape((-1,1,2))
-            pt5 = [0, up_limit]
-            pt6 = [w, up_limit]
-            pts_L3 = np.array([pt5,pt6], np.int32).reshape((-1,1,2))
-            pt7 = [0, down_limit]
-            pt8 = [w, down_limit]
-            pts_L4 = np.array([pt7,pt8], np.int32).reshape((-1,1,2))
-            frame = frame[:,20:]
-
-        #Apply background subtraction
-        fgmask = fgbg.apply(frame)
-        fgmask2 = fgbg.apply(frame)
-
-        #Binarization to eliminate shadows
-        try:
-            ret, imBin = cv2.threshold(fgmask, 200, 255, cv2.THRESH_BINARY)
-            ret, imBin2 = cv2.threshold(fgmask2, 200, 255, cv2.THRESH_BINARY)
-            #Opening (erode->dilate) to remove noise.
-            mask = cv2.morphologyEx(imBin, cv2.MORPH_OPEN, kernelOp)
-            mask2 = cv2.morphologyEx(imBin2, cv2.MORPH_OPEN, kernelOp)
-            #Closing (dilate -> erode) to join white regions.
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernelCl)
-            mask2 = cv2.morphologyEx(mask2, cv2.MORPH_CLOSE, kernelCl)
-            if back is None:
-                back = mask
-                continue
-            mask = cv2.absdiff(back, mask)
-        except:
-            logger.debug("Processing error, stopping process thread")
-            display_q.put((None, cnt_up, cnt_down))
-            break
+        #################
+        #   TRACKING    #
+        #################
+        # All blobs are associated with all tracks in one vectorized step
+        start = time.perf_counter()
+        track_ids, events = tracker.update(meta["centroids"], meta["sizes"])
+        tracking_hist.observe(time.perf_counter() - start)
+        for track_id, direction, cx, cy in events:
+            if direction == tracking.UP:
+                cnt_up += 1
+                logger.debug(f"ID: {track_id} crossed going out")
+            else:
+                cnt_down += 1
+                logger.debug(f"ID: {track_id} crossed going in")
+            if event_log is not None:
+                event_log.log(track_id, direction, cx, cy)
+        if events:
+            # Queue telemetry (coalesced and sent by the publisher thread)
+            start = time.perf_counter()
+            tb_client.publish_many({"exited_people": cnt_up, "entered_people": cnt_down,
+                                    "people_inside": cnt_down - cnt_up})
+            publish_hist.observe(time.perf_counter() - start)
+        meta["counts"] = (cnt_up, cnt_down)
+        return True
+
+    def draw_overlay(meta):
+        frame = meta["view"]
+        up, down = meta["counts"]
 
         #################
-        #   CONTOURS   #
+        #   DRAWINGS     #
         #################
-        
-        # RETR_EXTERNAL returns only extreme outer flags. All child contours are left behind.
-        contours0, hierarchy = cv2.findContours(mask2, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        for cnt in contours0:
-            rect = cv2.boundingRect(cnt)
-            
-            area = cv2.contourArea(cnt)
-            if area > areaTH:
-                #################
-                #   TRACKING    #
-                #################
-                
-                #Missing conditions for multipersons, outputs and screen entries
-                M = cv2.moments(cnt)
-                cx = int(M['m10']/M['m00'])
-                cy = int(M['m01']/M['m00'])
-                x,y,w,h = cv2.boundingRect(cnt)
-                # print ('working')
-                
-                new = True
-                if cy in range(up_limit, down_limit):
-                    for i in persons:
-                        if abs(cx-i.getX()) <= w and abs(cy-i.getY()) <= h:
-                            # the object is close to one that has already been detected before
-                            # print 'update'
-                            new = False
-                            i.updateCoords(cx,cy)   #update coordinates in the object and resets age
-                            if i.going_UP(line_down,line_up) == True and i.getDir() == 'up':
-                                # if w > 100:
-                                #     count_up = w/60
-                                #     #cnt_up += count_up
-                                  
-                                # else:    
-                                #     cnt_up += 1
-                                cnt_up += 1
-                                #i.updateCoords(cx,cy)
-                                print ("ID:",i.getId(),'crossed going out at',time.strftime("%c"))
-                                # Send telemetry
-                                tb_client.send_telemetry(server_IP, port, token, "exited_people", cnt_up)
-                                tb_client.send_telemetry(server_IP, port, token, "entered_people", cnt_down)
-                                tb_client.send_telemetry(server_IP, port, token, "people_inside", cnt_down - cnt_up)
-                            elif i.going_DOWN(line_down,line_up) == True and i.getDir() == 'down':
-                                # if w > 100:
-                                #     count_down = w/60
-                                #     #cnt_down += count_down
-                                # else:
-                                #     cnt_down += 1
-                                #i.updateCoords(cx,cy)
-                                cnt_down += 1
-                                print ("ID:",i.getId(),'crossed going in at',time.strftime("%c"))
-                                # Send telemetry
-                                tb_client.send_telemetry(server_IP, port, token, "exited_people", cnt_up)
-                                tb_client.send_telemetry(server_IP, port, token, "entered_people", cnt_down)
-                                tb_client.send_telemetry(server_IP, port, token, "people_inside", cnt_down - cnt_up)
-                            break
-                        if i.getState() == '1':
-                            if i.getDir() == 'down' and i.getY() > down_limit:
-                                i.setDone()
-                            elif i.getDir() == 'up' and i.getY() < up_limit:
-                                i.setDone()
-                        if i.timedOut():
-                            #get out of the people list
-                            index = persons.index(i)
-                            persons.pop(index)
-                            del i     #free the memory of i
-                    if new == True:
-                        p = Person.MyPerson(pid,cx,cy, max_p_age)
-                        persons.append(p)
-                        pid += 1    
-              
-                #################
-                #   DRAWINGS     #
-                #################
-                cv2.circle(frame,(cx,cy), 5, (0,0,255), -1)
-                img = cv2.rectangle(frame,(x,y),(x+w,y+h),(0,255,0),1)            
-                #cv2.drawContours(frame, cnt, -1, (0,255,0), 3)
-        
-        #END for cnt in contours0
-                
-        #########################
-        # DRAWING TRAJECTORIES  #
-        #########################
-        #for i in persons:
-        ##        if len(i.getTracks()) >= 2:
-        ##            pts = np.array(i.getTracks(), np.int32)
-        ##            pts = pts.reshape((-1,1,2))
-        ##            frame = cv2.polylines(frame,[pts],False,i.getRGB())
-        ##        if i.getId() == 9:
-        ##            print str(i.getX()), ',', str(i.getY())
-            #cv2.putText(frame, str(i.getId()),(i.getX(),i.getY()),font,0.3,i.getRGB(),1,cv2.LINE_AA)
-            
+        for (cx, cy), (x, y, bw, bh) in zip(meta["centroids"], meta["rects"]):
+            cv2.circle(frame,(cx,cy), 5, (0,0,255), -1)
+            cv2.rectangle(frame,(x,y),(x+bw,y+bh),(0,255,0),1)
+
         #################
         # DISPLAY ON FRAME    #
         #################
-        str_up = 'Out: '+ str(cnt_up)
-        str_down = 'In: '+ str(cnt_down)
-        frame = cv2.polylines(frame,[pts_L1],False,line_down_color,thickness=2)
-        frame = cv2.polylines(frame,[pts_L2],False,line_up_color,thickness=2)
-        frame = cv2.polylines(frame,[pts_L3],False,(255,255,255),thickness=1)
-        frame = cv2.polylines(frame,[pts_L4],False,(255,255,255),thickness=1)
+        str_up = 'Out: '+ str(up)
+        str_down = 'In: '+ str(down)
+        geometry.draw(frame)
         cv2.putText(frame, str_up ,(20,70),font,0.5,(255,255,255),2,cv2.LINE_AA)
         cv2.putText(frame, str_down ,(20,100),font,0.5,(255,255,255),2,cv2.LINE_AA)
-        # out.write(frame)
-
-        # Put processed frame in display queue
-        display_q.put((frame, cnt_up, cnt_down))
+        return frame
+
+    def render(slot):
+        meta = pool.meta[slot]
+        draw_overlay(meta)
+        # Hand the slot to the display loop, which releases it after showing it
+        up, down = meta["counts"]
+        display_q.put((slot, up, down))
+        return pipeline_mod.HANDOFF
+
+    debug_frames = 0
+    def debug_dump(slot):
+        # Opt-in overlay stream for headless units: every Nth frame to disk
+        nonlocal debug_frames
+        debug_frames += 1
+        if debug_frames % debug_every == 0:
+            frame = draw_overlay(pool.meta[slot])
+            cv2.imwrite(os.path.join(debug_dir, f"frame_{debug_frames:08d}.jpg"), frame)
+        return True
+
+    stages = [("capture", capture), ("segment", segment), ("track", track)]
+    if display_q is not None:
+        stages.append(("render", render))
+    elif debug_every:
+        os.makedirs(debug_dir, exist_ok=True)
+        stages.append(("debug", debug_dump))
+
+    global frame_pipeline
+    pipeline = pipeline_mod.FramePipeline(pool, stages)
+    frame_pipeline = pipeline
+
+    # Stage-level metrics read straight from the pipeline's own counters
+    for index, (name, _) in enumerate(stages):
+        stats = pipeline.stats_by_stage[index]
+        metrics.histogram("stage_seconds", "Latency of one pipeline stage per frame", hist=stats.hist, stage=name)
+        metrics.gauge("stage_frames_total", lambda stats=stats: stats.count, "Frames handled by the stage",
+                      kind="counter", stage=name)
+        metrics.gauge("stage_drops_total", lambda stats=stats: stats.drops,
+                      "Frames dropped by the stage (adaptive scheduler skips)", kind="counter", stage=name)
+        metrics.gauge("stage_queue_depth", lambda index=index: pipeline.queue_depth(index),
+                      "Slots waiting in front of the stage (free slots for capture)", stage=name)
+    metrics.gauge("pool_in_use", pool.in_use, "Frame buffers currently in flight")
+    if isinstance(source, StreamReader):
+        metrics.histogram("stream_frame_age_seconds", "Time from decode to hand-out of a stream frame",
+                          hist=source.age_hist)
+        for key in ("dropped", "reconnects"):
+            metrics.gauge(f"stream_{key}_total", lambda key=key: source.counters[key],
+                          f"Stream frames {key}" if key == "dropped" else "Stream reconnects", kind="counter")
+    if display_q is not None:
+        metrics.gauge("display_queue_depth", display_q.qsize, "Frames waiting for the display loop")
+    if background is not None:
+        for state in ("static", "learn", "relearn"):
+            metrics.gauge("background_frames_total", lambda state=state: background.counters[state],
+                          "Frames per background-model update decision", kind="counter", decision=state)
+    metrics.gauge("fps", lambda: round(fps_values[-1], 2) if fps_values else None, "Last 10 s average FPS")
+    if stop_event.is_set():
+        return
+    pipeline.start()
+    # Blocks until end of stream or shutdown() stops the stages
+    pipeline.join()
+    logger.debug("No more frames, stopping process thread")
+    logger.debug(f"Pipeline stats: {pipeline.stats()}")
+    if display_q is not None:
+        display_q.put((None, cnt_up, cnt_down))
+    else:
+        print('EOF')
+        print(('Out:'), cnt_up)
+        print(('In:'), cnt_down)
+    return cnt_up, cnt_down
 
-def monitor_resources(tb_client, server_IP, port, token):
+def monitor_resources(tb_client):
     global cpu_usages, memory_usages, temperatures
-    last_time = time.time()
-    while running:
-        current_time = time.time()
-        if current_time - last_time >= 10:
-            cpu_usage = psutil.cpu_percent(interval=None)
-            memory_usage = psutil.virtual_memory().percent
-            try:
-                with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-                    temp = int(f.read()) / 1000.0
-            except:
-                temp = 0.0  # Fallback if temp not available
-            cpu_usages.append(cpu_usage)
-            memory_usages.append(memory_usage)
-            temperatures.append(temp)
-            tb_client.send_telemetry(server_IP, port, token, "CPU_usage", round(cpu_usage, 2))
-            tb_client.send_telemetry(server_IP, port, token, "memory_usage", round(memory_usage, 2))
-            tb_client.send_telemetry(server_IP, port, token, "Temperature", round(temp, 2))
-            last_time = current_time
-        time.sleep(1)
+    # Imported on this thread so it does not delay the first frame
+    try:
+        import psutil
+    except ImportError:
+        logger.warning("psutil is not installed, resource monitoring is disabled")
+        return
+    # Sample every 10 s; wait() returns early (True) as soon as shutdown starts
+    while not stop_event.wait(10):
+        cpu_usage = psutil.cpu_percent(interval=None)
+        memory_usage = psutil.virtual_memory().percent
+        try:
+            with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
+                temp = int(f.read()) / 1000.0
+        except:
+            temp = 0.0  # Fallback if temp not available
+        cpu_usages.append(cpu_usage)
+        memory_usages.append(memory_usage)
+        temperatures.append(temp)
+        tb_client.publish_many({"CPU_usage": round(cpu_usage, 2), "memory_usage": round(memory_usage, 2),
+                                "Temperature": round(temp, 2)})
 
 def main():
-    global running, source, cpu_usages, memory_usages, temperatures, tb_client, fps_values
-    running = True
+    global source, cpu_usages, memory_usages, temperatures, tb_client, fps_values, headless, event_log
+    stop_event.clear()
     cpu_usages = []
     memory_usages = []
     temperatures = []
@@ -402,48 +435,167 @@ def main():
     # Parse command-line arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--input", type=str, default="picam",
-                        help="Input source: video file path or 'picam' for PiCamera")
+                        help="Input source: video file path, rtsp:// or http:// stream URL, or 'picam' for PiCamera")
+    parser.add_argument("--sink", type=str, default="",
+                        help=f"Telemetry sink: {', '.join(SINKS)}; file:<path>, udp:<host>[:<port>] "
+                             "(default: mqtt with --server-IP/--Port/--token, else null)")
     parser.add_argument("-s", "--server-IP", type=str, default="",
                         help="ThingsBoard server domain")
     parser.add_argument("-P", "--Port", type=int, default=0,
                         help="MQTT port for ThingsBoard server")
     parser.add_argument("-a", "--token", type=str, default="",
                         help="Device access token for ThingsBoard authentication")
+    parser.add_argument("-m", "--mask-variant", type=str, default="close", choices=MASK_VARIANTS,
+                        help="Foreground mask stage fed to findContours")
+    parser.add_argument("--blob-method", type=str, default="contours", choices=BLOB_METHODS,
+                        help="Blob extraction: per-contour measures or one connected-components pass")
+    parser.add_argument("--geometry", type=str, default="",
+                        help="JSON file with counting lines / ROI polygon (default: lines at h/6 spacing)")
+    parser.add_argument("--roi", type=str, default="full", choices=("full", "band"),
+                        help="Segment the whole frame or only the band between the limit lines")
+    parser.add_argument("--roi-margin", type=int, default=None,
+                        help="--roi band: rows added above and below the limit lines (default: frame height / 6)")
+    parser.add_argument("--roi-polygon", type=str, default="",
+                        help="Segment only inside this polygon, given as 'x,y x,y x,y ...' (overrides --roi); "
+                             f"for video files x is counted after the {VIDEO_CROP_LEFT} px left crop")
+    parser.add_argument("--seg-scale", type=float, default=1.0,
+                        help="Downscale factor for segmentation (e.g. 0.5); blobs are mapped back to full size")
+    parser.add_argument("--bg-method", type=str, default="mog2", choices=BG_METHODS,
+                        help="Background model: MOG2, KNN or a running average")
+    parser.add_argument("--bg-gate", action="store_true",
+                        help="Skip background updates on static frames and relearn quickly after lighting changes")
+    parser.add_argument("--bg-no-shadows", action="store_true",
+                        help="Disable shadow detection in the background model")
+    parser.add_argument("--bg-scale", type=float, default=1.0,
+                        help="Run the background model on a copy downscaled by this factor")
+    parser.add_argument("--max-track-age", type=int, default=5,
+                        help="Frames a track may go undetected before it is dropped")
+    parser.add_argument("--hungarian", action="store_true",
+                        help="Use optimal (Hungarian) blob-to-track assignment, requires scipy")
+    parser.add_argument("--headless", action="store_true",
+                        help="No GUI, drawing or display queue; the main thread only supervises")
+    parser.add_argument("--debug-every", type=int, default=0,
+                        help="Headless only: write every Nth frame with overlays to --debug-dir (0 = off)")
+    parser.add_argument("--debug-dir", type=str, default="debug_frames",
+                        help="Directory for --debug-every overlay frames")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Only run segmentation/tracking at full rate while there is motion near the lines")
+    parser.add_argument("--probe", type=str, default="mog2", choices=PROBES,
+                        help="Cheap motion probe used by --adaptive")
+    parser.add_argument("--active-every", type=int, default=1,
+                        help="--adaptive: process one frame in N while motion is present")
+    parser.add_argument("--idle-every", type=int, default=6,
+                        help="--adaptive: process one frame in N while the doorway is quiet")
+    parser.add_argument("--motion-on", type=float, default=0.01,
+                        help="--adaptive: moving-pixel fraction that switches to the active rate")
+    parser.add_argument("--motion-off", type=float, default=0.004,
+                        help="--adaptive: moving-pixel fraction under which the scene is quiet")
+    parser.add_argument("--hold-frames", type=int, default=15,
+                        help="--adaptive: quiet frames before dropping back to the idle rate")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="Serve Prometheus-style metrics on http://<metrics-host>:<port>/metrics (0 = off)")
+    parser.add_argument("--metrics-host", type=str, default="127.0.0.1",
+                        help="Address the metrics endpoint binds to")
+    parser.add_argument("--metrics-summary", action="store_true",
+                        help="Also publish stage latency percentiles with the FPS telemetry every 10 s")
+    parser.add_argument("--event-log", type=str, default="",
+                        help="Append every crossing to this binary event log (disabled if empty)")
+    parser.add_argument("--event-log-mmap", action="store_true",
+                        help="Write the event log through a memory map instead of write() calls")
+    parser.add_argument("--pool-size", type=int, default=4,
+                        help="Number of preallocated frame buffers shared by the pipeline stages")
+    parser.add_argument("--flush-interval", type=float, default=1.0,
+                        help="Seconds between coalesced telemetry publishes")
+    parser.add_argument("--telemetry-queue", type=int, default=256,
+                        help="Max queued telemetry updates before new ones are dropped")
+    parser.add_argument("--spool", type=str, default="",
+                        help="SQLite file that stores telemetry while offline (disabled if empty)")
+    parser.add_argument("--spool-max-rows", type=int, default=100000,
+                        help="Max spooled telemetry records; oldest are evicted first")
+    parser.add_argument("--replay-rate", type=float, default=20.0,
+                        help="Max spooled records replayed per second after reconnecting")
     args = parser.parse_args()
-
-    if not args.server_IP or not args.Port or not args.token:
-        print("Error: --server-IP, --Port, and --token are required")
+    headless = args.headless
+
+    sink = args.sink
+    if not sink:
+        sink = "mqtt" if args.server_IP and args.Port and args.token else "null"
+        if sink == "null":
+            logger.warning("No ThingsBoard server given (--server-IP, --Port, --token), telemetry is discarded")
+
+    # Initialize the telemetry sink (connects and sends off the processing thread);
+    # backends are imported only once selected, so importing this module stays cheap
+    spool = None
+    if args.spool:
+        from telemetry_spool import TelemetrySpool
+        spool = TelemetrySpool(args.spool, max_rows=args.spool_max_rows)
+    try:
+        tb_client = open_sink(sink, args.server_IP, args.Port, args.token, spool=spool, replay_rate=args.replay_rate,
+                              flush_interval=args.flush_interval, max_queue=args.telemetry_queue).start()
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
         sys.exit(1)
-
-    # Initialize ThingsBoard client
-    tb_client = MQTTThingsBoardClient()
+    signal.signal(signal.SIGINT, signal_handler)
 
     # Initialize input source
-    if args.input.lower() == "picam":
-        logger.debug("Using PiCamera")
-        source = PiCameraReader()
-    else:
-        logger.debug(f"Using video file: {args.input}")
-        source = VideoReader(args.input)
-        source.cap.set(3, 500) #Width
-        source.cap.set(4, 500) #Height
-
-    # Initialize queues
-    process_q = queue.Queue(maxsize=10)
-    display_q = queue.Queue(maxsize=5)
+    source = open_source(args.input)
+
+    scheduler = None
+    if args.adaptive:
+        scheduler = AdaptiveScheduler(probe=args.probe, on_level=args.motion_on, off_level=args.motion_off,
+                                      hold_frames=args.hold_frames, active_every=args.active_every,
+                                      idle_every=args.idle_every)
+
+    roi_polygon = None
+    if args.roi_polygon:
+        roi_polygon = [tuple(int(v) for v in point.split(",")) for point in args.roi_polygon.split()]
+
+    geometry = CountingGeometry.from_file(args.geometry) if args.geometry else CountingGeometry()
+
+    # Plain MOG2 unless another background model or update policy is selected
+    background = None
+    if args.bg_method != "mog2" or args.bg_gate or args.bg_no_shadows or args.bg_scale != 1.0:
+        background = BackgroundModel(args.bg_method, shadows=not args.bg_no_shadows, scale=args.bg_scale,
+                                     gate=args.bg_gate)
+
+    # Metrics registry; the sink's counters are read only when scraped
+    metrics = MetricsRegistry()
+    for key in ("queued", "dropped", "sent", "failed", "reconnects", "spooled", "replayed"):
+        metrics.gauge(f"telemetry_{key}_total", lambda key=key: tb_client.stats().get(key, 0),
+                      f"Telemetry updates/payloads {key}", kind="counter")
+    metrics.gauge("telemetry_backlog", lambda: tb_client.stats()["backlog"], "Telemetry updates waiting to be sent")
+    metrics.histogram("telemetry_publish_seconds", "Time the telemetry sink takes to send one batch",
+                      hist=tb_client.publish_hist, sink=sink.partition(":")[0])
+    event_log = None
+    if args.event_log:
+        event_log = EventLog(args.event_log, use_mmap=args.event_log_mmap).start()
+        for key in ("written", "dropped"):
+            metrics.gauge(f"event_log_{key}_total", lambda key=key: event_log.stats()[key],
+                          f"Crossing events {key}", kind="counter")
+    if args.metrics_port:
+        MetricsServer(metrics, args.metrics_host, args.metrics_port).start()
+
+    # Initialize frame buffer pool and display queue
+    pool = pipeline_mod.FramePool(args.pool_size, source.shape)
+    display_q = None if headless else queue.Queue(maxsize=args.pool_size)
 
     # Start processing thread
-    process_thread = threading.Thread(target=process_frames, args=(source, process_q, display_q, tb_client, args.server_IP, args.Port, args.token))
+    process_thread = threading.Thread(target=process_frames, args=(source, pool, display_q, tb_client),
+                                      kwargs=dict(mask_variant=args.mask_variant, max_track_age=args.max_track_age,
+                                                  hungarian=args.hungarian, debug_every=args.debug_every,
+                                                  debug_dir=args.debug_dir, scheduler=scheduler, roi=args.roi,
+                                                  roi_margin=args.roi_margin, roi_polygon=roi_polygon,
+                                                  seg_scale=args.seg_scale, geometry=geometry, metrics=metrics,
+                                                  metrics_summary=args.metrics_summary, event_log=event_log,
+                                                  background=background, blob_method=args.blob_method))
     process_thread.daemon = True
     process_thread.start()
 
     # Start resource monitoring thread
-    monitor_thread = threading.Thread(target=monitor_resources, args=(tb_client, args.server_IP, args.Port, args.token))
+    monitor_thread = threading.Thread(target=monitor_resources, args=(tb_client,))
     monitor_thread.daemon = True
     monitor_thread.start()
 
-    url = "http://10.10.7.148:8080/video"
-
     cnt_up = 0
     cnt_down = 0
     #count_up = 0    # Unused variable
@@ -452,49 +604,48 @@ def main():
     #rect_co = []  # Unused variable
     #val = []      # Unused variable
 
-    # Main loop for display
-    while running:
+    if headless:
+        # Supervise only: wait for end of stream (or Ctrl+C via signal_handler)
+        process_thread.join()
+        print_summary()
+        shutdown()
+        tb_client.disconnect()
+        if event_log is not None:
+            event_log.close()
+        source.release()
+        return
+
+    # Main loop for display: blocks for the next rendered frame, waking at
+    # least every 100 ms only to pump GUI events and check for ESC
+    while not stop_event.is_set():
         try:
-            frame_data = display_q.get_nowait()
-            frame, cnt_up, cnt_down = frame_data
-            if frame is None:
+            frame_data = display_q.get(timeout=0.1)
+        except queue.Empty:
+            frame_data = None
+        if frame_data is not None:
+            slot, cnt_up, cnt_down = frame_data
+            if slot is None:
                 print('EOF')
                 print(('Out:'), cnt_up)
                 print(('In:'), cnt_down)
-                running = False
-                # Print average resource usage
-                if cpu_usages:
-                    print(f"Average CPU Usage: {sum(cpu_usages)/len(cpu_usages):.2f}%")
-                if memory_usages:
-                    print(f"Average Memory Usage: {sum(memory_usages)/len(memory_usages):.2f}%")
-                if temperatures:
-                    print(f"Average Temperature: {sum(temperatures)/len(temperatures):.2f}°C")
-                if fps_values:
-                    print(f"Average FPS: {sum(fps_values)/len(fps_values):.2f}")
+                print_summary()
                 break
-            cv2.imshow('Counting', frame)
+            cv2.imshow('Counting', pool.meta[slot]["view"])
             #cv2.imshow('track',mask)
-            #cv2.imshow('Mask',mask)    
-        except queue.Empty:
-            pass
+            #cv2.imshow('Mask',mask)
+            pool.release(slot)
 
         #Press ESC to exit
-        k = cv2.waitKey(30) & 0xff
+        k = cv2.waitKey(1) & 0xff
         if k == 27:
-            running = False
-            # Print average resource usage
-            if cpu_usages:
-                print(f"Average CPU Usage: {sum(cpu_usages)/len(cpu_usages):.2f}%")
-            if memory_usages:
-                print(f"Average Memory Usage: {sum(memory_usages)/len(memory_usages):.2f}%")
-            if temperatures:
-                print(f"Average Temperature: {sum(temperatures)/len(temperatures):.2f}°C")
-            if fps_values:
-                print(f"Average FPS: {sum(fps_values)/len(fps_values):.2f}")
+            print_summary()
             break
 
     #Cleanup
+    shutdown()
     tb_client.disconnect()
+    if event_log is not None:
+        event_log.close()
     source.release()
     cv2.destroyAllWindows()
 
@@ -1,130 +1,159 @@
+import time
 import cv2
-import pandas as pd
 import numpy as np
-from ultralytics import YOLO
 from tracker import*
-import cvzone
+from detector import PersonDetector, iter_detections
 
 url = "#########################################/video"
 
-model=YOLO('yolov8s.pt')
+# Frames per model.predict call; decoding runs on its own thread meanwhile
+BATCH_SIZE = 4
+# Detected frames a person may be missed before their track (and per-id state) is dropped
+MAX_MISSED = 5
+# Detect on one frame in SKIP unless an adaptive scheduler is passed to count_video()
+SKIP = 3
 
 def RGB(event, x, y, flags, param):
     if(event==cv2.EVENT_MOUSEMOVE):
         point = [x,y]
         print(point)
 
-cv2.namedWindow('RGB')
-cv2.setMouseCallback('RGB', RGB)
-cap=cv2.VideoCapture('test_singleperson.mp4')
-
 # fourcc = cv2.VideoWriter_fourcc(*'avc1')
 # out = cv2.VideoWriter('output.avi',fourcc, 5, (640,480))
 
-output = cv2.VideoWriter('output_final.avi',cv2.VideoWriter_fourcc(*'MPEG'),30,(1020,500))
-
-file = open('coco.names', 'r')
-data = file.read()
-class_list = data.split('\n')
-
-count=0
-persondown={}
-tracker=Tracker()
-counter1=[]
-
-personup={}
-counter2=[]
-cy1=194
-cy2=220
-offset=6
-
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
-    #frame=stream_read()
-
-    count+=1
-    if (count%3 != 0):
-        continue
-
-    frame=cv2.resize(frame, (1020,500))
-
-    results=model.predict(frame)
-    #print(results)
-
-    a=results[0].boxes.data
-    px=pd.DataFrame(a).astype("float")
-    #print(px)
-
-    list=[]
-
-    for index,row in px.iterrows():
-        #print(rows)
-
-        x1=int(row[0])
-        y1=int(row[1])
-        x2=int(row[2])
-        y2=int(row[3])
-        d=int(row[5])
-
-        c=class_list[d]
-        if 'person' in c:
-            list.append([x1,y1,x2,y2])
-    
-    bbox_id=tracker.update(list)
-    for bbox in bbox_id:
-        x3,y3,x4,y4,id=bbox
-        cx=int(x3+x4)//2
-        cy=int(y3+y4)//2
-        cv2.circle(frame,(cx,cy),4,(255,0,255),-1)
-
-        ## for down going
-        if (cy1<(cy+offset) and (cy1>cy-offset)):
-
-            cv2.rectangle(frame, (x3,y3),(x4,y4),(0,0,255),2)
-            cvzone.putTextRect(frame,f'{id}', (x3,y3), 1,2)
-            persondown[id]=(cx,cy)
-
-        if (id in persondown):
-            if (cy2<(cy+offset) and (cy2>cy-offset)):
-                cv2.rectangle(frame, (x3,y3),(x4,y4),(0,255,255),2)
-                cvzone.putTextRect(frame,f'{id}', (x3,y3), 1,2)
-                if counter1.count(id)==0:
-                    counter1.append(id)
-        
-        ## for up going
-        if (cy2<(cy+offset) and (cy2>cy-offset)):
-
-            cv2.rectangle(frame, (x3,y3),(x4,y4),(0,255,0),2)
-            cvzone.putTextRect(frame,f'{id}', (x3,y3), 1,2)
-            personup[id]=(cx,cy)
-
-        if (id in personup):
+def count_video(source='test_singleperson.mp4', detector=None, show=True, output_path='output_final.avi',
+                scheduler=None, stats=None, skip=SKIP):
+    """
+    Count people crossing the two lines at cy1/cy2 with YOLOv8 detections.
+
+    Args:
+        source: Video path or stream URL.
+        detector (PersonDetector): Defaults to PersonDetector('yolov8s.pt').
+        show (bool): Draw, display and write every frame (default: True).
+        output_path (str): Annotated output video, or None to not write one.
+        scheduler (AdaptiveScheduler): Opt-in motion-driven cadence instead of `skip`,
+            e.g. AdaptiveScheduler(active_every=2, idle_every=15); its effect on the
+            counts has not been checked against the fixed cadence.
+        stats (dict): Optional {stage: pipeline.StageStats} filled with
+            "detect", "track" and "draw" timings.
+        skip (int): Detect on one frame in `skip` when no scheduler is given (default: 3).
+
+    Returns:
+        tuple: (downcount, upcount)
+    """
+    if detector is None:
+        detector = PersonDetector('yolov8s.pt')
+
+    if show:
+        # Only needed for the annotations, so headless replays run without it
+        import cvzone
+        cv2.namedWindow('RGB')
+        cv2.setMouseCallback('RGB', RGB)
+    output = None
+    if output_path:
+        output = cv2.VideoWriter(output_path,cv2.VideoWriter_fourcc(*'MPEG'),30,(1020,500))
+
+    # Per-id state lives only as long as the track, so it stays small all day
+    persondown={}
+    tracker=Tracker(max_missed=MAX_MISSED, xyxy=True)
+    counter1=set()
+
+    personup={}
+    counter2=set()
+    cy1=194
+    cy2=220
+    offset=6
+
+    if scheduler is not None:
+        scheduler.set_band(cy1-60, cy2+60)
+
+    def timed(stage, start):
+        now = time.perf_counter()
+        if stats is not None:
+            stats[stage].add(now - start)
+        return now
+
+    downcount = upcount = 0
+    t = time.perf_counter()
+    # Resized to 1020x500, detected in batches of BATCH_SIZE
+    for count, frame, dets in iter_detections(source, detector, batch_size=BATCH_SIZE,
+                                              size=(1020,500), skip=skip, scheduler=scheduler):
+        #frame=stream_read()
+        t = timed("detect", t)
+
+        # Person boxes only (class 0 is filtered inside the detector)
+        list=np.stack((dets["x1"], dets["y1"], dets["x2"], dets["y2"]), axis=1).tolist()
+
+        bbox_id=tracker.update(list)
+        for bbox in bbox_id:
+            x3,y3,x4,y4,id=bbox
+            cx=int(x3+x4)//2
+            cy=int(y3+y4)//2
+            if show:
+                cv2.circle(frame,(cx,cy),4,(255,0,255),-1)
+
+            ## for down going
             if (cy1<(cy+offset) and (cy1>cy-offset)):
-                cv2.rectangle(frame, (x3,y3),(x4,y4),(0,255,255),2)
-                cvzone.putTextRect(frame,f'{id}', (x3,y3), 1,2)
-                if counter2.count(id)==0:
-                    counter2.append(id)
-
-    cv2.line(frame,(3,cy1), (1018,cy1),(0,255,0),2)
-    cv2.line(frame,(5,cy2), (1019,cy2),(0,255,255),2)
-
-    #print(persondown)
-    #print(counter1)
-    #print(len(counter1)) #lenght means we can get the counnt who is going down
-    downcount=len(counter1)
-    upcount=len(counter2)
-    
-    cvzone.putTextRect(frame, f'Down: {downcount}', (50,60), 2,2)
-    cvzone.putTextRect(frame, f'Up: {upcount}', (50,160), 2,2)
-    output.write(frame)
-    cv2.imshow('RGB', frame)
-    if cv2.waitKey(1) & 0xff==27:
-        break
-
-cap.release()
-cv2.destroyAllWindows()
-
 
+                if show:
+                    cv2.rectangle(frame, (x3,y3),(x4,y4),(0,0,255),2)
+                    cvzone.putTextRect(frame,f'{id}', (x3,y3), 1,2)
+                persondown[id]=(cx,cy)
+
+            if (id in persondown):
+                if (cy2<(cy+offset) and (cy2>cy-offset)):
+                    if show:
+                        cv2.rectangle(frame, (x3,y3),(x4,y4),(0,255,255),2)
+                        cvzone.putTextRect(frame,f'{id}', (x3,y3), 1,2)
+                    if id not in counter1:
+                        counter1.add(id)
+                        downcount+=1
+
+            ## for up going
+            if (cy2<(cy+offset) and (cy2>cy-offset)):
 
+                if show:
+                    cv2.rectangle(frame, (x3,y3),(x4,y4),(0,255,0),2)
+                    cvzone.putTextRect(frame,f'{id}', (x3,y3), 1,2)
+                personup[id]=(cx,cy)
+
+            if (id in personup):
+                if (cy1<(cy+offset) and (cy1>cy-offset)):
+                    if show:
+                        cv2.rectangle(frame, (x3,y3),(x4,y4),(0,255,255),2)
+                        cvzone.putTextRect(frame,f'{id}', (x3,y3), 1,2)
+                    if id not in counter2:
+                        counter2.add(id)
+                        upcount+=1
+
+        #print(persondown)
+        #print(counter1)
+        for id in tracker.expired:
+            persondown.pop(id, None)
+            personup.pop(id, None)
+            counter1.discard(id)
+            counter2.discard(id)
+        t = timed("track", t)
+
+        if show:
+            cv2.line(frame,(3,cy1), (1018,cy1),(0,255,0),2)
+            cv2.line(frame,(5,cy2), (1019,cy2),(0,255,255),2)
+            cvzone.putTextRect(frame, f'Down: {downcount}', (50,60), 2,2)
+            cvzone.putTextRect(frame, f'Up: {upcount}', (50,160), 2,2)
+        if output is not None:
+            output.write(frame)
+        if show:
+            cv2.imshow('RGB', frame)
+            if cv2.waitKey(1) & 0xff==27:
+                break
+        t = timed("draw", t)
+
+    if output is not None:
+        output.release()
+    if show:
+        cv2.destroyAllWindows()
+    return downcount, upcount
+
+
+if __name__ == "__main__":
+    count_video('test_singleperson.mp4')
@@ -0,0 +1,137 @@
+import logging
+import queue
+import threading
+import numpy as np
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# One row per detected person, in frame pixel coordinates
+DETECTION_DTYPE = np.dtype([("x1", np.int32), ("y1", np.int32), ("x2", np.int32), ("y2", np.int32),
+                            ("conf", np.float32), ("cls", np.int16)])
+
+PERSON = 0  # COCO class id of 'person' (first line of coco.names)
+
+
+class FrameDecoder:
+    """
+    Decodes (and optionally resizes/skips) video frames on a background thread.
+
+    Frames are put into a bounded queue as (frame_index, frame) so decoding
+    overlaps with inference; None marks the end of the stream.
+    """
+
+    def __init__(self, source, size=None, skip=1, maxsize=32, scheduler=None):
+        """
+        Args:
+            source: Video path, camera index or stream URL for cv2.VideoCapture.
+            size (tuple): (width, height) to resize to, or None to keep the native size.
+            skip (int): Keep one frame out of every `skip` (default: 1, keep all).
+            maxsize (int): Bound of the decoded-frame queue (default: 32).
+            scheduler (AdaptiveScheduler): If given, decides per (resized) frame whether it
+                is detected, instead of the fixed `skip`.
+        """
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise ValueError(f"Failed to open video source: {source}")
+        self.size = size
+        self.skip = max(1, skip)
+        self.scheduler = scheduler
+        self.q = queue.Queue(maxsize=maxsize)
+        self.running = True
+        self.thread = threading.Thread(target=self._decode, name="frame-decoder")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _decode(self):
+        index = 0
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            index += 1
+            if self.scheduler is None and index % self.skip != 0:
+                continue
+            if self.size is not None:
+                frame = cv2.resize(frame, self.size)
+            if self.scheduler is not None and not self.scheduler.should_process(frame):
+                continue
+            self.q.put((index, frame))
+        self.q.put(None)
+
+    def batches(self, batch_size):
+        """Yield lists of up to `batch_size` (frame_index, frame) pairs until the stream ends."""
+        batch = []
+        while True:
+            item = self.q.get()
+            if item is None:
+                break
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def release(self):
+        self.running = False
+        # Unblock the decoder if it is waiting on a full queue
+        while not self.q.empty():
+            try:
+                self.q.get_nowait()
+            except queue.Empty:
+                break
+        self.thread.join(timeout=1.0)
+        self.cap.release()
+
+
+class PersonDetector:
+    """
+    YOLOv8 person detector that runs one `model.predict` call per batch of frames.
+
+    Boxes are filtered to `classes` with a NumPy mask on the raw
+    (x1, y1, x2, y2, conf, cls) output and returned as DETECTION_DTYPE
+    structured arrays, one per frame.
+    """
+
+    def __init__(self, model="yolov8s.pt", device="cpu", imgsz=640, conf=0.25, classes=(PERSON,)):
+        from ultralytics import YOLO
+
+        self.model = YOLO(model) if isinstance(model, str) else model
+        self.device = device
+        self.imgsz = imgsz
+        self.conf = conf
+        self.classes = np.asarray(classes)
+
+    def filter(self, data):
+        """Convert one frame's raw (N, 6) box array to a structured array of kept classes."""
+        data = np.asarray(data, np.float32).reshape(-1, 6)
+        data = data[np.isin(data[:, 5].astype(np.int16), self.classes)]
+        out = np.empty(len(data), DETECTION_DTYPE)
+        out["x1"], out["y1"], out["x2"], out["y2"] = data[:, :4].astype(np.int32).T
+        out["conf"] = data[:, 4]
+        out["cls"] = data[:, 5]
+        return out
+
+    def detect(self, frames):
+        """Detect on a list of frames in a single forward pass; returns one array per frame."""
+        results = self.model.predict(list(frames), device=self.device, imgsz=self.imgsz,
+                                     conf=self.conf, verbose=False)
+        return [self.filter(r.boxes.data.cpu().numpy()) for r in results]
+
+
+def iter_detections(source, detector, batch_size=4, size=None, skip=1, scheduler=None):
+    """
+    Decode `source` on a background thread and detect in batches.
+
+    Yields:
+        tuple: (frame_index, frame, detections) in stream order.
+    """
+    decoder = FrameDecoder(source, size=size, skip=skip, maxsize=max(2 * batch_size, 8), scheduler=scheduler)
+    try:
+        for batch in decoder.batches(batch_size):
+            detections = detector.detect([frame for _, frame in batch])
+            for (index, frame), dets in zip(batch, detections):
+                yield index, frame, dets
+    finally:
+        decoder.release()
@@ -0,0 +1,283 @@
+##Append-only binary log of line crossings, written off the counting thread
+import argparse
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import numpy as np
+import tracking
+from geometry import LINE_NAMES
+
+logger = logging.getLogger(__name__)
+
+# One fixed-width little-endian record per crossing (18 bytes, no padding)
+RECORD_DTYPE = np.dtype([("ts", "<f8"),         # Unix time in seconds
+                         ("track_id", "<u4"),
+                         ("direction", "i1"),   # tracking.UP (out) or tracking.DOWN (in)
+                         ("line", "u1"),        # index into geometry.LINE_NAMES
+                         ("cx", "<i2"),
+                         ("cy", "<i2")])
+
+# File header: magic, format version, record size, committed record count.
+# The count is rewritten after each batch of records has been written, so a
+# reader never sees a record that is only partially on disk.
+MAGIC = b"PCEVTLOG"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQ")
+HEADER_SIZE = 32
+COUNT_OFFSET = 16
+
+DIRECTION_LINES = {tracking.UP: LINE_NAMES.index("line_up"), tracking.DOWN: LINE_NAMES.index("line_down")}
+
+
+def _read_header(f):
+    f.seek(0)
+    raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise ValueError("Truncated event log header")
+    magic, version, record_size, count = HEADER.unpack(raw)
+    if magic != MAGIC or version != VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"Not a version {VERSION} event log")
+    f.seek(0, os.SEEK_END)
+    # A file cut short (e.g. power loss while growing) only has whole records up to its end
+    return min(count, (f.tell() - HEADER_SIZE) // RECORD_DTYPE.itemsize)
+
+
+class EventLog:
+    """
+    Crossing events appended to a fixed-width binary file by a background thread.
+
+    `log()` only enqueues a tuple into a bounded queue; the writer thread
+    drains it, packs each batch into one RECORD_DTYPE array and appends it
+    with a single write (or, with use_mmap, a copy into a memory-mapped file
+    grown `grow_records` at a time), then commits the new record count in
+    the header. Reopening an existing log appends to it and discards a torn
+    tail.
+    """
+
+    def __init__(self, path="events.evl", use_mmap=False, flush_interval=1.0, max_queue=65536,
+                 grow_records=65536):
+        """
+        Args:
+            path (str): Log file, created if missing.
+            use_mmap (bool): Write through a memory map instead of write() calls (default: False).
+            flush_interval (float): Max seconds an event waits in the queue (default: 1.0).
+            max_queue (int): Queue bound; events beyond it are dropped and counted (default: 65536).
+            grow_records (int): use_mmap only: records the file is extended by at a time.
+        """
+        self.path = path
+        self.use_mmap = use_mmap
+        self.flush_interval = flush_interval
+        self.grow_records = grow_records
+        self.q = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.counters = {"queued": 0, "dropped": 0, "written": 0, "batches": 0}
+        self.running = False
+        self.thread = None
+        self.mm = None
+        self.records = None
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.f = open(path, "r+b" if exists else "w+b")
+        if exists:
+            self.count = _read_header(self.f)
+        else:
+            self.count = 0
+            self.f.write(HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, 0).ljust(HEADER_SIZE, b"\0"))
+        self.capacity = self.count
+        self.f.truncate(HEADER_SIZE + self.count * RECORD_DTYPE.itemsize)
+        self._commit()
+
+    def start(self):
+        """Start the background writer thread."""
+        if self.thread is not None:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._writer, name="event-log")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def log(self, track_id, direction, cx, cy, ts=None, line=None):
+        """
+        Queue one crossing without blocking.
+
+        Args:
+            track_id (int): Tracker id of the person.
+            direction (int): tracking.UP or tracking.DOWN.
+            cx, cy (int): Centroid at the crossing.
+            ts (float): Unix time; defaults to now.
+            line (int): Index into LINE_NAMES; defaults to the line `direction` counts on.
+
+        Returns:
+            bool: True if queued, False if the queue was full and the event was dropped.
+        """
+        if ts is None:
+            ts = time.time()
+        if line is None:
+            line = DIRECTION_LINES[direction]
+        try:
+            self.q.put_nowait((ts, track_id, direction, line, cx, cy))
+        except queue.Full:
+            with self.lock:
+                self.counters["dropped"] += 1
+            return False
+        with self.lock:
+            self.counters["queued"] += 1
+        return True
+
+    def stats(self):
+        """Snapshot of the writer counters plus current queue depth."""
+        with self.lock:
+            snapshot = dict(self.counters)
+        snapshot["backlog"] = self.q.qsize()
+        snapshot["records"] = self.count
+        return snapshot
+
+    def _commit(self):
+        os.pwrite(self.f.fileno(), struct.pack("<Q", self.count), COUNT_OFFSET)
+
+    def _reserve(self, n):
+        # Grow the file (and remap it) so `n` more records fit
+        if self.count + n <= self.capacity and self.mm is not None:
+            return
+        self.capacity = max(self.capacity, self.count + n) + self.grow_records
+        if self.mm is not None:
+            del self.records
+            self.mm.close()
+        self.f.truncate(HEADER_SIZE + self.capacity * RECORD_DTYPE.itemsize)
+        self.mm = mmap.mmap(self.f.fileno(), 0)
+        self.records = np.ndarray((self.capacity,), RECORD_DTYPE, buffer=self.mm, offset=HEADER_SIZE)
+
+    def _write(self, batch):
+        records = np.array(batch, dtype=RECORD_DTYPE)
+        n = len(records)
+        if self.use_mmap:
+            self._reserve(n)
+            self.records[self.count:self.count + n] = records
+        else:
+            os.pwrite(self.f.fileno(), records.tobytes(), HEADER_SIZE + self.count * RECORD_DTYPE.itemsize)
+        self.count += n
+        self._commit()
+        with self.lock:
+            self.counters["written"] += n
+            self.counters["batches"] += 1
+
+    def _drain(self, timeout):
+        try:
+            batch = [self.q.get(timeout=timeout)]
+        except queue.Empty:
+            return
+        while True:
+            try:
+                batch.append(self.q.get_nowait())
+            except queue.Empty:
+                break
+        self._write(batch)
+
+    def _writer(self):
+        while self.running:
+            self._drain(self.flush_interval)
+
+    def close(self):
+        """Stop the writer, write what is still queued and trim the file to its records."""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self._drain(0)
+        if self.mm is not None:
+            self.mm.flush()
+            del self.records
+            self.mm.close()
+            self.mm = None
+        self.f.truncate(HEADER_SIZE + self.count * RECORD_DTYPE.itemsize)
+        self.f.close()
+
+
+class EventLogReader:
+    """
+    Read-only view of an event log as a memory-mapped RECORD_DTYPE array.
+
+    Nothing is copied into Python objects: `counts()` walks the mapping in
+    fixed-size chunks with vectorized NumPy, so aggregating millions of
+    events needs only a few MB of memory. `refresh()` picks up records
+    committed by a writer since the log was opened.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = np.zeros(0, RECORD_DTYPE)
+        self.refresh()
+
+    def refresh(self):
+        with open(self.path, "rb") as f:
+            count = _read_header(f)
+        if count:
+            self.records = np.memmap(self.path, RECORD_DTYPE, "r", offset=HEADER_SIZE, shape=(count,))
+        return count
+
+    def __len__(self):
+        return len(self.records)
+
+    def counts(self, window=3600.0, start=None, end=None, chunk=1 << 20):
+        """
+        In/out crossings per time window.
+
+        Args:
+            window (float): Window length in seconds; windows are aligned to
+                multiples of `window` since the Unix epoch (default: 1 hour).
+            start, end (float): Optional Unix time bounds, [start, end).
+            chunk (int): Records processed per vectorized step.
+
+        Returns:
+            tuple: (window_starts, entered, exited) NumPy arrays, one entry
+            per window from the first to the last event, empty windows included.
+        """
+        ts = self.records["ts"]
+        if not len(ts):
+            return np.zeros(0), np.zeros(0, np.int64), np.zeros(0, np.int64)
+        first = ts.min() if start is None else start
+        origin = np.floor(first / window) * window
+        entered = np.zeros(0, np.int64)
+        exited = np.zeros(0, np.int64)
+        for a in range(0, len(ts), chunk):
+            t = ts[a:a + chunk]
+            direction = self.records["direction"][a:a + chunk]
+            keep = np.ones(len(t), bool)
+            if start is not None:
+                keep &= t >= start
+            if end is not None:
+                keep &= t < end
+            bins = ((t - origin) // window).astype(np.int64)
+            for totals, value in ((entered, tracking.DOWN), (exited, tracking.UP)):
+                add = np.bincount(bins[keep & (direction == value)])
+                if len(add) > len(totals):
+                    totals.resize(len(add), refcheck=False)
+                totals[:len(add)] += add
+        n = max(len(entered), len(exited))
+        entered.resize(n, refcheck=False)
+        exited.resize(n, refcheck=False)
+        return origin + window * np.arange(n), entered, exited
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise an event log per time window")
+    parser.add_argument("path", help="Event log written by counter.py --event-log")
+    parser.add_argument("-w", "--window", type=float, default=3600.0,
+                        help="Window length in seconds (default: 1 hour)")
+    args = parser.parse_args()
+
+    reader = EventLogReader(args.path)
+    starts, entered, exited = reader.counts(args.window)
+    print(f"{len(reader)} events")
+    for start, n_in, n_out in zip(starts, entered, exited):
+        if n_in or n_out:
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start))}  In: {n_in}  Out: {n_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,95 +1,269 @@
 ############################################
 ## Import OpenCV
+import argparse
+import time
 import numpy as np
 import cv2
+from segmenter import BLOB_METHODS, label_blobs
+from tracker import Tracker
 
-kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
-cap  =  cv2.VideoCapture("test2.mp4")
-i    =  1
-cin  =  0
-cout =  0
-pre  =  0
-prei =  800
 # fourcc = cv2.VideoWriter_fourcc(*'XVID')
 # out = cv2.VideoWriter('Video_output.mp4',fourcc,2, (680,720),1)
 ############################################
 
-############################################
-## Video Loop
-while(1):
-    ## Read the image
-    ret, img = cap.read()
-    ## Do the processing
-    if ret:
-        img=img[80:,100:]
-        height, width, channels = img.shape
-        img = cv2.medianBlur(img,5)
-
-        dilation = cv2.dilate(img, kernel, iterations = 4)
-        img = cv2.erode(dilation, kernel, iterations = 6)
-
-        hsv=cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-            
-        lower = np.array([0,0,27])
-        upper= np.array([200,255,255])
-        mask=cv2.inRange(hsv,lower,upper)
-
-        def iscrossin(prei,cur):
-            if(prei<width/2 and cur>width/2):
-                return 1
-            else:
-                return 0
-        def iscrossout(pre,cur):
-            if(prei>width/2 and cur<width/2):
-                return 1
-            else:
-                return 0
-        ret,mask = cv2.threshold(mask,127,255,cv2.THRESH_BINARY)
-        contours, hierarchy = cv2.findContours(mask.copy(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        n=len(contours)
-        cnt=0
-        m=0
+
+def diamond(radius):
+    """
+    Structuring element equal to `radius` passes of the 3x3 ellipse.
+
+    cv2's 3x3 ellipse is a cross, and dilating (or eroding) with a cross r
+    times is the same as one pass with the diamond |dx| + |dy| <= r.
+    """
+    y, x = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    return (np.abs(x) + np.abs(y) <= radius).astype(np.uint8)
+
+
+def iscrossin(pre, cur, mid):
+    return pre < mid <= cur
+
+
+def iscrossout(pre, cur, mid):
+    return pre >= mid > cur
+
+
+class CountingEngine:
+    """
+    Counts bright blobs crossing the vertical middle of a cropped frame.
+
+    The mask is built on one channel: the HSV value (max of B, G, R), median
+    blurred and thresholded, then closed with one dilation and one erosion
+    by diamond kernels equivalent to the original 4 + 6 passes of a 3x3
+    ellipse. Blobs are the outer contours whose area is in (area_min,
+    area_max), or with blob_method="components" the connected components,
+    all measured in one labelling pass (see segmenter.BLOB_METHODS).
+
+    Every blob is matched to a track (tracker.Tracker, within `max_jump`
+    pixels) and the track's last centroid x is kept in a dict by id, so
+    each blob's crossing is decided from its own previous position with
+    one lookup, however many people are in view. State of tracks the
+    tracker drops is forgotten with them. Buffers are reused between
+    frames, so masking and labelling do not allocate once the frame size
+    is known.
+    """
+
+    def __init__(self, crop=(80, 100), v_min=27, area_min=10000, area_max=25000, max_jump=60,
+                 median=5, dilate=4, erode=6, max_missed=2, blob_method="contours"):
+        """
+        Args:
+            crop (tuple): (top, left) pixels cut off every frame (default: (80, 100)).
+            v_min (int): Lowest HSV value counted as foreground (default: 27).
+            area_min (int): Smallest blob area in pixels counted as a person (default: 10000).
+            area_max (int): Largest blob area in pixels counted as a person (default: 25000).
+            max_jump (int): Max center movement in pixels between frames of one track (default: 60).
+            median (int): Median blur aperture (default: 5).
+            dilate (int): Dilation radius, in 3x3 ellipse passes (default: 4).
+            erode (int): Erosion radius, in 3x3 ellipse passes (default: 6).
+            max_missed (int): Frames a track may go without a blob before it is dropped (default: 2).
+            blob_method (str): One of segmenter.BLOB_METHODS (default: 'contours').
+        """
+        if blob_method not in BLOB_METHODS:
+            raise ValueError(f"Unknown blob method: {blob_method} (expected one of {', '.join(BLOB_METHODS)})")
+        self.crop = crop
+        self.v_min = v_min
+        self.area_min = area_min
+        self.area_max = area_max
+        self.max_jump = max_jump
+        self.median = median
+        self.dilate_kernel = diamond(dilate)
+        self.erode_kernel = diamond(erode)
+        self.max_missed = max_missed
+        self.blob_method = blob_method
+        self.value = None
+        self.mask = None
+        self.scratch = None
+        self.labels = None
+        self.reset()
+
+    def reset(self):
+        self.cin = 0
+        self.cout = 0
+        # Greedy matching is enough for people max_jump apart, and keeps scipy unloaded
+        self.tracker = Tracker(max_distance=self.max_jump, max_missed=self.max_missed, hungarian=False)
+        self.last_x = {}  # track id -> centroid x in the previous frame
+
+    def foreground(self, frame):
+        """Crop `frame` and return (cropped view, binary mask)."""
+        top, left = self.crop
+        img = frame[top:, left:]
+        if self.value is None or self.value.shape != img.shape[:2]:
+            self.value = np.empty(img.shape[:2], np.uint8)
+            self.mask = np.empty_like(self.value)
+            self.scratch = np.empty_like(self.value)
+            if self.blob_method == "components":
+                self.labels = np.empty(self.value.shape, np.int32)
+        b, g, r = cv2.split(img)
+        cv2.max(b, g, dst=self.value)
+        cv2.max(self.value, r, dst=self.value)
+        cv2.medianBlur(self.value, self.median, dst=self.scratch)
+        cv2.threshold(self.scratch, self.v_min - 1, 255, cv2.THRESH_BINARY, dst=self.mask)
+        cv2.dilate(self.mask, self.dilate_kernel, dst=self.scratch)
+        cv2.erode(self.scratch, self.erode_kernel, dst=self.mask)
+        return img, self.mask
+
+    def blobs(self, mask):
+        """
+        Blobs in the person area range.
+
+        Returns:
+            tuple: (N, 4) int32 boxes (x, y, w, h) and (N, 2) float centroids
+        """
+        if self.blob_method == "components":
+            return self.component_blobs(mask)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = []
+        centroids = []
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if self.area_min < area < self.area_max:
+                M = cv2.moments(contour)
+                centroids.append((M['m10'] / M['m00'], M['m01'] / M['m00']))
+                boxes.append(cv2.boundingRect(contour))
+        return np.array(boxes, np.int32).reshape(-1, 4), np.array(centroids, np.float64).reshape(-1, 2)
+
+    def component_blobs(self, mask):
+        """`blobs()` in one connectedComponentsWithStats pass; areas are pixel counts."""
+        return label_blobs(mask, self.area_min, self.area_max, self.labels)
+
+    def count(self, boxes, centroids, width):
+        mid = width / 2
+        last_x = self.last_x
+        tracks = self.tracker.update(boxes)
+        for (x, y, w, h, track_id), cur in zip(tracks, centroids[:, 0].tolist()):
+            pre = last_x.get(track_id)
+            last_x[track_id] = cur
+            if pre is None:
+                continue
+            if iscrossin(pre, cur, mid):
+                self.cout += 1
+            elif iscrossout(pre, cur, mid):
+                self.cin += 1
+        for track_id in self.tracker.expired:
+            del last_x[track_id]
+
+    def process(self, frame):
+        """
+        Count one frame.
+
+        Returns:
+            tuple: (cropped view of `frame`, boxes of the blobs found in it)
+        """
+        img, mask = self.foreground(frame)
+        boxes, centroids = self.blobs(mask)
+        self.count(boxes, centroids, img.shape[1])
+        return img, boxes
+
+    def draw(self, img, boxes):
+        height, width = img.shape[:2]
         # Draw horizontal line at y = height//2
         line_y = height // 2
-        img = cv2.line(img, (0, line_y), (width, line_y), (0, 0, 255), 4)
-        for i in range(1,n):
-                area=cv2.contourArea(contours[i])
-                # print area
-                if(area>10000 and area<25000):
-                    m=area
-                    # print m
-                    cnt=i
-
-                    M=cv2.moments(contours[cnt])
-                    cx=int(M['m10']/M['m00'])
-                    cy=int(M['m01']/M['m00'])
-                    
-                    x,y,w,h = cv2.boundingRect(contours[cnt])
-                    cv2.rectangle(img,(x,y),(x+w,y+h),(0,255,0),2)
-                    cur=cx
-                    if(iscrossin(prei,cur)):
-                        if(abs(prei-cur)<60):
-                            cout+=1
-                    elif(iscrossout(pre,cur)):
-                        if(abs(pre-cur)<60):
-                            cin+=1
-                        else:
-                            a=0
-                    pre=cur
-                    prei=cur
-        ## Show the image
-        IN="IN: "+str(cin)
-        OUT="OUT: "+str(cout)
-        cv2.putText(img,IN, (10, 50),cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-        cv2.putText(img,OUT, (10,100),cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-        cv2.imshow('image',img)
-        # out.write(img)
-        ## End the video loop
-        cv2.waitKey(1)  
+        cv2.line(img, (0, line_y), (width, line_y), (0, 0, 255), 4)
+        for x, y, w, h in boxes.tolist():
+            cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(img, "IN: " + str(self.cin), (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+        cv2.putText(img, "OUT: " + str(self.cout), (10, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+        return img
+
+
+def count_video(source="test2.mp4", show=True, stats=None, engine=None):
+    """
+    Count blobs crossing the vertical middle of the cropped frame.
+
+    Args:
+        source: Video path or camera index for cv2.VideoCapture.
+        show (bool): Draw and display every frame (default: True).
+        stats (dict): Optional {stage: pipeline.StageStats} filled with
+            "read", "preprocess", "contours" and "draw" timings.
+        engine (CountingEngine): Engine to count with (default: a new one).
+
+    Returns:
+        tuple: (cin, cout)
+    """
+    cap = cv2.VideoCapture(source)
+    engine = engine or CountingEngine()
+
+    def timed(stage, start):
+        now = time.perf_counter()
+        if stats is not None:
+            stats[stage].add(now - start)
+        return now
+
+    ############################################
+    ## Video Loop
+    while True:
+        ## Read the image
+        t = time.perf_counter()
+        ret, frame = cap.read()
+        t = timed("read", t)
+        if not ret:
+            break
+        ## Do the processing
+        img, mask = engine.foreground(frame)
+        t = timed("preprocess", t)
+        boxes, centroids = engine.blobs(mask)
+        engine.count(boxes, centroids, img.shape[1])
+        t = timed("contours", t)
+        if show:
+            ## Show the image
+            cv2.imshow('image', engine.draw(img, boxes))
+            # out.write(img)
+            cv2.waitKey(1)
+            timed("draw", t)
+
+    ## Close and exit
+    cap.release()
+    if show:
+        cv2.destroyAllWindows()
+    return engine.cin, engine.cout
+
+
+def benchmark(source="test2.mp4", blob_method="contours"):
+    """
+    Frames/s of CountingEngine alone, on frames decoded up front.
+
+    Returns:
+        dict: frames, seconds, fps, in and out
+    """
+    cap = cv2.VideoCapture(source)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    engine = CountingEngine(blob_method=blob_method)
+    start = time.perf_counter()
+    for frame in frames:
+        engine.process(frame)
+    elapsed = time.perf_counter() - start
+    return {"frames": len(frames), "seconds": round(elapsed, 3),
+            "fps": round(len(frames) / elapsed, 1) if elapsed else 0.0, "in": engine.cin, "out": engine.cout}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count blobs crossing the middle of a video")
+    parser.add_argument("source", nargs="?", default="test2.mp4")
+    parser.add_argument("--headless", action="store_true",
+                        help="No window; decode the video up front and report processing frames/s")
+    parser.add_argument("--blob-method", type=str, default="contours", choices=BLOB_METHODS)
+    args = parser.parse_args()
+    if args.headless:
+        result = benchmark(args.source, args.blob_method)
+        print(f"{args.source}: {result['frames']} frames in {result['seconds']}s, {result['fps']} fps, "
+              f"IN: {result['in']} OUT: {result['out']}")
     else:
-        break
+        count_video(args.source, engine=CountingEngine(blob_method=args.blob_method))
 
-## Close and exit
-cap.release()
-cv2.destroyAllWindows()
 
+if __name__ == "__main__":
+    main()
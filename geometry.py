@@ -0,0 +1,129 @@
+import json
+import numpy as np
+import cv2
+
+# Default counting lines as fractions of the frame height, top to bottom:
+# the tracking band is [up_limit, down_limit), people leaving cross line_up
+# going up and people entering cross line_down going down.
+DEFAULT_LINES = {"up_limit": 0.5 / 6, "line_up": 1 / 6, "line_down": 4 / 6, "down_limit": 4.5 / 6}
+LINE_NAMES = ("up_limit", "line_up", "line_down", "down_limit")
+
+# Columns cut off the left of video-file frames before they are segmented
+# (counter.py, batch.py); geometry for video files is relative to the cropped view
+VIDEO_CROP_LEFT = 20
+
+LINE_UP_COLOR = (0, 0, 255)
+LINE_DOWN_COLOR = (255, 0, 0)
+LIMIT_COLOR = (255, 255, 255)
+ROI_COLOR = (0, 255, 255)
+
+
+class CountingGeometry:
+    """
+    Counting lines, tracking band, ROI polygon and blob-area threshold for one frame size.
+
+    Everything is derived from the frame shape once, in `update()`, together
+    with the point arrays used to draw the overlay; calling `update()` again
+    with the same shape is a tuple comparison. Lines and the polygon may be
+    given as fractions of the frame size (`units="fraction"`, the default)
+    or in pixels, and can be loaded from a JSON file with `from_file()`:
+
+        {"units": "fraction",
+         "lines": {"up_limit": 0.08, "line_up": 0.17, "line_down": 0.67, "down_limit": 0.75},
+         "x_range": [0.0, 1.0],
+         "roi_polygon": [[0.0, 0.05], [1.0, 0.05], [1.0, 0.85], [0.0, 0.85]],
+         "min_area": 0.0033}
+
+    Lines are horizontal (the tracker compares centroid y with them);
+    `x_range` only limits how far they are drawn. `min_area` is always a
+    fraction of the frame area.
+
+    Coordinates, fractions and pixels alike, refer to the frame that is
+    segmented and displayed. For video files that is the frame after the
+    VIDEO_CROP_LEFT columns on its left are cut off, so a 480 px wide video
+    has a 460 px wide geometry and pixel x = 0 is source column 20. Camera
+    and stream frames are not cropped.
+    """
+
+    def __init__(self, lines=None, roi_polygon=None, x_range=None, min_area=1 / 300, units="fraction"):
+        """
+        Args:
+            lines (dict): Any of up_limit/line_up/line_down/down_limit; missing ones use DEFAULT_LINES.
+            roi_polygon (array-like): Optional (N, 2) polygon restricting segmentation.
+            x_range (tuple): Horizontal extent of the drawn lines (default: full width).
+            min_area (float): Minimum blob area as a fraction of the frame area (default: 1/300).
+            units (str): 'fraction' of the frame size or 'pixels' (default: 'fraction').
+        """
+        if units not in ("fraction", "pixels"):
+            raise ValueError(f"Unknown units: {units} (expected 'fraction' or 'pixels')")
+        lines = dict(lines or {})
+        unknown = set(lines) - set(LINE_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown counting lines: {', '.join(sorted(unknown))}")
+        if units == "pixels" and set(lines) != set(LINE_NAMES):
+            raise ValueError("All four counting lines are required with units='pixels'")
+        self.units = units
+        self.spec = {**DEFAULT_LINES, **lines}
+        self.x_spec = None if x_range is None else tuple(x_range)
+        self.polygon_spec = None if roi_polygon is None else np.asarray(roi_polygon, np.float64).reshape(-1, 2)
+        self.min_area = min_area
+        self.shape = None
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a geometry from a JSON file (see the class docstring for the format)."""
+        with open(path) as f:
+            config = json.load(f)
+        return cls(lines=config.get("lines"), roi_polygon=config.get("roi_polygon"),
+                   x_range=config.get("x_range"), min_area=config.get("min_area", 1 / 300),
+                   units=config.get("units", "fraction"))
+
+    def update(self, shape):
+        """Rebuild for frame `shape` (h, w[, c]) if it changed; returns True when it did."""
+        shape = tuple(shape[:2])
+        if shape == self.shape:
+            return False
+        self.shape = shape
+        h, w = shape
+        self.h, self.w = h, w
+        self.area_threshold = h * w * self.min_area
+
+        sy, sx = (h, w) if self.units == "fraction" else (1, 1)
+        self.up_limit, self.line_up, self.line_down, self.down_limit = (int(self.spec[name] * sy)
+                                                                        for name in LINE_NAMES)
+        if not self.up_limit <= self.line_up < self.line_down <= self.down_limit:
+            raise ValueError(f"Counting lines must satisfy up_limit <= line_up < line_down <= down_limit, "
+                             f"got {self.up_limit}, {self.line_up}, {self.line_down}, {self.down_limit}")
+        x0, x1 = (0, w) if self.x_spec is None else (int(self.x_spec[0] * sx), int(self.x_spec[1] * sx))
+        self.roi_polygon = None
+        if self.polygon_spec is not None:
+            self.roi_polygon = np.round(self.polygon_spec * (sx, sy)).astype(np.int32)
+
+        def segment(y):
+            return np.array([[x0, y], [x1, y]], np.int32).reshape((-1, 1, 2))
+
+        # (points, closed, color, thickness) batches for cv2.polylines, built once per shape
+        self.primitives = [
+            ([segment(self.line_down)], False, LINE_DOWN_COLOR, 2),
+            ([segment(self.line_up)], False, LINE_UP_COLOR, 2),
+            ([segment(self.up_limit), segment(self.down_limit)], False, LIMIT_COLOR, 1),
+        ]
+        if self.roi_polygon is not None:
+            self.primitives.append(([self.roi_polygon.reshape((-1, 1, 2))], True, ROI_COLOR, 1))
+        return True
+
+    @property
+    def lines(self):
+        """(line_up, line_down, up_limit, down_limit), the CentroidTracker argument order."""
+        return self.line_up, self.line_down, self.up_limit, self.down_limit
+
+    def band(self, margin=None):
+        """ROI rectangle (x0, y0, x1, y1) covering the tracking band plus `margin` rows (default: h/6)."""
+        if margin is None:
+            margin = self.h // 6
+        return 0, self.up_limit - margin, self.w, self.down_limit + margin
+
+    def draw(self, frame):
+        for pts, closed, color, thickness in self.primitives:
+            cv2.polylines(frame, pts, closed, color, thickness=thickness)
+        return frame
@@ -0,0 +1,231 @@
+import bisect
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds: 50 us to ~13 s, 4 buckets per
+# doubling (each ~19% wider than the last), so interpolated quantiles are
+# within a few percent of the exact value.
+LATENCY_BUCKETS = tuple(5e-5 * 2 ** (i / 4) for i in range(73))
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram.
+
+    `observe()` is a bisect plus three additions and never allocates, so it
+    can sit on the per-frame hot path. Quantiles are interpolated within the
+    bucket they fall into.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 < q <= 1) in seconds, 0.0 when empty."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def summary(self):
+        """count, mean and p50/p95/p99/max in milliseconds."""
+        return {"count": self.count,
+                "mean_ms": round(1000 * self.sum / self.count, 3) if self.count else 0.0,
+                "p50_ms": round(1000 * self.quantile(0.50), 3),
+                "p95_ms": round(1000 * self.quantile(0.95), 3),
+                "p99_ms": round(1000 * self.quantile(0.99), 3),
+                "max_ms": round(1000 * self.max, 3)}
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+def _labels(labels, extra=None):
+    items = sorted(labels.items()) + (extra or [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class MetricsRegistry:
+    """
+    Named, labelled histograms, counters and callback gauges.
+
+    Histograms and counters are plain objects updated by their owners with
+    no locking (single writer per series). Gauges are callables evaluated
+    only when the registry is rendered, so queue depths and other
+    snapshots cost nothing between scrapes.
+    """
+
+    def __init__(self, prefix="counter_"):
+        self.prefix = prefix
+        self.families = {}  # name -> (kind, help, {labels tuple: series})
+        self.lock = threading.Lock()
+
+    def _series(self, kind, name, help, labels, make):
+        name = self.prefix + name
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.setdefault(name, (kind, help, {}))
+            if family[0] != kind:
+                raise ValueError(f"Metric {name} already registered as a {family[0]}")
+            series = family[2]
+            if key not in series:
+                series[key] = make()
+            return series[key]
+
+    def histogram(self, name, help="", hist=None, **labels):
+        """Get or create a histogram series; pass `hist` to register an existing Histogram."""
+        return self._series("histogram", name, help, labels, lambda: hist if hist is not None else Histogram())
+
+    def counter(self, name, help="", **labels):
+        return self._series("counter", name, help, labels, Counter)
+
+    def gauge(self, name, fn, help="", kind="gauge", **labels):
+        """Register `fn()` to be read at render time; kind='counter' for monotonic callbacks."""
+        return self._series("counter" if kind == "counter" else "gauge", name, help, labels, lambda: fn)
+
+    def _value(self, series):
+        if isinstance(series, Counter):
+            return series.value
+        return series()
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self.lock:
+            families = [(name, kind, help, list(series.items()))
+                        for name, (kind, help, series) in sorted(self.families.items())]
+        for name, kind, help, series in families:
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, s in series:
+                labels = dict(key)
+                if kind == "histogram":
+                    cumulative = 0
+                    for bound, n in zip(s.bounds, s.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_labels(labels, [('le', _number(bound))])} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {s.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(s.sum)}")
+                    lines.append(f"{name}_count{_labels(labels)} {s.count}")
+                    continue
+                try:
+                    value = self._value(s)
+                except Exception:
+                    logger.exception(f"Metric {name} failed")
+                    continue
+                if value is None:
+                    continue
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, quantiles=(0.50, 0.95, 0.99)):
+        """Flat {key: value} snapshot suitable for a single telemetry payload.
+
+        Histograms become `<name>_<label values>_p<q>_ms` entries, counters and
+        gauges `<name>_<label values>`.
+        """
+        out = {}
+        with self.lock:
+            families = [(name[len(self.prefix):], kind, list(series.items()))
+                        for name, (kind, _, series) in sorted(self.families.items())]
+        for name, kind, series in families:
+            for key, s in series:
+                base = "_".join([name] + [str(v) for _, v in key])
+                if kind == "histogram":
+                    for q in quantiles:
+                        out[f"{base}_p{int(round(q * 100))}_ms"] = round(1000 * s.quantile(q), 3)
+                    continue
+                try:
+                    value = self._value(s)
+                except Exception:
+                    continue
+                if value is not None:
+                    out[base] = value
+        return out
+
+
+class MetricsServer:
+    """
+    Serves a MetricsRegistry as plain text on `GET /metrics` from a daemon thread.
+
+    Binds to localhost by default; scraping renders the registry on the
+    server thread, so the processing threads only ever pay for `observe()`.
+    """
+
+    def __init__(self, registry, host="127.0.0.1", port=9108):
+        # Imported here: http.server costs ~35 ms at startup and is only needed with --metrics-port
+        import http.server
+        self.registry = registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # no per-scrape log lines
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-http")
+        self.thread.daemon = True
+        self.thread.start()
+        logger.debug(f"Serving metrics on http://{self.address[0]}:{self.address[1]}/metrics")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,155 @@
+##Minimal local MQTT 3.1.1 broker stand-in for exercising telemetry without ThingsBoard
+import argparse
+import json
+import logging
+import socket
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK = 1, 2, 3, 4, 8, 9
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+class StandInBroker:
+    """
+    Accepts MQTT connections on localhost and records every PUBLISH.
+
+    Only what MQTTThingsBoardClient needs is implemented: CONNECT/CONNACK,
+    PUBLISH with QoS 0/1, PINGREQ and DISCONNECT. `delay` holds every ack
+    back to simulate a slow broker, `connack_rc` refuses connections, and
+    `stop()`/`start()` simulate the broker disappearing and coming back.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, connack_rc=0):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.connack_rc = connack_rc
+        self.messages = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.sock = None
+        self.clients = []
+        self.running = False
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.port = self.sock.getsockname()[1]
+        self.sock.listen(8)
+        self.running = True
+        thread = threading.Thread(target=self._accept, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        for conn in self.clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except OSError:
+                pass
+        self.clients = []
+
+    def payloads(self):
+        """Decoded JSON payloads received so far."""
+        with self.lock:
+            return [json.loads(payload) for topic, payload in self.messages]
+
+    def _accept(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            self.clients.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _recv_exact(conn, n):
+        data = b""
+        while len(data) < n:
+            chunk = conn.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("client closed")
+            data += chunk
+        return data
+
+    def _read_packet(self, conn):
+        header = self._recv_exact(conn, 1)[0]
+        length, shift = 0, 0
+        while True:
+            byte = self._recv_exact(conn, 1)[0]
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+        body = self._recv_exact(conn, length) if length else b""
+        return header >> 4, header & 0x0F, body
+
+    def _serve(self, conn):
+        try:
+            while self.running:
+                ptype, flags, body = self._read_packet(conn)
+                if self.delay:
+                    time.sleep(self.delay)
+                if ptype == CONNECT:
+                    with self.lock:
+                        self.connections += 1
+                    conn.sendall(bytes([CONNACK << 4, 2, 0, self.connack_rc]))
+                    if self.connack_rc:
+                        break
+                elif ptype == PUBLISH:
+                    qos = (flags >> 1) & 0x03
+                    topic_len = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + topic_len].decode()
+                    offset = 2 + topic_len
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                    with self.lock:
+                        self.messages.append((topic, body[offset:].decode()))
+                    if qos:
+                        conn.sendall(bytes([PUBACK << 4, 2]) + packet_id)
+                elif ptype == SUBSCRIBE:
+                    conn.sendall(bytes([SUBACK << 4, 3]) + body[:2] + b"\x00")
+                elif ptype == PINGREQ:
+                    conn.sendall(bytes([PINGRESP << 4, 0]))
+                elif ptype == DISCONNECT:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in MQTT broker that prints telemetry")
+    parser.add_argument("-p", "--port", type=int, default=1883)
+    parser.add_argument("-d", "--delay", type=float, default=0.0, help="Seconds to delay every ack")
+    args = parser.parse_args()
+    broker = StandInBroker(port=args.port, delay=args.delay).start()
+    print(f"Stand-in broker listening on {broker.host}:{broker.port}")
+    seen = 0
+    try:
+        while True:
+            time.sleep(0.5)
+            with broker.lock:
+                new = broker.messages[seen:]
+                seen = len(broker.messages)
+            for topic, payload in new:
+                print(topic, payload)
+    except KeyboardInterrupt:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+##Multi-door supervisor: one counting process per camera, one shared publisher
+import argparse
+import logging
+import multiprocessing
+import queue
+import signal
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+COUNT_KEYS = ("entered_people", "exited_people")
+
+
+class DoorPublisher:
+    """
+    Telemetry stand-in used inside a door worker.
+
+    Updates are forwarded to the supervisor over a multiprocessing queue as
+    (door, values, done) instead of being sent, so all doors share the
+    supervisor's single MQTT connection.
+    """
+
+    def __init__(self, door, events):
+        self.door = door
+        self.events = events
+
+    def publish(self, key, value):
+        return self.publish_many({key: value})
+
+    def publish_many(self, values):
+        self.events.put((self.door, dict(values), False))
+        return True
+
+    def send_telemetry(self, server_IP, port, token, key, value, retries=None, retry_delay=None):
+        return self.publish(key, value)
+
+    def stats(self):
+        return {}
+
+    def disconnect(self):
+        pass
+
+
+def run_door(door, source, options, geometry_file, events, stop, cv_threads):
+    """
+    Worker process entry point: count one door until end of stream or `stop`.
+
+    Every door has its own source, frame pool, segmenter, tracker and
+    geometry; only telemetry leaves the process.
+    """
+    import cv2
+    import counter
+    import pipeline
+    from geometry import CountingGeometry
+    # Ctrl+C is handled by the supervisor, which sets `stop`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # One OpenCV thread per door: the processes themselves use the cores
+    cv2.setNumThreads(cv_threads)
+
+    reader = counter.open_source(source)
+    geometry = CountingGeometry.from_file(geometry_file) if geometry_file else None
+    pool = pipeline.FramePool(options.pop("pool_size", 4), reader.shape)
+
+    def watch():
+        stop.wait()
+        counter.shutdown()
+
+    watcher = threading.Thread(target=watch, name="stop-watch")
+    watcher.daemon = True
+    watcher.start()
+
+    up = down = 0
+    try:
+        result = counter.process_frames(reader, pool, None, DoorPublisher(door, events),
+                                        geometry=geometry, **options)
+        if result is not None:
+            up, down = result
+    finally:
+        reader.release()
+        events.put((door, {"exited_people": up, "entered_people": down}, True))
+
+
+class DoorSupervisor:
+    """
+    Runs one `run_door` process per door and aggregates their counts.
+
+    Per-door telemetry is republished with the door name as prefix
+    (`<door>_entered_people`, `<door>_FPS`, ...) together with the
+    vehicle-wide `entered_people`, `exited_people` and `people_inside`
+    summed over all doors, through the one `publisher` given.
+    """
+
+    def __init__(self, doors, publisher, options=None, geometry_files=None, cv_threads=1):
+        """
+        Args:
+            doors (dict): Door name -> video path, stream URL or 'picam'.
+            publisher: TelemetryPublisher (or anything with publish_many) shared by all doors.
+            options (dict): Keyword arguments for counter.process_frames, plus pool_size.
+            geometry_files (dict): Optional door name -> CountingGeometry JSON file.
+            cv_threads (int): cv2.setNumThreads in each worker (default: 1).
+        """
+        self.doors = dict(doors)
+        self.publisher = publisher
+        self.options = dict(options or {})
+        self.geometry_files = dict(geometry_files or {})
+        self.cv_threads = cv_threads
+        ctx = multiprocessing.get_context("spawn")
+        self.events = ctx.Queue()
+        self.stop_event = ctx.Event()
+        self.processes = {door: ctx.Process(target=run_door, name=f"door-{door}",
+                                            args=(door, source, dict(self.options), self.geometry_files.get(door),
+                                                  self.events, self.stop_event, cv_threads))
+                          for door, source in self.doors.items()}
+        self.counts = {door: {"entered_people": 0, "exited_people": 0} for door in self.doors}
+        self.finished = set()
+
+    def start(self):
+        for process in self.processes.values():
+            process.daemon = True
+            process.start()
+        return self
+
+    def stop(self):
+        """Ask every worker to finish; `run()` returns once they have reported."""
+        self.stop_event.set()
+
+    def totals(self):
+        entered = sum(c["entered_people"] for c in self.counts.values())
+        exited = sum(c["exited_people"] for c in self.counts.values())
+        return {"entered_people": entered, "exited_people": exited, "people_inside": entered - exited}
+
+    def _handle(self, door, values, done):
+        update = {f"{door}_{key}": value for key, value in values.items()}
+        counts = {key: values[key] for key in COUNT_KEYS if key in values}
+        if counts:
+            self.counts[door].update(counts)
+            update.update(self.totals())
+        self.publisher.publish_many(update)
+        if done:
+            self.finished.add(door)
+            logger.debug(f"Door {door} finished: {self.counts[door]}")
+
+    def run(self, timeout=None):
+        """Aggregate worker telemetry until every door has finished (or `timeout`); returns totals()."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self.finished) < len(self.processes):
+            if deadline is not None and time.monotonic() > deadline:
+                self.stop()
+                deadline = None
+            try:
+                door, values, done = self.events.get(timeout=1.0)
+            except queue.Empty:
+                # A worker that died without reporting would otherwise hang the supervisor
+                for door, process in self.processes.items():
+                    if door not in self.finished and not process.is_alive():
+                        logger.error(f"Door {door} worker exited with code {process.exitcode}")
+                        self.finished.add(door)
+                continue
+            self._handle(door, values, done)
+        for process in self.processes.values():
+            process.join(timeout=5)
+        return self.totals()
+
+
+def parse_pairs(pairs, what):
+    out = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep or not name or not value:
+            raise SystemExit(f"Error: {what} must be NAME=VALUE, got {pair!r}")
+        out[name] = value
+    return out
+
+
+def main():
+    logging.basicConfig(level=logging.DEBUG, format="[DEBUG] %(message)s")
+    parser = argparse.ArgumentParser(description="Count several doors in parallel, one process per camera")
+    parser.add_argument("-d", "--door", action="append", required=True,
+                        help="NAME=SOURCE, SOURCE being a video path, stream URL or 'picam' (repeatable)")
+    parser.add_argument("--geometry", action="append", default=[],
+                        help="NAME=FILE: CountingGeometry JSON for one door (repeatable)")
+    parser.add_argument("--sink", type=str, default="",
+                        help="Telemetry sink: mqtt, file:<path>, udp:<host>[:<port>] or null "
+                             "(default: mqtt with --server-IP/--Port/--token, else null)")
+    parser.add_argument("-s", "--server-IP", type=str, default="",
+                        help="ThingsBoard server domain")
+    parser.add_argument("-P", "--Port", type=int, default=0,
+                        help="MQTT port for ThingsBoard server")
+    parser.add_argument("-a", "--token", type=str, default="",
+                        help="Device access token for ThingsBoard authentication")
+    parser.add_argument("--cv-threads", type=int, default=1,
+                        help="OpenCV threads per door process")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Use an AdaptiveScheduler in every door")
+    parser.add_argument("--roi", type=str, default="full", choices=("full", "band"),
+                        help="Segment the whole frame or only the counting band")
+    parser.add_argument("--seg-scale", type=float, default=1.0,
+                        help="Downscale factor for segmentation")
+    parser.add_argument("--pool-size", type=int, default=4,
+                        help="Frame buffers per door")
+    parser.add_argument("--spool", type=str, default="",
+                        help="SQLite file that stores telemetry while offline (disabled if empty)")
+    args = parser.parse_args()
+
+    from telemetry_sinks import open_sink
+    sink = args.sink
+    if not sink:
+        sink = "mqtt" if args.server_IP and args.Port and args.token else "null"
+        if sink == "null":
+            logger.warning("No ThingsBoard server given (--server-IP, --Port, --token), telemetry is discarded")
+    spool = None
+    if args.spool:
+        from telemetry_spool import TelemetrySpool
+        spool = TelemetrySpool(args.spool)
+    try:
+        publisher = open_sink(sink, args.server_IP, args.Port, args.token, spool=spool).start()
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    options = {"roi": args.roi, "seg_scale": args.seg_scale, "pool_size": args.pool_size}
+    if args.adaptive:
+        from scheduler import AdaptiveScheduler
+        options["scheduler"] = AdaptiveScheduler()
+    supervisor = DoorSupervisor(parse_pairs(args.door, "--door"), publisher, options,
+                                parse_pairs(args.geometry, "--geometry"), cv_threads=args.cv_threads)
+
+    def on_sigint(sig, frame):
+        print("Ctrl+C detected, stopping doors...")
+        supervisor.stop()
+
+    signal.signal(signal.SIGINT, on_sigint)
+    supervisor.start()
+    totals = supervisor.run()
+    for door, counts in supervisor.counts.items():
+        print(f"{door}: In: {counts['entered_people']} Out: {counts['exited_people']}")
+    print(f"Total: In: {totals['entered_people']} Out: {totals['exited_people']} Inside: {totals['people_inside']}")
+    publisher.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import logging
+import queue
+import threading
+import time
+import numpy as np
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Returned by a stage when it has passed the slot on by other means (e.g. to the
+# display queue); the pipeline then neither forwards nor releases it.
+HANDOFF = object()
+# Returned by a stage to skip the rest of the pipeline for this frame; the
+# slot is released immediately.
+DROP = object()
+
+
+class FramePool:
+    """
+    Fixed pool of preallocated frame buffers shared by all pipeline stages.
+
+    Stages exchange slot indices, never arrays, so a frame is written once by
+    the capture stage and then read/drawn in place until the slot is released.
+    When every slot is in flight `acquire()` blocks, which is what throttles
+    capture to the speed of the slowest downstream stage.
+    """
+
+    def __init__(self, size, shape, dtype=np.uint8):
+        self.size = size
+        self.shape = tuple(shape)
+        self.frames = np.zeros((size,) + self.shape, dtype)
+        # Per-slot scratch space for stage outputs (centroids, boxes, ...)
+        self.meta = [{} for _ in range(size)]
+        self.free = queue.Queue()
+        for slot in range(size):
+            self.free.put(slot)
+
+    def acquire(self, timeout=None):
+        """Take a free slot (blocking), or None on timeout or after `wake()`."""
+        try:
+            return self.free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def wake(self):
+        """Unblock a capture stage waiting in `acquire()` so it can shut down."""
+        self.free.put(None)
+
+    def in_use(self):
+        return max(0, self.size - self.free.qsize())
+
+
+class StageStats:
+    __slots__ = ("count", "total", "max", "last", "drops", "hist")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.drops = 0
+        self.hist = Histogram()
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.hist.observe(seconds)
+
+
+class FramePipeline:
+    """
+    Runs `stages` (name, fn) in order, one thread per stage, over a FramePool.
+
+    The first stage is the capture stage: it is handed a freshly acquired slot
+    and returns False at end of stream. Every stage receives the slot index
+    from a bounded queue, runs `fn(slot)` and forwards the index; the slot is
+    released after the last stage unless a stage returns HANDOFF, in which
+    case whoever received it must call `pool.release(slot)`, or DROP to skip
+    the remaining stages for that frame. A stage returning False stops the
+    pipeline. End of stream travels down as a None sentinel,
+    after which `on_eof` is called from the last stage's thread.
+
+    Stages block on their input queue without polling; `stop()` wakes them
+    by pushing the same None sentinel, and `done` is set once every stage
+    thread has exited.
+    """
+
+    def __init__(self, pool, stages, on_eof=None):
+        self.pool = pool
+        self.stages = stages
+        self.on_eof = on_eof
+        self.running = False
+        self.done = threading.Event()
+        self._alive = 0
+        self._lock = threading.Lock()
+        self.queues = [queue.Queue(maxsize=pool.size) for _ in stages[1:]]
+        self.stats_by_stage = [StageStats() for _ in stages]
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        self._alive = len(self.stages)
+        for index, (name, _) in enumerate(self.stages):
+            thread = threading.Thread(target=self._run, args=(index,), name=f"stage-{name}")
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        """Ask every stage to exit; returns immediately, wait on `done` or `join()`."""
+        self.running = False
+        self.pool.wake()
+        for q in self.queues:
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                pass  # the consumer is not blocked on an empty queue
+
+    def is_alive(self):
+        return not self.done.is_set()
+
+    def join(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def _put(self, q, item):
+        # A full queue is backpressure: block until downstream catches up,
+        # waking up now and then only to notice stop()
+        while self.running:
+            try:
+                q.put(item, timeout=1.0)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, index):
+        if index == 0:
+            return self.pool.acquire() if self.running else None
+        return self.queues[index - 1].get()
+
+    def _run(self, index):
+        try:
+            self._loop(index)
+        finally:
+            with self._lock:
+                self._alive -= 1
+                if self._alive == 0:
+                    self.done.set()
+
+    def _loop(self, index):
+        name, fn = self.stages[index]
+        stats = self.stats_by_stage[index]
+        last = index == len(self.stages) - 1
+        while self.running:
+            slot = self._get(index)
+            if slot is None:
+                # Upstream end of stream (or stop(), in which case running is False)
+                if self.running:
+                    self._send_eof(index)
+                return
+            start = time.perf_counter()
+            try:
+                result = fn(slot)
+            except Exception:
+                logger.exception(f"Stage {name} failed")
+                result = False
+            stats.add(time.perf_counter() - start)
+            if result is HANDOFF:
+                continue
+            if result is DROP:
+                stats.drops += 1
+                self.pool.release(slot)
+                continue
+            if result is False:
+                self.pool.release(slot)
+                if index == 0:
+                    # End of stream: downstream stages finish what is in flight
+                    self._send_eof(index)
+                else:
+                    self.stop()
+                return
+            if last:
+                self.pool.release(slot)
+            elif not self._put(self.queues[index], slot):
+                self.pool.release(slot)
+                return
+
+    def _send_eof(self, index):
+        if index < len(self.queues):
+            self._put(self.queues[index], None)
+        else:
+            self.running = False
+            if self.on_eof is not None:
+                self.on_eof()
+
+    def queue_depth(self, index):
+        """Slots waiting in front of stage `index` (free slots for the capture stage)."""
+        return self.pool.free.qsize() if index == 0 else self.queues[index - 1].qsize()
+
+    def stats(self):
+        """Per-stage counters: frames, drops, input queue depth and latency (ms)."""
+        out = {}
+        for index, (name, _) in enumerate(self.stages):
+            s = self.stats_by_stage[index]
+            out[name] = {
+                "frames": s.count,
+                "drops": s.drops,
+                "queue_depth": self.queue_depth(index),
+                "latency_ms_avg": round(1000 * s.total / s.count, 3) if s.count else 0.0,
+                "latency_ms_p50": round(1000 * s.hist.quantile(0.50), 3),
+                "latency_ms_p95": round(1000 * s.hist.quantile(0.95), 3),
+                "latency_ms_p99": round(1000 * s.hist.quantile(0.99), 3),
+                "latency_ms_max": round(1000 * s.max, 3),
+                "latency_ms_last": round(1000 * s.last, 3),
+            }
+        out["pool"] = {"size": self.pool.size, "in_use": self.pool.in_use()}
+        return out
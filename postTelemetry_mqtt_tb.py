@@ -2,16 +2,26 @@ import paho.mqtt.client as mqtt
 import json
 import logging
 import time
+from telemetry_sinks import BatchingSink
 
 # Setup logger
 logging.basicConfig(level=logging.DEBUG, format="[DEBUG] %(message)s")
 logger = logging.getLogger(__name__)
 
+TELEMETRY_TOPIC = "v1/devices/me/telemetry"
+
 class MQTTThingsBoardClient:
-    def __init__(self):
-        """Initialize MQTT client."""
+    def __init__(self, spool=None):
+        """
+        Initialize MQTT client.
+
+        Args:
+            spool (TelemetrySpool): Optional on-disk spool that keeps telemetry which
+                could not be delivered, for replay once the connection returns.
+        """
         self.client = None
         self.connected = False
+        self.spool = spool
 
     def on_connect(self, client, userdata, flags, rc):
         """Callback for when the client receives a CONNACK response."""
@@ -50,50 +60,245 @@ class MQTTThingsBoardClient:
                 # Initialize client if not connected
                 if self.client is None or not self.connected:
                     logger.debug(f"Attempt {attempt}/{retries}: Connecting to {server_IP}:{port} with token {token}")
-                    self.client = mqtt.Client()
-                    self.client.username_pw_set(token)
-                    self.client.on_connect = self.on_connect
-                    self.client.connect(server_IP, port, 60)
-                    self.client.loop_start()
-                    # Wait for connection
-                    timeout = time.time() + 5
-                    while not self.connected and time.time() < timeout:
-                        time.sleep(0.1)
-                    if not self.connected:
-                        raise Exception("Connection timeout")
+                    self.connect(server_IP, port, token)
 
                 # Send telemetry
-                payload = {key: value}
-                result = self.client.publish("v1/devices/me/telemetry", json.dumps(payload), qos=1)
-                if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                if self.publish({key: value}):
                     logger.debug(f"Sent telemetry: {key}={value}")
                     return True
-                else:
-                    logger.error(f"Failed to publish telemetry, return code: {result.rc}")
-                    return False
+                return False
 
             except Exception as e:
                 logger.error(f"Attempt {attempt}/{retries} failed: {str(e)}")
                 if "not authorized" in str(e).lower() or "Connection refused" in str(e):
                     logger.error("Invalid token or device not authorized. Please check the access token in ThingsBoard.")
-                if self.client is not None:
-                    self.client.loop_stop()
-                    self.client.disconnect()
-                    self.client = None
-                    self.connected = False
+                self.disconnect()
                 if attempt < retries:
                     logger.debug(f"Retrying in {retry_delay} seconds...")
                     time.sleep(retry_delay)
                 else:
                     logger.error("Max retries reached. Failed to send telemetry.")
+                    if self.spool is not None:
+                        self.spool.append({key: value})
+                        logger.debug(f"Spooled telemetry: {key}={value} ({len(self.spool)} pending)")
                     return False
 
+    def connect(self, server_IP, port, token, timeout=5):
+        """
+        Open the MQTT connection and wait for the CONNACK.
+
+        Args:
+            server_IP (str): Domain name of the ThingsBoard server.
+            port (int): MQTT port for connection.
+            token (str): Device access token for authentication.
+            timeout (float): Seconds to wait for the broker to accept (default: 5).
+
+        Raises:
+            Exception: If the broker does not accept the connection within `timeout`.
+        """
+        self.client = mqtt.Client()
+        self.client.username_pw_set(token)
+        self.client.on_connect = self.on_connect
+        self.client.connect(server_IP, port, 60)
+        self.client.loop_start()
+        # Wait for connection
+        deadline = time.time() + timeout
+        while not self.connected and time.time() < deadline:
+            time.sleep(0.1)
+        if not self.connected:
+            raise Exception("Connection timeout")
+
+    def publish(self, payload, wait=None):
+        """
+        Publish a telemetry dict on an already open connection.
+
+        Args:
+            payload (dict | list): Telemetry keys/values, or ThingsBoard `ts`/`values` records.
+            wait (float): Seconds to wait for the broker's PUBACK; None only hands the
+                message to the client, which loses it if the connection drops first.
+
+        Returns:
+            bool: True if the message was handed to the client (acknowledged with `wait`), False otherwise.
+        """
+        result = self.client.publish(TELEMETRY_TOPIC, json.dumps(payload), qos=1)
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            logger.error(f"Failed to publish telemetry, return code: {result.rc}")
+            return False
+        if wait is None:
+            return True
+        try:
+            result.wait_for_publish(wait)
+        except (RuntimeError, ValueError) as e:
+            logger.error(f"Telemetry publish was not acknowledged: {str(e)}")
+            return False
+        if not result.is_published():
+            logger.error(f"Telemetry publish was not acknowledged within {wait}s")
+            return False
+        return True
+
+    def replay_spool(self, limit, timeout=5):
+        """
+        Publish up to `limit` spooled records as one ThingsBoard `ts`/`values` batch.
+
+        Records are only removed once the broker acknowledged them; on a
+        timeout or a dropped connection they stay spooled for the next replay.
+
+        Args:
+            limit (int): Maximum number of records to send.
+            timeout (float): Seconds to wait for the broker's PUBACK (default: 5).
+
+        Returns:
+            int: Number of records delivered and removed from the spool.
+        """
+        if self.spool is None or not self.connected:
+            return 0
+        last_id, records = self.spool.batch(limit)
+        if not records or not self.publish(records, wait=timeout):
+            return 0
+        self.spool.ack(last_id)
+        return len(records)
+
     def disconnect(self):
         """Disconnect from ThingsBoard server."""
         if self.client is not None:
+            self.client.loop_stop()
+            self.client.disconnect()
             if self.connected:
-                self.client.loop_stop()
-                self.client.disconnect()
                 logger.debug("Disconnected from ThingsBoard server")
             self.client = None
-            self.connected = False
\ No newline at end of file
+            self.connected = False
+
+class TelemetryPublisher(BatchingSink):
+    """
+    Non-blocking, batched front end for MQTTThingsBoardClient: the mqtt sink.
+
+    `publish()` only enqueues into a bounded in-memory queue and never touches
+    the network. A background thread drains the queue, coalesces keys into one
+    JSON payload per flush interval (latest value per key wins) and handles
+    (re)connection with exponential backoff, so a slow or unreachable broker
+    never stalls the frame-processing thread (see telemetry_sinks.BatchingSink).
+
+    If the client has a spool, batches that cannot be delivered are written to
+    it with their timestamp instead of being held in memory, and are replayed
+    after reconnecting at no more than `replay_rate` records per second. The
+    spool is closed with the publisher.
+    """
+
+    thread_name = "telemetry-publisher"
+
+    def __init__(self, server_IP, port, token, flush_interval=1.0, max_queue=256,
+                 backoff_initial=1.0, backoff_max=60.0, connect_timeout=5, client=None,
+                 replay_rate=20.0, replay_batch=50):
+        """
+        Args:
+            server_IP (str): Domain name of the ThingsBoard server.
+            port (int): MQTT port for connection.
+            token (str): Device access token for authentication.
+            flush_interval (float): Seconds between coalesced publishes (default: 1.0).
+            max_queue (int): Queue bound; updates beyond it are dropped and counted (default: 256).
+            backoff_initial (float): First reconnect delay in seconds (default: 1.0).
+            backoff_max (float): Upper bound of the reconnect delay in seconds (default: 60.0).
+            connect_timeout (float): Seconds to wait for a CONNACK (default: 5).
+            client (MQTTThingsBoardClient): Client to reuse; a new one is created if None.
+            replay_rate (float): Max spooled records replayed per second (default: 20.0).
+            replay_batch (int): Max spooled records per replay publish (default: 50).
+        """
+        super().__init__(flush_interval=flush_interval, max_queue=max_queue)
+        self.server_IP = server_IP
+        self.port = port
+        self.token = token
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.replay_rate = replay_rate
+        self.replay_batch = replay_batch
+        self.client = client if client is not None else MQTTThingsBoardClient()
+        self.counters.update(reconnects=0, spooled=0, replayed=0)
+        self._backoff = backoff_initial
+        self._next_connect = 0.0
+        self._replay_tokens = 0.0
+        self._replay_last = time.monotonic()
+
+    def send(self, payload):
+        # With a spool, wait for the PUBACK so a batch lost in flight is spooled rather than dropped
+        wait = self.connect_timeout if self.client.spool is not None else None
+        return self.client.publish(payload, wait=wait)
+
+    def close(self):
+        self.client.disconnect()
+        if self.client.spool is not None:
+            self.client.spool.close()
+
+    def stats(self):
+        """Snapshot of the publisher counters plus current queue and batch depth."""
+        snapshot = super().stats()
+        snapshot["connected"] = self.client.connected
+        if self.client.spool is not None:
+            snapshot["spool_backlog"] = len(self.client.spool)
+            snapshot["spool_evicted"] = self.client.spool.evicted
+        return snapshot
+
+    def _ensure_connected(self):
+        if self.client.client is not None and self.client.connected:
+            return True
+        now = time.monotonic()
+        if now < self._next_connect:
+            return False
+        try:
+            self.client.disconnect()
+            self.client.connect(self.server_IP, self.port, self.token, timeout=self.connect_timeout)
+        except Exception as e:
+            logger.error(f"Telemetry connect failed: {str(e)}, retrying in {self._backoff:.1f}s")
+            self.client.disconnect()
+            self._next_connect = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+            return False
+        with self.lock:
+            self.counters["reconnects"] += 1
+        self._backoff = self.backoff_initial
+        return True
+
+    def _spool_pending(self):
+        spool = self.client.spool
+        if spool is None or not self.pending:
+            return
+        # Stamped with when the batch was published, not when it is spooled,
+        # so records replayed after an outage keep their original time order
+        spool.append(self.pending, ts=int(self.pending_ts * 1000))
+        with self.lock:
+            self.counters["spooled"] += len(self.pending)
+        self.pending = {}
+
+    def _replay(self):
+        # Token bucket: spooled records trickle out at replay_rate so a long
+        # outage never turns into a CPU/network burst next to the counting loop.
+        now = time.monotonic()
+        self._replay_tokens = min(self.replay_batch,
+                                  self._replay_tokens + (now - self._replay_last) * self.replay_rate)
+        self._replay_last = now
+        if self._replay_tokens < 1 or not len(self.client.spool):
+            return
+        try:
+            sent = self.client.replay_spool(int(self._replay_tokens), timeout=self.connect_timeout)
+        except Exception as e:
+            logger.error(f"Telemetry replay failed: {str(e)}")
+            sent = 0
+        self._replay_tokens -= sent
+        with self.lock:
+            self.counters["replayed"] += sent
+
+    def _flush(self):
+        if not self._ensure_connected():
+            self._spool_pending()
+            return False
+        if self.client.spool is not None:
+            self._replay()
+        if not self.pending:
+            return False
+        ok = self._send(self.pending)
+        if ok:
+            self.pending = {}
+        else:
+            self._spool_pending()
+            self.client.disconnect()
+        return ok
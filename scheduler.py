@@ -0,0 +1,117 @@
+import cv2
+
+IDLE = "idle"
+ACTIVE = "active"
+
+# Cheap motion probes run on every frame:
+#   diff - absolute difference with the previous downscaled grey frame
+#   mog2 - foreground fraction of a downscaled MOG2 (shadow detection off)
+PROBES = ("diff", "mog2")
+
+
+class AdaptiveScheduler:
+    """
+    Decides per frame whether the full detection/tracking path should run.
+
+    A cheap motion probe looks only at the rows around the counting lines
+    (`set_band`), downscaled by `scale`. The scheduler switches to ACTIVE as
+    soon as the moving fraction reaches `on_level` and back to IDLE only
+    after it stayed below `off_level` for `hold_frames` consecutive frames,
+    so a person pausing in the doorway does not flap the state. In ACTIVE one
+    frame in `active_every` is processed, in IDLE one in `idle_every`.
+    """
+
+    def __init__(self, probe="mog2", scale=0.25, diff_threshold=25, on_level=0.01, off_level=0.004,
+                 hold_frames=15, active_every=1, idle_every=6, margin=10):
+        """
+        Args:
+            probe (str): Motion probe, one of PROBES (default: 'mog2').
+            scale (float): Downscale factor applied before probing (default: 0.25).
+            diff_threshold (int): Grey-level change counted as motion by the 'diff' probe (default: 25).
+            on_level (float): Moving-pixel fraction that switches to ACTIVE (default: 0.01).
+            off_level (float): Fraction under which the scene counts as quiet (default: 0.004).
+            hold_frames (int): Quiet frames required before dropping back to IDLE (default: 15).
+            active_every (int): Process one frame in N while ACTIVE (default: 1).
+            idle_every (int): Process one frame in N while IDLE (default: 6).
+            margin (int): Pixels added above and below the band (default: 10).
+        """
+        if probe not in PROBES:
+            raise ValueError(f"Unknown motion probe: {probe} (expected one of {', '.join(PROBES)})")
+        if off_level > on_level:
+            raise ValueError("off_level must not exceed on_level")
+        self.probe = probe
+        self.scale = scale
+        self.diff_threshold = diff_threshold
+        self.on_level = on_level
+        self.off_level = off_level
+        self.hold_frames = hold_frames
+        self.active_every = max(1, active_every)
+        self.idle_every = max(1, idle_every)
+        self.margin = margin
+        self.band = None
+        self.state = IDLE
+        self.level = 0.0
+        self.quiet = 0
+        self.since = self.idle_every  # process the very first frame
+        self.prev = None
+        self.fgbg = None
+        self.frames = 0
+        self.processed = 0
+        self.transitions = 0
+
+    def set_band(self, top, bottom):
+        """Restrict the probe to rows [top, bottom) of the frame, plus the margin."""
+        band = (max(0, top - self.margin), bottom + self.margin)
+        if band != self.band:
+            self.band = band
+            self.prev = None
+
+    def motion(self, frame):
+        """Fraction of moving pixels in the band of `frame` (0.0 until a reference exists)."""
+        if self.band is not None:
+            frame = frame[self.band[0]:self.band[1]]
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if self.probe == "mog2":
+            if self.fgbg is None:
+                self.fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+            mask = self.fgbg.apply(small)
+        else:
+            prev, self.prev = self.prev, small
+            if prev is None or prev.shape != small.shape:
+                return 0.0
+            mask = cv2.absdiff(prev, small)
+            cv2.threshold(mask, self.diff_threshold, 255, cv2.THRESH_BINARY, dst=mask)
+        return cv2.countNonZero(mask) / mask.size
+
+    def should_process(self, frame):
+        """Probe `frame`, update the state machine and say whether to run the full path on it."""
+        self.frames += 1
+        self.level = self.motion(frame)
+        if self.state == IDLE:
+            if self.level >= self.on_level:
+                self.state = ACTIVE
+                self.quiet = 0
+                self.transitions += 1
+                self.since = self.active_every  # react on the frame that triggered
+        elif self.level < self.off_level:
+            self.quiet += 1
+            if self.quiet >= self.hold_frames:
+                self.state = IDLE
+                self.transitions += 1
+        else:
+            self.quiet = 0
+
+        every = self.active_every if self.state == ACTIVE else self.idle_every
+        self.since += 1
+        if self.since >= every:
+            self.since = 0
+            self.processed += 1
+            return True
+        return False
+
+    def stats(self):
+        return {"state": self.state, "motion": round(self.level, 4), "frames": self.frames,
+                "processed": self.processed, "transitions": self.transitions,
+                "processed_ratio": round(self.processed / self.frames, 3) if self.frames else 0.0}
@@ -0,0 +1,241 @@
+import time
+import numpy as np
+import cv2
+
+# Mask variants that can feed cv2.findContours, in pipeline order:
+#   raw     - MOG2 output (shadows = 127, foreground = 255)
+#   binary  - thresholded to drop shadows
+#   open    - binary + opening (erode->dilate) to remove noise
+#   close   - open + closing (dilate->erode) to join white regions
+#   absdiff - close, differenced against the first closed mask
+MASK_VARIANTS = ("raw", "binary", "open", "close", "absdiff")
+
+# How blobs are extracted from the mask:
+#   contours   - findContours, then contourArea/moments/boundingRect per contour
+#   components - connectedComponentsWithStats, areas/boxes/centroids for all blobs at once
+BLOB_METHODS = ("contours", "components")
+
+
+def label_blobs(mask, min_area, max_area=None, labels=None):
+    """
+    Connected components of a binary mask whose pixel area is in (min_area, max_area).
+
+    Args:
+        mask (np.ndarray): 8-bit binary mask.
+        min_area (float): Areas up to this are dropped.
+        max_area (float): Areas from this on are dropped (default: None, no upper bound).
+        labels (np.ndarray): Optional int32 buffer of the mask's shape for the label image.
+
+    Returns:
+        tuple: (N, 4) int32 boxes (x, y, w, h) and (N, 2) float64 centroids
+    """
+    # Grana's block-based labelling: ~3x faster than the default with stats here
+    n, _, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(mask, 8, cv2.CV_32S, cv2.CCL_GRANA,
+                                                                           labels)
+    # Label 0 is the background
+    areas = stats[1:n, cv2.CC_STAT_AREA]
+    keep = areas > min_area
+    if max_area is not None:
+        keep &= areas < max_area
+    keep = np.nonzero(keep)[0] + 1
+    return stats[keep, :4], centroids[keep]
+
+
+def _scaled_kernel(size, scale):
+    # Keep structuring elements odd so openings/closings stay centred
+    return np.ones(tuple(max(1, int(round(k * scale))) | 1 for k in size), np.uint8)
+
+
+class ForegroundSegmenter:
+    """Single-pass MOG2 foreground segmentation with preallocated buffers.
+
+    The subtractor is applied exactly once per frame and every morphology
+    step writes into a buffer owned by the segmenter, so the steady state
+    allocates nothing per frame. Only the stages needed for the selected
+    variant are run.
+
+    Segmentation can be restricted to a region of interest (`set_roi`, a
+    rectangle with an optional polygon inside it) and run on a copy
+    downscaled by `scale`; masks are then in ROI/scaled space and `blobs()`
+    maps blobs back to frame coordinates, either per contour or, with
+    blob_method="components", for all blobs at once as NumPy arrays.
+    """
+
+    def __init__(self, variant="close", threshold=200, kernel_open=(3, 3), kernel_close=(11, 11),
+                 subtractor=None, scale=1.0, blob_method="contours"):
+        if variant not in MASK_VARIANTS:
+            raise ValueError(f"Unknown mask variant: {variant} (expected one of {', '.join(MASK_VARIANTS)})")
+        if blob_method not in BLOB_METHODS:
+            raise ValueError(f"Unknown blob method: {blob_method} (expected one of {', '.join(BLOB_METHODS)})")
+        if not 0 < scale <= 1:
+            raise ValueError(f"scale must be in (0, 1], got {scale}")
+        self.variant = variant
+        self.blob_method = blob_method
+        self.threshold = threshold
+        self.scale = scale
+        # Kernels shrink with the image so they cover the same scene area
+        self.kernelOp = _scaled_kernel(kernel_open, scale)
+        self.kernelCl = _scaled_kernel(kernel_close, scale)
+        if subtractor is None:
+            subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=True)
+        self.fgbg = subtractor
+        self.roi = None
+        self.polygon = None
+        self.shape = None
+        self.frame_shape = None
+        self.back = None
+        self.mog2_seconds = 0.0
+        self._stages = MASK_VARIANTS.index(variant)
+
+    def set_roi(self, rect=None, polygon=None):
+        """Restrict segmentation to part of the frame.
+
+        Args:
+            rect (tuple): (x0, y0, x1, y1) in frame pixels, clipped to the frame;
+                None for the whole frame.
+            polygon (array-like): Optional (N, 2) frame-space vertices; pixels of
+                `rect` outside the polygon are cleared from the mask.
+        """
+        if polygon is not None:
+            polygon = np.asarray(polygon, np.int32).reshape(-1, 2)
+            if rect is None:
+                x, y, w, h = cv2.boundingRect(polygon)
+                rect = (x, y, x + w, y + h)
+        self.roi = None if rect is None else tuple(int(v) for v in rect)
+        self.polygon = polygon
+        self.reset()
+
+    def _allocate(self, frame_shape):
+        fh, fw = frame_shape
+        x0, y0, x1, y1 = self.roi if self.roi is not None else (0, 0, fw, fh)
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(fw, x1), min(fh, y1)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"ROI {self.roi} does not intersect a {fw}x{fh} frame")
+        self.frame_shape = frame_shape
+        self.origin = (x0, y0)
+        self.window = (slice(y0, y1), slice(x0, x1))
+        if self.scale != 1:
+            shape = (max(1, int(round((y1 - y0) * self.scale))), max(1, int(round((x1 - x0) * self.scale))))
+        else:
+            shape = (y1 - y0, x1 - x0)
+        self.shape = shape
+        self.small = None
+        self.fgmask = np.empty(shape, np.uint8)
+        self.binary = np.empty(shape, np.uint8)
+        self.opened = np.empty(shape, np.uint8)
+        self.closed = np.empty(shape, np.uint8)
+        self.diff = np.empty(shape, np.uint8)
+        self.labels = np.empty(shape, np.int32)
+        self.inside = None
+        if self.polygon is not None:
+            pts = (self.polygon - (x0, y0)) * self.scale
+            self.inside = np.zeros(shape, np.uint8)
+            cv2.fillPoly(self.inside, [np.round(pts).astype(np.int32)], 255)
+        self.back = None
+
+    def reset(self):
+        """Drop buffers and the absdiff reference so they are rebuilt on the next frame."""
+        self.shape = None
+        self.frame_shape = None
+        self.back = None
+
+    def apply(self, frame, learning_rate=-1):
+        """Segment one frame and return the selected mask.
+
+        The mask covers the ROI (downscaled by `scale`). The returned array
+        is a view of an internal buffer and is overwritten by the next call;
+        copy it if it must outlive the frame.
+        """
+        frame_shape = frame.shape[:2]
+        if frame_shape != self.frame_shape:
+            self._allocate(frame_shape)
+
+        frame = frame[self.window]
+        if self.scale != 1:
+            # dst is reused once allocated, so this does not allocate per frame
+            self.small = cv2.resize(frame, (self.shape[1], self.shape[0]), dst=self.small,
+                                    interpolation=cv2.INTER_AREA)
+            frame = self.small
+        start = time.perf_counter()
+        self.fgbg.apply(frame, self.fgmask, learning_rate)
+        # Kept so callers can split MOG2 from morphology in their stage timings
+        self.mog2_seconds = time.perf_counter() - start
+        if self.inside is not None:
+            cv2.bitwise_and(self.fgmask, self.inside, dst=self.fgmask)
+        if self._stages == 0:
+            return self.fgmask
+
+        #Binarization to eliminate shadows
+        cv2.threshold(self.fgmask, self.threshold, 255, cv2.THRESH_BINARY, dst=self.binary)
+        if self._stages == 1:
+            return self.binary
+
+        #Opening (erode->dilate) to remove noise.
+        cv2.morphologyEx(self.binary, cv2.MORPH_OPEN, self.kernelOp, dst=self.opened)
+        if self._stages == 2:
+            return self.opened
+
+        #Closing (dilate -> erode) to join white regions.
+        cv2.morphologyEx(self.opened, cv2.MORPH_CLOSE, self.kernelCl, dst=self.closed)
+        if self._stages == 3:
+            return self.closed
+
+        if self.back is None:
+            self.back = self.closed.copy()
+        cv2.absdiff(self.back, self.closed, dst=self.diff)
+        return self.diff
+
+    def blobs(self, mask, min_area):
+        """Blobs of `mask` larger than `min_area`, in frame coordinates.
+
+        Args:
+            mask (np.ndarray): Mask returned by `apply`.
+            min_area (float): Minimum blob area in frame pixels.
+
+        Returns:
+            tuple: (centroids, sizes, rects) of (cx, cy), (w, h) and (x, y, w, h)
+            per blob: lists with blob_method="contours", (N, 2), (N, 2) and
+            (N, 4) int32 arrays with "components".
+        """
+        if self.blob_method == "components":
+            return self.component_blobs(mask, min_area)
+        # RETR_EXTERNAL returns only extreme outer flags. All child contours are left behind.
+        contours0, hierarchy = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        ox, oy = self.origin
+        inv = 1.0 / self.scale
+        min_area = min_area * self.scale * self.scale
+        centroids = []
+        sizes = []
+        rects = []
+        for cnt in contours0:
+            area = cv2.contourArea(cnt)
+            if area > min_area:
+                M = cv2.moments(cnt)
+                cx = int(M['m10']/M['m00']*inv) + ox
+                cy = int(M['m01']/M['m00']*inv) + oy
+                x,y,bw,bh = cv2.boundingRect(cnt)
+                if inv != 1:
+                    x, y, bw, bh = int(x*inv), int(y*inv), int(round(bw*inv)), int(round(bh*inv))
+                centroids.append((cx, cy))
+                sizes.append((bw, bh))
+                rects.append((x + ox, y + oy, bw, bh))
+        return centroids, sizes, rects
+
+    def component_blobs(self, mask, min_area):
+        """`blobs()` in one connectedComponentsWithStats pass, filtered and mapped with NumPy.
+
+        Areas are pixel counts and centroids pixel means, so both come out
+        slightly larger/shifted compared with the contour polygon measures.
+        """
+        rects, centroids = label_blobs(mask, min_area * self.scale * self.scale, labels=self.labels)
+        inv = 1.0 / self.scale
+        origin = np.array(self.origin, np.int32)
+        if inv != 1:
+            rects = np.column_stack((rects[:, :2] * inv, np.round(rects[:, 2:] * inv))).astype(np.int32)
+            centroids = centroids * inv
+        else:
+            rects = rects.astype(np.int32)
+        centroids = centroids.astype(np.int32) + origin
+        rects[:, :2] += origin
+        return centroids, rects[:, 2:].copy(), rects
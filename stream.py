@@ -0,0 +1,194 @@
+##Network camera source (RTSP / HTTP MJPEG) with reconnect and latest-frame delivery
+import logging
+import threading
+import time
+import cv2
+import numpy as np
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+STREAM_PREFIXES = ("rtsp://", "rtsps://", "http://", "https://")
+
+
+def is_stream(source):
+    return str(source).lower().startswith(STREAM_PREFIXES)
+
+
+class StreamReader:
+    """
+    Frame source for network cameras with the VideoReader interface.
+
+    A decode thread reads the stream as fast as it arrives into a small ring
+    of preallocated buffers, and `read_into()` always copies out the newest
+    decoded frame: frames the consumer was too slow for are skipped and
+    counted as dropped instead of queueing up, so processing never runs
+    behind live. When the stream fails or stalls the thread reconnects with
+    exponential backoff (the consumer just waits for the next frame).
+    Hardware decoding and a one-frame capture buffer are requested where the
+    OpenCV build supports them.
+    """
+
+    def __init__(self, url, shape=None, ring=2, backoff_initial=0.5, backoff_max=30.0, timeout=5.0,
+                 max_reconnects=None, hw_decode=True):
+        """
+        Args:
+            url (str): rtsp:// or http(s):// stream URL.
+            shape (tuple): (h, w, 3) frames are delivered at; default: the first frame's.
+            ring (int): Decoded-frame buffers, at least 2: the newest and the one being decoded.
+            backoff_initial (float): First reconnect delay in seconds (default: 0.5).
+            backoff_max (float): Upper bound of the reconnect delay in seconds (default: 30.0).
+            timeout (float): Open/read timeout in seconds (default: 5.0).
+            max_reconnects (int): Give up after this many failed reconnects in a row (default: never).
+            hw_decode (bool): Ask the backend for hardware-accelerated decoding (default: True).
+        """
+        logger.debug(f"Initializing StreamReader with source: {url}")
+        self.url = url
+        self.timeout = timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.max_reconnects = max_reconnects
+        self.hw_decode = hw_decode
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.running = True
+        self.seq = 0        # frames decoded so far; the newest is in slot (seq - 1) % ring
+        self.consumed = 0   # seq of the last frame handed out
+        self.frame_count = 0
+        self.counters = {"decoded": 0, "delivered": 0, "dropped": 0, "reconnects": 0, "failures": 0}
+        self.read_hist = Histogram()
+        self.age_hist = Histogram()
+        ring = max(2, ring)
+        self.stamps = [0.0] * ring
+
+        self.cap = self._open()
+        if self.cap is None:
+            raise ValueError(f"Failed to open video source: {url}")
+        first = None
+        if shape is None:
+            ret, first = self.cap.read()
+            if not ret:
+                self.cap.release()
+                raise ValueError(f"No frames from video source: {url}")
+            shape = first.shape
+        self.shape = tuple(shape)
+        self.ring = np.zeros((ring,) + self.shape, np.uint8)
+        if first is not None:
+            self._publish(first, time.monotonic())
+        self.thread = threading.Thread(target=self._decode, name="stream-decoder")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _open(self):
+        params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(self.timeout * 1000),
+                  cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(self.timeout * 1000)]
+        if self.hw_decode:
+            params += [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG, params)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        # Keep the backend's own queue as short as possible; the ring does the buffering
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _publish(self, frame, decoded_at):
+        slot = self.seq % len(self.ring)
+        target = self.ring[slot]
+        if frame.shape != self.shape:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=target)
+        elif frame is not target:
+            np.copyto(target, frame)
+        with self.cond:
+            self.stamps[slot] = decoded_at
+            self.seq += 1
+            self.cond.notify_all()
+        self.counters["decoded"] += 1
+
+    def _reconnect(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        delay = self.backoff_initial
+        attempts = 0
+        while not self.stop_event.is_set():
+            logger.warning(f"Stream {self.url} lost, reconnecting in {delay:.1f}s")
+            if self.stop_event.wait(delay):
+                return False
+            self.cap = self._open()
+            if self.cap is not None:
+                self.counters["reconnects"] += 1
+                return True
+            attempts += 1
+            if self.max_reconnects is not None and attempts >= self.max_reconnects:
+                logger.error(f"Stream {self.url} gave up after {attempts} reconnects")
+                return False
+            delay = min(delay * 2, self.backoff_max)
+        return False
+
+    def _decode(self):
+        while not self.stop_event.is_set():
+            # Decode straight into the slot after the newest one; the consumer
+            # only ever copies the newest, so the two never touch the same slot
+            slot = self.seq % len(self.ring)
+            start = time.perf_counter()
+            ret, frame = self.cap.read(self.ring[slot])
+            if not ret or frame is None:
+                self.counters["failures"] += 1
+                if not self._reconnect():
+                    break
+                continue
+            self.read_hist.observe(time.perf_counter() - start)
+            self._publish(frame, time.monotonic())
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def read_into(self, buf, timeout=None):
+        """
+        Copy the newest frame into `buf`, waiting for one newer than the last read.
+
+        Returns:
+            bool: False once the reader is released or reconnecting has given up.
+        """
+        with self.cond:
+            while self.running and self.seq == self.consumed:
+                if not self.cond.wait(timeout):
+                    return False
+            if self.seq == self.consumed:
+                return False
+            slot = (self.seq - 1) % len(self.ring)
+            np.copyto(buf, self.ring[slot])
+            self.counters["dropped"] += self.seq - self.consumed - 1
+            self.consumed = self.seq
+            self.age_hist.observe(time.monotonic() - self.stamps[slot])
+        self.counters["delivered"] += 1
+        self.frame_count += 1
+        return True
+
+    def read(self):
+        buf = np.empty(self.shape, np.uint8)
+        return buf if self.read_into(buf) else None
+
+    def stats(self):
+        """
+        Frame counters plus latency percentiles.
+
+        "read" is the time spent in the backend's read (waiting for the
+        network plus decoding), "age" the time from a frame being decoded
+        to it being handed to the consumer.
+        """
+        out = dict(self.counters)
+        out["read"] = self.read_hist.summary()
+        out["age"] = self.age_hist.summary()
+        return out
+
+    def release(self):
+        self.stop_event.set()
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout=self.timeout + 1)
+        if self.cap is not None:
+            self.cap.release()
+        logger.debug("StreamReader released")
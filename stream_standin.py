@@ -0,0 +1,180 @@
+##Minimal local MJPEG-over-HTTP camera stand-in for exercising network stream ingest
+import argparse
+import collections
+import logging
+import socket
+import threading
+import time
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = b"frame"
+# Frame index stamped into the top-left corner: STAMP_BITS blocks of
+# STAMP_BLOCK x STAMP_BLOCK pixels, black or white, which survive JPEG
+STAMP_BITS = 24
+STAMP_BLOCK = 8
+
+
+def stamp_index(frame, index):
+    """Write `index` into the top-left corner of `frame` (in place)."""
+    for bit in range(STAMP_BITS):
+        x = bit * STAMP_BLOCK
+        frame[:STAMP_BLOCK, x:x + STAMP_BLOCK] = 255 if (index >> bit) & 1 else 0
+    return frame
+
+
+def read_stamp(frame):
+    """Frame index written by `stamp_index`."""
+    centre = STAMP_BLOCK // 2
+    row = frame[centre, centre:STAMP_BITS * STAMP_BLOCK:STAMP_BLOCK]
+    if row.ndim > 1:
+        row = row.mean(axis=1)
+    bits = row > 127
+    return int(np.dot(bits, 1 << np.arange(STAMP_BITS)))
+
+
+class StandInCamera:
+    """
+    Serves a video file as an endless `multipart/x-mixed-replace` MJPEG stream.
+
+    Frames are paced at `fps` from one shared clock, as a live camera would.
+    Every client is sent every frame; one that reads too slowly falls behind
+    (up to `backlog` frames plus whatever the socket buffers hold) instead
+    of slowing the source down. With `stamp`, every frame carries its index
+    (`stamp_index`) so a client can tell how stale the frame it processes
+    is. `drop_clients()` cuts every connection to exercise reconnects;
+    `stop()`/`start()` take the camera offline and back.
+    """
+
+    def __init__(self, video="test2.mp4", host="127.0.0.1", port=0, fps=None, quality=80, stamp=True,
+                 backlog=64):
+        cap = cv2.VideoCapture(video)
+        if not cap.isOpened():
+            raise ValueError(f"Failed to open video source: {video}")
+        self.fps = fps or cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frames = []
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            self.frames.append(frame)
+        cap.release()
+        self.host = host
+        self.port = port
+        self.quality = quality
+        self.stamp = stamp
+        self.lock = threading.Condition()
+        self.index = -1
+        self.recent = collections.deque(maxlen=backlog)  # (index, jpeg)
+        self.sock = None
+        self.clients = []
+        self.connections = 0
+        self.running = False
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/video"
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.port = self.sock.getsockname()[1]
+        self.sock.listen(8)
+        self.running = True
+        threading.Thread(target=self._produce, daemon=True).start()
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def drop_clients(self):
+        """Close every client connection; the camera keeps serving new ones."""
+        with self.lock:
+            clients, self.clients = self.clients, []
+        for conn in clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except OSError:
+                pass
+
+    def stop(self):
+        self.running = False
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.drop_clients()
+        with self.lock:
+            self.lock.notify_all()
+
+    def _produce(self):
+        # One encoder for all clients, paced on the wall clock
+        start = time.monotonic()
+        index = 0
+        while self.running:
+            frame = self.frames[index % len(self.frames)].copy()
+            if self.stamp:
+                stamp_index(frame, index)
+            ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            with self.lock:
+                self.index = index
+                self.recent.append((index, jpeg.tobytes()))
+                self.lock.notify_all()
+            index += 1
+            delay = start + index / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _accept(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            with self.lock:
+                self.clients.append(conn)
+                self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            conn.recv(4096)  # the request itself is not inspected
+            conn.sendall(b"HTTP/1.0 200 OK\r\nCache-Control: no-cache\r\n"
+                         b"Content-Type: multipart/x-mixed-replace; boundary=" + BOUNDARY + b"\r\n\r\n")
+            # Start live, then send every frame in order while the backlog lasts
+            with self.lock:
+                sent = self.index - 1
+            while self.running:
+                with self.lock:
+                    while self.running and (not self.recent or self.index <= sent):
+                        self.lock.wait(1.0)
+                    if not self.running:
+                        break
+                    oldest = self.recent[0][0]
+                    sent, jpeg = self.recent[max(sent + 1, oldest) - oldest]
+                conn.sendall(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                             + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a video file as a local MJPEG camera stream")
+    parser.add_argument("video", nargs="?", default="test2.mp4")
+    parser.add_argument("-p", "--port", type=int, default=8080)
+    parser.add_argument("--fps", type=float, default=None, help="Frame rate (default: the video's)")
+    args = parser.parse_args()
+    camera = StandInCamera(args.video, port=args.port, fps=args.fps).start()
+    print(f"Stand-in camera streaming {args.video} on {camera.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        camera.stop()
+
+
+if __name__ == "__main__":
+    main()
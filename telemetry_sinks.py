@@ -0,0 +1,296 @@
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Sinks open_sink() builds from a spec string:
+#   mqtt                - ThingsBoard over MQTT (postTelemetry_mqtt_tb.TelemetryPublisher)
+#   file:<path>         - newline-delimited JSON, one {"ts": ..., "values": {...}} line per batch
+#   udp:<host>[:<port>] - statsd gauges, one datagram per batch (port 8125 by default)
+#   null                - batches are discarded: pipeline throughput without telemetry I/O
+SINKS = ("mqtt", "file", "udp", "null")
+
+
+class BatchingSink:
+    """
+    Base class of the telemetry sinks, with non-blocking batched publishing.
+
+    `publish()` only enqueues into a bounded in-memory queue and never does
+    I/O. A background thread drains the queue, coalesces keys (latest value
+    per key wins) and hands one batch per flush interval to `send()`, which
+    subclasses implement. A batch that fails to send is kept and merged into
+    the next one. `stats()` reports the counters, the backlog and the latency
+    of `send()`, so every sink can be compared on the same terms.
+    """
+
+    thread_name = "telemetry-sink"
+
+    def __init__(self, flush_interval=1.0, max_queue=256):
+        """
+        Args:
+            flush_interval (float): Seconds between batches (default: 1.0).
+            max_queue (int): Queue bound; updates beyond it are dropped and counted (default: 256).
+        """
+        self.flush_interval = flush_interval
+        self.q = queue.Queue(maxsize=max_queue)
+        self.pending = {}
+        self.pending_ts = None  # Unix time of the newest update in `pending`
+        self.lock = threading.Lock()
+        self.counters = {"queued": 0, "dropped": 0, "sent": 0, "payloads": 0, "failed": 0}
+        self.publish_hist = Histogram()
+        self.running = False
+        self.thread = None
+
+    def send(self, payload):
+        """
+        Deliver one coalesced batch; runs on the sender thread.
+
+        Returns:
+            bool: True if the batch was delivered.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release the sink's connection or file; called after the last flush."""
+
+    def start(self):
+        """Start the background sender thread."""
+        if self.thread is not None:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._sender, name=self.thread_name)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def publish(self, key, value):
+        """
+        Queue one telemetry key without blocking.
+
+        Returns:
+            bool: True if queued, False if the queue was full and the update was dropped.
+        """
+        try:
+            self.q.put_nowait((key, value, time.time()))
+        except queue.Full:
+            with self.lock:
+                self.counters["dropped"] += 1
+            return False
+        with self.lock:
+            self.counters["queued"] += 1
+        return True
+
+    def publish_many(self, values):
+        """Queue every key of a dict; returns True if none were dropped."""
+        ok = True
+        for key, value in values.items():
+            ok = self.publish(key, value) and ok
+        return ok
+
+    def send_telemetry(self, server_IP, port, token, key, value, retries=None, retry_delay=None):
+        """Drop-in for MQTTThingsBoardClient.send_telemetry that only enqueues."""
+        return self.publish(key, value)
+
+    def stats(self):
+        """Snapshot of the counters, queue and batch depth, and send() latency."""
+        with self.lock:
+            snapshot = dict(self.counters)
+        snapshot["backlog"] = self.q.qsize()
+        snapshot["pending_keys"] = len(self.pending)
+        snapshot["publish"] = self.publish_hist.summary()
+        return snapshot
+
+    def _send(self, payload):
+        start = time.perf_counter()
+        try:
+            ok = self.send(payload)
+        except Exception as e:
+            logger.error(f"Telemetry publish failed: {str(e)}")
+            ok = False
+        self.publish_hist.observe(time.perf_counter() - start)
+        with self.lock:
+            if ok:
+                self.counters["sent"] += len(payload)
+                self.counters["payloads"] += 1
+            else:
+                self.counters["failed"] += 1
+        return ok
+
+    def _drain(self, timeout):
+        try:
+            key, value, self.pending_ts = self.q.get(timeout=timeout)
+        except queue.Empty:
+            return
+        self.pending[key] = value
+        while True:
+            try:
+                key, value, self.pending_ts = self.q.get_nowait()
+            except queue.Empty:
+                return
+            self.pending[key] = value
+
+    def _flush(self):
+        if not self.pending:
+            return False
+        ok = self._send(self.pending)
+        if ok:
+            self.pending = {}
+        return ok
+
+    def _sender(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while self.running:
+            self._drain(max(0.0, next_flush - time.monotonic()))
+            if time.monotonic() >= next_flush:
+                self._flush()
+                next_flush = time.monotonic() + self.flush_interval
+
+    def stop(self, flush=True):
+        """Stop the sender thread, optionally flushing what is still queued."""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if flush:
+            self._drain(0)
+            self._flush()
+
+    def disconnect(self):
+        """Stop the sink and release what it holds open."""
+        self.stop()
+        self.close()
+
+
+class NullSink(BatchingSink):
+    """Batches everything and then discards it."""
+
+    thread_name = "telemetry-null"
+
+    def send(self, payload):
+        return True
+
+
+class FileSink(BatchingSink):
+    """
+    Appends every batch as one ThingsBoard-style JSON line to a file.
+
+    Lines are `{"ts": <ms since epoch>, "values": {...}}`, the record format
+    the spool replays, and are flushed to the OS after every batch so the
+    file can be tailed while the counter runs.
+    """
+
+    thread_name = "telemetry-file"
+
+    def __init__(self, path="telemetry.ndjson", **kwargs):
+        """
+        Args:
+            path (str): File to append to; created if missing.
+            **kwargs: BatchingSink options.
+        """
+        super().__init__(**kwargs)
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+
+    def send(self, payload):
+        self.file.write(json.dumps({"ts": int(time.time() * 1000), "values": payload}) + "\n")
+        self.file.flush()
+        return True
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class StatsdSink(BatchingSink):
+    """
+    Sends every batch as statsd gauges (`<prefix><key>:<value>|g`) over UDP.
+
+    Lines are packed into as few datagrams as fit `max_datagram` bytes, so a
+    batch usually costs one sendto(). Non-numeric values are skipped, and a
+    negative gauge is first reset to 0, because statsd reads a leading minus
+    sign as a decrement.
+    """
+
+    thread_name = "telemetry-statsd"
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="people_counter.", max_datagram=1432, **kwargs):
+        """
+        Args:
+            host (str): statsd host (default: '127.0.0.1').
+            port (int): statsd UDP port (default: 8125).
+            prefix (str): Prepended to every key (default: 'people_counter.').
+            max_datagram (int): Largest datagram in bytes (default: 1432, fits a 1500 MTU).
+            **kwargs: BatchingSink options.
+        """
+        super().__init__(**kwargs)
+        self.address = (host, port)
+        self.prefix = prefix
+        self.max_datagram = max_datagram
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def lines(self, payload):
+        for key, value in payload.items():
+            if isinstance(value, bool):
+                value = int(value)
+            elif not isinstance(value, (int, float)):
+                continue
+            if value < 0:
+                yield f"{self.prefix}{key}:0|g".encode()
+            yield f"{self.prefix}{key}:{value}|g".encode()
+
+    def send(self, payload):
+        packet = b""
+        for line in self.lines(payload):
+            if packet and len(packet) + 1 + len(line) > self.max_datagram:
+                self.sock.sendto(packet, self.address)
+                packet = b""
+            packet = packet + b"\n" + line if packet else line
+        if packet:
+            self.sock.sendto(packet, self.address)
+        return True
+
+    def close(self):
+        self.sock.close()
+
+
+def open_sink(spec, server_IP="", port=0, token="", spool=None, replay_rate=20.0, **kwargs):
+    """
+    Build (but do not start) the sink described by `spec`.
+
+    Args:
+        spec (str): One of 'mqtt', 'file:<path>', 'udp:<host>[:<port>]' or 'null'.
+        server_IP (str): ThingsBoard server, for 'mqtt'.
+        port (int): ThingsBoard MQTT port, for 'mqtt'.
+        token (str): Device access token, for 'mqtt'.
+        spool (TelemetrySpool): Offline store-and-forward buffer, for 'mqtt'.
+        replay_rate (float): Max spooled records replayed per second, for 'mqtt'.
+        **kwargs: BatchingSink options (flush_interval, max_queue).
+
+    Raises:
+        ValueError: For an unknown spec, a bad 'udp' port, or 'mqtt' without server, port and token.
+    """
+    kind, _, rest = spec.partition(":")
+    if kind != "mqtt" and spool is not None:
+        logger.warning(f"Telemetry spool only applies to the mqtt sink, not {kind}")
+    if kind == "mqtt":
+        if not server_IP or not port or not token:
+            raise ValueError("the mqtt sink requires --server-IP, --Port and --token")
+        # Imported here so the other sinks work without paho-mqtt
+        from postTelemetry_mqtt_tb import MQTTThingsBoardClient, TelemetryPublisher
+        return TelemetryPublisher(server_IP, port, token, client=MQTTThingsBoardClient(spool=spool),
+                                  replay_rate=replay_rate, **kwargs)
+    if kind == "file":
+        return FileSink(rest or "telemetry.ndjson", **kwargs)
+    if kind == "udp":
+        host, sep, udp_port = rest.partition(":")
+        if sep and not udp_port.isdigit():
+            raise ValueError(f"Bad statsd port in telemetry sink: {spec} (expected udp:<host>[:<port>])")
+        return StatsdSink(host or "127.0.0.1", int(udp_port) if sep else 8125, **kwargs)
+    if kind == "null":
+        return NullSink(**kwargs)
+    raise ValueError(f"Unknown telemetry sink: {spec} (expected one of {', '.join(SINKS)})")
@@ -0,0 +1,84 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetrySpool:
+    """
+    Persistent store-and-forward buffer for telemetry that could not be sent.
+
+    Records are timestamped `{key: value}` dicts kept in a SQLite database in
+    WAL mode, so appends survive power loss without rewriting the file. The
+    spool is bounded to `max_rows` records; when full, the oldest records are
+    evicted first. `batch()` returns records already shaped as ThingsBoard
+    `{"ts": ..., "values": {...}}` entries for bulk replay.
+    """
+
+    def __init__(self, path="telemetry_spool.db", max_rows=100000):
+        """
+        Args:
+            path (str): SQLite database file (':memory:' for a volatile spool).
+            max_rows (int): Maximum number of spooled records (default: 100000).
+        """
+        self.path = path
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.evicted = 0
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS telemetry ("
+                        "id INTEGER PRIMARY KEY AUTOINCREMENT, ts INTEGER NOT NULL, values_json TEXT NOT NULL)")
+        self.rows = self.db.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0]
+
+    def append(self, values, ts=None):
+        """
+        Spool one telemetry record.
+
+        Args:
+            values (dict): Telemetry keys/values.
+            ts (int): Unix time in milliseconds; defaults to now.
+        """
+        if ts is None:
+            ts = int(time.time() * 1000)
+        with self.lock:
+            self.db.execute("INSERT INTO telemetry (ts, values_json) VALUES (?, ?)", (ts, json.dumps(values)))
+            self.rows += 1
+            if self.rows > self.max_rows:
+                excess = self.rows - self.max_rows
+                self.db.execute("DELETE FROM telemetry WHERE id IN "
+                                "(SELECT id FROM telemetry ORDER BY id LIMIT ?)", (excess,))
+                self.rows -= excess
+                self.evicted += excess
+
+    def batch(self, limit):
+        """
+        Oldest spooled records, without removing them.
+
+        Returns:
+            tuple: (last_id, records) where records is a list of ThingsBoard
+            `{"ts": ..., "values": {...}}` dicts; last_id is None if empty.
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT id, ts, values_json FROM telemetry ORDER BY id LIMIT ?",
+                                   (limit,)).fetchall()
+        if not rows:
+            return None, []
+        return rows[-1][0], [{"ts": ts, "values": json.loads(values)} for _, ts, values in rows]
+
+    def ack(self, last_id):
+        """Remove every record up to and including `last_id` once it has been delivered."""
+        with self.lock:
+            deleted = self.db.execute("DELETE FROM telemetry WHERE id <= ?", (last_id,)).rowcount
+            self.rows -= deleted
+
+    def __len__(self):
+        return self.rows
+
+    def close(self):
+        with self.lock:
+            self.db.close()
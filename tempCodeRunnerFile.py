@@ -1,2 +0,0 @@
-line_up = int(1*(h/6))
-line_down   = int(4*(h/6))
\ No newline at end of file
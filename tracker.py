@@ -1,50 +1,109 @@
-import math
+import numpy as np
+from tracking import HAVE_SCIPY, assign, compact, grow, hungarian_solver
 
 
 class Tracker:
-    def __init__(self):
-        # Store the center positions of the objects
-        self.center_points = {}
-        # Keep the count of the IDs
-        # each time a new object id detected, the count will increase by one
+    """
+    Box tracker for detector output, with track state held in NumPy arrays.
+
+    Each update matches all box centers against all live tracks at once
+    through one distance matrix. Only pairs closer than `max_distance` are
+    considered, and the closest pairs win one-to-one: greedy by distance,
+    or optimal (Hungarian) when scipy is available. A track that goes
+    unmatched for more than `max_missed` updates is dropped, so per-frame
+    cost and memory only depend on how many people are in view. The ids
+    dropped by the last update are in `expired`, so callers can forget
+    per-id state at the same time.
+    """
+
+    def __init__(self, max_distance=35, max_missed=0, hungarian=None, xyxy=False, capacity=32):
+        """
+        Args:
+            max_distance (float): Max center movement in pixels between updates (default: 35).
+            max_missed (int): Updates a track may go unmatched before it is dropped
+                (default: 0, only tracks matched in the last update survive).
+            hungarian (bool): Optimal instead of greedy assignment; default: if scipy is installed.
+            xyxy (bool): Boxes are (x1, y1, x2, y2) instead of (x, y, w, h).
+            capacity (int): Initial number of track slots; grows as needed.
+        """
+        if hungarian is None:
+            hungarian = HAVE_SCIPY
+        self.solver = hungarian_solver(hungarian)
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.hungarian = hungarian
+        self.xyxy = xyxy
         self.id_count = 0
+        self.n = 0
+        self.expired = []
+        self.ids = np.zeros(capacity, np.int64)
+        self.xy = np.zeros((capacity, 2), np.float64)
+        self.missed = np.zeros(capacity, np.int32)
+
+    def __len__(self):
+        return self.n
 
+    @property
+    def center_points(self):
+        """{id: (cx, cy)} of the live tracks."""
+        return {int(i): (int(x), int(y)) for i, (x, y) in zip(self.ids[:self.n], self.xy[:self.n])}
+
+    def _assign(self, centers):
+        """Return (detection_idx, track_idx) arrays of matched pairs."""
+        # Gate: Euclidean center movement below max_distance
+        diff = centers[:, None, :] - self.xy[None, :self.n, :]
+        cost = np.einsum("ijk,ijk->ij", diff, diff)
+        return assign(cost, cost < self.max_distance ** 2, self.solver)
 
     def update(self, objects_rect):
-        # Objects boxes and ids
-        objects_bbs_ids = []
-
-        # Get center point of new object
-        for rect in objects_rect:
-            x, y, w, h = rect
-            cx = (x + x + w) // 2
-            cy = (y + y + h) // 2
-
-            # Find out if that object was detected already
-            same_object_detected = False
-            for id, pt in self.center_points.items():
-                dist = math.hypot(cx - pt[0], cy - pt[1])
-
-                if dist < 35:
-                    self.center_points[id] = (cx, cy)
-#                    print(self.center_points)
-                    objects_bbs_ids.append([x, y, w, h, id])
-                    same_object_detected = True
-                    break
-
-            # New object is detected we assign the ID to that object
-            if same_object_detected is False:
-                self.center_points[self.id_count] = (cx, cy)
-                objects_bbs_ids.append([x, y, w, h, self.id_count])
-                self.id_count += 1
-
-        # Clean the dictionary by center points to remove IDS not used anymore
-        new_center_points = {}
-        for obj_bb_id in objects_bbs_ids:
-            _, _, _, _, object_id = obj_bb_id
-            center = self.center_points[object_id]
-            new_center_points[object_id] = center
-
-        # Update dictionary with IDs not used removed
-        self.center_points = new_center_points.copy()
-        return objects_bbs_ids
\ No newline at end of file
+        """
+        Associate one frame of boxes with the live tracks.
+
+        Args:
+            objects_rect (array-like): (N, 4) boxes, (x, y, w, h) or with xyxy (x1, y1, x2, y2).
+
+        Returns:
+            list: [a, b, c, d, id] per input box, in input order, with the box as given.
+        """
+        boxes = np.asarray(objects_rect, np.int64).reshape(-1, 4)
+        if self.xyxy:
+            centers = (boxes[:, :2] + boxes[:, 2:]) // 2
+        else:
+            centers = (2 * boxes[:, :2] + boxes[:, 2:]) // 2
+        centers = centers.astype(np.float64)
+
+        self.missed[:self.n] += 1
+        det, trk = self._assign(centers)
+        box_ids = np.zeros(len(boxes), np.int64)
+        if len(trk):
+            self.xy[trk] = centers[det]
+            self.missed[trk] = 0
+            box_ids[det] = self.ids[trk]
+
+        # New tracks for unmatched boxes
+        unmatched = np.ones(len(boxes), bool)
+        unmatched[det] = False
+        new = np.nonzero(unmatched)[0]
+        if len(new):
+            if self.n + len(new) > len(self.ids):
+                self.ids, self.xy, self.missed = grow((self.ids, self.xy, self.missed), self.n,
+                                                      max(2 * len(self.ids), self.n + len(new)))
+            sl = slice(self.n, self.n + len(new))
+            self.ids[sl] = np.arange(self.id_count, self.id_count + len(new))
+            self.xy[sl] = centers[new]
+            self.missed[sl] = 0
+            box_ids[new] = self.ids[sl]
+            self.id_count += len(new)
+            self.n += len(new)
+
+        self._expire()
+        return [box + [i] for box, i in zip(boxes.tolist(), box_ids.tolist())]
+
+    def _expire(self):
+        n = self.n
+        stale = self.missed[:n] > self.max_missed
+        if not stale.any():
+            self.expired = []
+            return
+        self.expired = self.ids[:n][stale].tolist()
+        self.n = compact((self.ids, self.xy, self.missed), n, stale)
@@ -0,0 +1,197 @@
+import importlib.util
+import numpy as np
+
+# scipy is optional (greedy assignment is used without it) and slow to import,
+# so it is only loaded by trackers that use Hungarian assignment
+HAVE_SCIPY = importlib.util.find_spec("scipy") is not None
+
+UP = 1
+DOWN = -1
+
+
+def hungarian_solver(hungarian):
+    """scipy's linear_sum_assignment if `hungarian`, else None (greedy); imports scipy only when asked."""
+    if not hungarian:
+        return None
+    if not HAVE_SCIPY:
+        raise ValueError("Hungarian assignment requires scipy")
+    from scipy.optimize import linear_sum_assignment
+    return linear_sum_assignment
+
+
+def assign(cost, gate, solver=None):
+    """
+    One-to-one matching of detections (rows) to tracks (columns).
+
+    Only pairs allowed by `gate` can match. With a `solver` the total cost
+    is minimised (Hungarian), otherwise the cheapest pairs win greedily.
+
+    Returns:
+        tuple: (detection_idx, track_idx) arrays of matched pairs.
+    """
+    if cost.size == 0:
+        empty = np.empty(0, np.intp)
+        return empty, empty
+    if solver is not None:
+        rows, cols = solver(np.where(gate, cost, 1e18))
+        keep = gate[rows, cols]
+        return rows[keep], cols[keep]
+    det, trk = np.nonzero(gate)
+    order = np.argsort(cost[det, trk], kind="stable")
+    used_det = np.zeros(cost.shape[0], bool)
+    used_trk = np.zeros(cost.shape[1], bool)
+    rows, cols = [], []
+    for d, t in zip(det[order], trk[order]):
+        if not used_det[d] and not used_trk[t]:
+            used_det[d] = used_trk[t] = True
+            rows.append(d)
+            cols.append(t)
+    return np.array(rows, np.intp), np.array(cols, np.intp)
+
+
+def grow(arrays, n, capacity):
+    """Copies of the per-track state `arrays` with room for `capacity` tracks, keeping the first `n`."""
+    out = []
+    for arr in arrays:
+        new = np.zeros((capacity,) + arr.shape[1:], arr.dtype)
+        new[:n] = arr[:n]
+        out.append(new)
+    return out
+
+
+def compact(arrays, n, drop):
+    """Remove the tracks flagged in `drop` (length n) from every state array in place; returns the new count."""
+    keep = np.nonzero(~drop)[0]
+    k = len(keep)
+    for arr in arrays:
+        arr[:k] = arr[keep]
+    return k
+
+
+class CentroidTracker:
+    """
+    Centroid tracker with all track state held in NumPy arrays.
+
+    Every frame, all detections are associated with all live tracks at once:
+    a detection may only claim a track whose last centroid lies within the
+    detection's own bounding-box width/height (the gate the old per-person
+    loop used), and among gated pairs the closest ones win. Assignment is
+    one-to-one, either greedy by distance or optimal (Hungarian) when scipy
+    is available. Crossing decisions use each track's previous and current y,
+    and tracks unmatched for more than `max_age` frames are removed in a
+    single compaction. Only in-band centroids are ever stored, so a track
+    that leaves the band simply stops being matched and ages out; its set
+    direction keeps it from being counted twice meanwhile.
+    """
+
+    def __init__(self, line_up, line_down, up_limit, down_limit, max_age=5, hungarian=False, capacity=32):
+        """
+        Args:
+            line_up (int): y of the "Out" line, crossed going up.
+            line_down (int): y of the "In" line, crossed going down.
+            up_limit (int): Top of the tracking band.
+            down_limit (int): Bottom of the tracking band (exclusive).
+            max_age (int): Frames a track may go unmatched before it is dropped (default: 5).
+            hungarian (bool): Use optimal assignment instead of greedy (requires scipy).
+            capacity (int): Initial number of track slots; grows as needed.
+        """
+        self.solver = hungarian_solver(hungarian)
+        self.set_lines(line_up, line_down, up_limit, down_limit)
+        self.max_age = max_age
+        self.hungarian = hungarian
+        self.next_id = 1
+        self.n = 0
+        self.ids = np.zeros(capacity, np.int32)
+        self.xy = np.zeros((capacity, 2), np.int32)
+        self.prev_y = np.zeros(capacity, np.int32)
+        self.direction = np.zeros(capacity, np.int8)
+        self.age = np.zeros(capacity, np.int32)
+
+    def set_lines(self, line_up, line_down, up_limit, down_limit):
+        self.line_up = line_up
+        self.line_down = line_down
+        self.up_limit = up_limit
+        self.down_limit = down_limit
+
+    @property
+    def state(self):
+        return self.ids, self.xy, self.prev_y, self.direction, self.age
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def tracks(self):
+        """(ids, centroids) of the live tracks, as views into the state arrays."""
+        return self.ids[:self.n], self.xy[:self.n]
+
+    def _assign(self, centroids, sizes):
+        """Return (detection_idx, track_idx) arrays of matched pairs."""
+        # Gate: the track's centroid lies within the detection's own width/height
+        diff = np.abs(centroids[:, None, :] - self.xy[None, :self.n, :])
+        gate = np.all(diff <= sizes[:, None, :], axis=2)
+        return assign(np.einsum("ijk,ijk->ij", diff, diff), gate, self.solver)
+
+    def update(self, centroids, sizes):
+        """
+        Associate one frame of detections and report line crossings.
+
+        Args:
+            centroids (array-like): (N, 2) detection centroids (cx, cy).
+            sizes (array-like): (N, 2) detection bounding-box (w, h), used as the gate.
+
+        Returns:
+            tuple: (track_ids, events). track_ids is an (N,) array with the track id
+            of each detection, or 0 for detections outside the tracking band.
+            events is a list of (track_id, direction, cx, cy) with direction UP or DOWN.
+        """
+        centroids = np.asarray(centroids, np.int32).reshape(-1, 2)
+        sizes = np.asarray(sizes, np.int32).reshape(-1, 2)
+        track_ids = np.zeros(len(centroids), np.int32)
+        in_band = np.nonzero((centroids[:, 1] >= self.up_limit) & (centroids[:, 1] < self.down_limit))[0]
+        band_centroids = centroids[in_band]
+
+        self.age[:self.n] += 1
+        det, trk = self._assign(band_centroids, sizes[in_band])
+
+        events = []
+        if len(trk):
+            new_y = band_centroids[det, 1]
+            self.prev_y[trk] = self.xy[trk, 1]
+            self.xy[trk] = band_centroids[det]
+            self.age[trk] = 0
+            track_ids[in_band[det]] = self.ids[trk]
+            fresh = self.direction[trk] == 0
+            up = fresh & (self.prev_y[trk] >= self.line_up) & (new_y < self.line_up)
+            down = fresh & (self.prev_y[trk] <= self.line_down) & (new_y > self.line_down)
+            self.direction[trk[up]] = UP
+            self.direction[trk[down]] = DOWN
+            for t in trk[up | down]:
+                events.append((int(self.ids[t]), int(self.direction[t]), int(self.xy[t, 0]), int(self.xy[t, 1])))
+
+        # New tracks for unmatched detections
+        unmatched = np.ones(len(band_centroids), bool)
+        unmatched[det] = False
+        new = np.nonzero(unmatched)[0]
+        if len(new):
+            if self.n + len(new) > len(self.ids):
+                self.ids, self.xy, self.prev_y, self.direction, self.age = \
+                    grow(self.state, self.n, max(2 * len(self.ids), self.n + len(new)))
+            sl = slice(self.n, self.n + len(new))
+            self.ids[sl] = np.arange(self.next_id, self.next_id + len(new))
+            self.xy[sl] = band_centroids[new]
+            self.prev_y[sl] = band_centroids[new, 1]
+            self.direction[sl] = 0
+            self.age[sl] = 0
+            track_ids[in_band[new]] = self.ids[sl]
+            self.next_id += len(new)
+            self.n += len(new)
+
+        self._expire()
+        return track_ids, events
+
+    def _expire(self):
+        n = self.n
+        stale = self.age[:n] > self.max_age
+        if stale.any():
+            self.n = compact(self.state, n, stale)